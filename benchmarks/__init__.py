@@ -0,0 +1,15 @@
+"""
+Name:        benchmarks
+
+Author:      Nezar Abdennur <nabdennur@gmail.com>
+Created:     17/10/2026
+Copyright:   (c) Nezar Abdennur 2012
+
+Throughput benchmarks for the simulators, built from the example models.
+Run from the top-level directory of the distribution:
+
+    python -m benchmarks --help
+
+"""
+from benchmarks.workloads import WORKLOADS, Workload
+from benchmarks.runner import run_workload, run_suite, save_results, load_results, compare_results
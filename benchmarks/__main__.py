@@ -0,0 +1,81 @@
+"""
+Name:        __main__
+
+Author:      Nezar Abdennur <nabdennur@gmail.com>
+Created:     17/10/2026
+Copyright:   (c) Nezar Abdennur 2012
+
+Usage:
+    python -m benchmarks [workload ...] [--scale S] [--timetable T] [--save FILE] [--compare FILE]
+
+"""
+from benchmarks.workloads import WORKLOADS
+from benchmarks.runner import run_suite, save_results, load_results, compare_results
+import cps.misc
+
+import argparse
+import sys
+
+def _format_result(result):
+    simulator = result['simulator']
+    if 'timetable' in result:
+        simulator += '/' + result['timetable']
+    line = '%-15s %-20s %9.3fs' % (result['workload'], simulator, result['time'])
+    if 'events_per_sec' in result:
+        line += ' %12.0f events/s' % result['events_per_sec']
+    if 'peak_memory' in result:
+        line += ' %9.1f MB' % (result['peak_memory']/1e6)
+    if 'subsystems' in result:
+        top = sorted(result['subsystems'].items(), key=lambda x: -x[1])[:4]
+        line += '  ' + ', '.join(['%s %.0f%%' % (name, 100*f) for name, f in top])
+    return line
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+        description='Measure simulator throughput on canonical workloads.')
+    parser.add_argument('workloads', nargs='*', metavar='workload',
+        help='workloads to run: %s (default: all)' % ', '.join(WORKLOADS))
+    parser.add_argument('--simulator', action='append', dest='simulators',
+        help='only run this simulator type (may be repeated)')
+    parser.add_argument('--timetable', action='append', dest='timetables',
+        help='run FMSimulator with this global timetable type from cps.misc, e.g. '
+             'IndexedPriorityQueue, ArrayPriorityQueue or CalendarQueue (may be repeated)')
+    parser.add_argument('--scale', type=float, default=1, help='agent count multiplier')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs')
+    parser.add_argument('--no-profile', dest='profile', action='store_false',
+        help='skip event counting and per-subsystem timing')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+        help='skip peak memory measurement')
+    parser.add_argument('--save', metavar='FILE', help='write the results to a JSON file')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results to a baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+        help='relative change in a metric counted as a regression')
+    args = parser.parse_args(argv)
+    for name in args.workloads:
+        if name not in WORKLOADS:
+            parser.error('unknown workload: %s' % name)
+    for name in args.timetables or ():
+        if not hasattr(cps.misc, name):
+            parser.error('unknown timetable: %s' % name)
+
+    workloads = [WORKLOADS[name] for name in (args.workloads or WORKLOADS)]
+    document = run_suite(workloads, args.scale, args.seed, args.repeat, args.profile, args.memory,
+                         args.simulators, callback=lambda result: print(_format_result(result)),
+                         timetables=args.timetables)
+    if args.save:
+        save_results(args.save, document)
+
+    if args.compare:
+        comparison = compare_results(document, load_results(args.compare), args.tolerance)
+        regressions = [row for row in comparison if row[-1]]
+        print()
+        for key, metric, old, new, change, regressed in comparison:
+            print('%-36s %-15s %14.4g -> %-14.4g %+7.1f%%%s' % (key, metric, old, new, 100*change,
+                  '  REGRESSION' if regressed else ''))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+Name:        runner
+
+Author:      Nezar Abdennur <nabdennur@gmail.com>
+Created:     17/10/2026
+Copyright:   (c) Nezar Abdennur 2012
+
+"""
+import cps
+import cps.misc
+import cps.simulator
+
+import cProfile
+import datetime
+import json
+import os
+import platform
+import pstats
+import random
+import sysconfig
+import time
+import tracemalloc
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CPS_PATH = os.path.dirname(os.path.abspath(cps.__file__))
+STDLIB_PATH = sysconfig.get_paths()['stdlib']
+
+# metric -> +1 if higher is better, -1 if lower is better
+METRICS = {'events_per_sec': 1, 'time': -1, 'peak_memory': -1}
+
+#-------------------------------------------------------------------------------
+# Measurements
+
+def _seed(seed):
+    random.seed(seed)
+    if numpy is not None:
+        numpy.random.seed(seed)
+
+def _simulate(workload, SimulatorType, scale, seed, TimetableType=None):
+    _seed(seed)
+    model = workload.build(scale)
+    if TimetableType is not None:
+        model.TimetableType = TimetableType
+    sim = SimulatorType(model, 0)
+    sim.runSimulation(workload.tstop)
+    return sim
+
+def _subsystem(filename):
+    """
+    Classify a profiled function by where it is defined.
+
+    """
+    if filename == '~' or filename.startswith('<'):
+        return 'builtins'
+    filename = os.path.abspath(filename)
+    if filename.startswith(CPS_PATH):
+        return 'cps.' + os.path.splitext(os.path.basename(filename))[0]
+    elif filename.startswith(STDLIB_PATH) and 'site-packages' not in filename:
+        return 'stdlib'
+    elif 'site-packages' in filename:
+        return 'third-party'
+    else:
+        return 'model'
+
+def _profile(workload, SimulatorType, scale, seed, TimetableType=None):
+    """
+    Run the workload under cProfile. Return the number of channel firings and
+    the total time spent in each subsystem.
+
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    _simulate(workload, SimulatorType, scale, seed, TimetableType)
+    profiler.disable()
+    stats = pstats.Stats(profiler).stats
+    events = 0
+    subsystems = {}
+    for (filename, lineno, funcname), (cc, nc, tt, ct, callers) in stats.items():
+        if funcname == 'fireEvent':
+            events += nc
+        name = _subsystem(filename)
+        subsystems[name] = subsystems.get(name, 0.0) + tt
+    return events, subsystems
+
+def _peak_memory(workload, SimulatorType, scale, seed, TimetableType=None):
+    """
+    Run the workload under tracemalloc. Return the peak size of the memory
+    blocks allocated during the run, in bytes.
+
+    """
+    tracemalloc.start()
+    try:
+        _simulate(workload, SimulatorType, scale, seed, TimetableType)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def run_workload(workload, SimulatorType, scale=1, seed=0, repeat=3, profile=True, memory=True, TimetableType=None):
+    """
+    Benchmark a workload under one simulator type. Each measurement uses a
+    separate run with the same seed: the timed runs are not instrumented.
+
+    Arguments:
+        workload (benchmarks.workloads.Workload)
+        SimulatorType (class or name of a simulator class in cps.simulator)
+    Optional:
+        scale (default=1): agent count multiplier
+        seed (default=0)
+        repeat (default=3): number of timed runs, the fastest one is kept
+        profile (default=True): count events and time the subsystems
+        memory (default=True): measure the peak memory of a run
+        TimetableType (class or name of a timetable class in cps.misc): global
+            timetable of FMSimulator (default: the model's own)
+
+    Returns a dict with:
+        time           (float): wall time of the fastest run, in seconds
+        num_agents, nbirths, ndeaths (int): final counts of the last run
+        events         (int): number of channel firings
+        events_per_sec (float)
+        subsystems     (dict: name -> fraction of the profiled time)
+        peak_memory    (int): in bytes
+
+    """
+    if isinstance(SimulatorType, str):
+        SimulatorType = getattr(cps.simulator, SimulatorType)
+    if isinstance(TimetableType, str):
+        TimetableType = getattr(cps.misc, TimetableType)
+    result = {'workload':workload.name, 'simulator':SimulatorType.__name__,
+              'scale':scale, 'seed':seed, 'tstop':workload.tstop}
+    if TimetableType is not None:
+        result['timetable'] = TimetableType.__name__
+    times = []
+    for i in range(max(repeat, 1)):
+        t0 = time.perf_counter()
+        sim = _simulate(workload, SimulatorType, scale, seed, TimetableType)
+        times.append(time.perf_counter() - t0)
+    result['time'] = min(times)
+    result['num_agents'] = sim.num_agents
+    result['nbirths'] = sim.nbirths
+    result['ndeaths'] = sim.ndeaths
+    if profile:
+        events, subsystems = _profile(workload, SimulatorType, scale, seed, TimetableType)
+        total = sum(subsystems.values()) or 1.0
+        result['events'] = events
+        result['events_per_sec'] = events/result['time']
+        result['subsystems'] = dict([(name, t/total) for name, t in subsystems.items()])
+    if memory:
+        result['peak_memory'] = _peak_memory(workload, SimulatorType, scale, seed, TimetableType)
+    return result
+
+def run_suite(workloads, scale=1, seed=0, repeat=3, profile=True, memory=True, simulators=None, callback=None,
+              timetables=None):
+    """
+    Benchmark each workload under each of its simulator types. Returns a
+    results document (see save_results()).
+
+    Optional:
+        simulators (list-of-string): only run these simulator types
+        callback (callable): called with each result as soon as it is ready
+        timetables (list-of-string): run FMSimulator once with each of these
+            timetable types; their results are keyed workload/simulator/timetable
+
+    """
+    results = {}
+    for workload in workloads:
+        for name in workload.simulators:
+            if simulators and name not in simulators:
+                continue
+            if timetables and name == 'FMSimulator':
+                variants = [(timetable, '/' + timetable) for timetable in timetables]
+            else:
+                variants = [(None, '')]
+            for timetable, suffix in variants:
+                result = run_workload(workload, name, scale, seed, repeat, profile, memory, timetable)
+                results[workload.name + '/' + name + suffix] = result
+                if callback is not None:
+                    callback(result)
+    meta = {'date':datetime.datetime.now().isoformat(),
+            'python':platform.python_version(),
+            'implementation':platform.python_implementation(),
+            'platform':platform.platform(),
+            'machine':platform.machine(),
+            'cps':cps.__version__,
+            'scale':scale,
+            'seed':seed,
+            'repeat':repeat}
+    return {'meta':meta, 'results':results}
+
+
+#-------------------------------------------------------------------------------
+# Baselines
+
+def save_results(filename, document):
+    """
+    Write a results document to a JSON file, e.g. to keep as a baseline.
+
+    """
+    with open(filename, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+def load_results(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+def compare_results(document, baseline, tolerance=0.1):
+    """
+    Compare a results document to a baseline. Returns a list of
+    (key, metric, baseline value, new value, relative change, regressed)
+    tuples, one per metric present in both. A metric has regressed if it got
+    worse by more than the tolerance (a fraction of the baseline value).
+
+    Timings are only comparable between results obtained on the same machine.
+
+    """
+    comparison = []
+    for key, result in sorted(document['results'].items()):
+        old = baseline['results'].get(key)
+        if old is None:
+            continue
+        for metric, sign in sorted(METRICS.items()):
+            if metric not in result or metric not in old or not old[metric]:
+                continue
+            change = (result[metric] - old[metric])/float(old[metric])
+            regressed = sign*change < -tolerance
+            comparison.append((key, metric, old[metric], result[metric], change, regressed))
+    return comparison
@@ -0,0 +1,103 @@
+"""
+Name:        workloads
+
+Author:      Nezar Abdennur <nabdennur@gmail.com>
+Created:     17/10/2026
+Copyright:   (c) Nezar Abdennur 2012
+
+"""
+import collections
+import importlib
+import math
+import os
+import random
+import sys
+
+EXAMPLES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+
+#-------------------------------------------------------------------------------
+# Canonical workloads. Each one builds a fresh model from one of the example
+# models with its agent counts multiplied by a scale factor.
+#
+#   name       (string)
+#   build      (callable): build(scale) returns a cps.model.Model
+#   tstop      (float): terminal time of the simulation run
+#   simulators (tuple-of-string): names of the simulator types to run it under
+
+Workload = collections.namedtuple('Workload', 'name build tstop simulators')
+
+def _example(name):
+    # import a fresh copy of an example module so that its channels and
+    # recorders start out clean
+    if EXAMPLES_PATH not in sys.path:
+        sys.path.insert(0, EXAMPLES_PATH)
+    if name in sys.modules:
+        return importlib.reload(sys.modules[name])
+    return importlib.import_module(name)
+
+def build_poisson(scale=1):
+    model = _example('model_poisson').model
+    model.n0 = int(50*scale)
+    model.nmax = int(500*scale)
+    return model
+
+def build_svd(scale=1):
+    model = _example('model_svd').model
+    model.n0 = model.nmax = int(100*scale)
+    return model
+
+def build_svd_ode(scale=1):
+    model = _example('model_svd_ode').model
+    model.n0 = model.nmax = int(100*scale)
+    return model
+
+def build_competition(scale=1):
+    model = _example('model_competition').model
+    model.n0 = model.nmax = int(100*scale)
+    return model
+
+def build_competition_ode(scale=1):
+    model = _example('model_competition_ode').model
+    model.n0 = model.nmax = int(100*scale)
+    return model
+
+def build_stress(scale=1):
+    from cps import Model, Recorder, RecordingChannel
+    stress = _example('model_stress')
+    ncrit = int(200*scale)
+    tau = 1.338
+    model = Model(n0=ncrit, nmax=ncrit)
+    recorder = Recorder(['stress'], ['alive','x','y','capacity'])
+    model.addRecorder(recorder)
+    def initialize(gdata, cells):
+        gdata.stress = False
+        gdata.Kw = 2
+        gdata.nw = 100
+        gdata.fmax = 1
+        gdata.fmin = -1
+        for cell in cells:
+            cell.alive = True
+            cell.x = math.sqrt(0.5*10*0.1)*random.normalvariate(0,1)
+            cell.y = math.exp(cell.x)
+            cell.capacity = math.exp(random.uniform(0,math.log(2.0)))
+    model.addInitializer(['stress', 'Kw', 'nw'], ['alive', 'capacity', 'x', 'y'], initialize)
+    rc = RecordingChannel(tstep=0.1, recorder=recorder)
+    sc = stress.StressChannel(switch_times=[5])
+    pc = stress.OUProteinChannel(tstep=0.015, tau=tau, c=1/tau)
+    dc = stress.DivDeathChannel()
+    model.addWorldChannel(channel=rc)
+    model.addWorldChannel(channel=sc, ac_dependents=[pc,dc])
+    model.addAgentChannel(channel=pc, ac_dependents=[dc], sync=False)
+    model.addAgentChannel(channel=dc, ac_dependents=[pc])
+    return model
+
+WORKLOADS = collections.OrderedDict([
+    ('poisson', Workload('poisson', build_poisson, 1000, ('FMSimulator', 'AMSimulator'))),
+    ('stress', Workload('stress', build_stress, 8, ('FMSimulator', 'AMSimulator'))),
+    ('svd', Workload('svd', build_svd, 1000, ('FMSimulator', 'AMSimulator'))),
+    ('svd_ode', Workload('svd_ode', build_svd_ode, 1000, ('FMSimulator', 'AMSimulator'))),
+    # NOTE: the competition models schedule events in the past under
+    #       AMSimulator
+    ('competition', Workload('competition', build_competition, 5, ('FMSimulator',))),
+    ('competition_ode', Workload('competition_ode', build_competition_ode, 5, ('FMSimulator',))),
+])
@@ -29,20 +29,27 @@ www.sysbiolab.uottawa.ca
 
 # Required
 from cps.channel import AgentChannel, WorldChannel
-from cps.logging import Recorder
+from cps.logging import Recorder, HDFRecorder, SummaryRecorder
 from cps.model import Model
-from cps.simulator import FMSimulator, AMSimulator
+from cps.simulator import FMSimulator, AMSimulator, ParallelAMSimulator, OpenLoopAMSimulator
+
+# Replicate ensembles
+from cps.ensemble import run_ensemble, iter_ensemble
+
+# Checkpoints
+from cps.checkpoint import save_checkpoint, load_checkpoint
 
 # Channels
-from cps.channel import RecordingChannel
+from cps.channel import RecordingChannel, ObserverChannel, VectorAgentChannel
+from cps.ode import ODEChannel
 
 # Exception handling
 from cps.exception import SimulationError, SchedulingError, ZeroPopulationError
 
 # Functions for saving recorder and logger data to file
-from cps.save import savemat_snapshot, savemat_lineage
+from cps.save import savemat_snapshot, savemat_lineage, savemat_trajectory
 try:
-    from cps.save import savehdf_snapshot, savehdf_lineage
+    from cps.save import savehdf_snapshot, savehdf_lineage, savehdf_trajectory
 except ImportError:
     pass
 
@@ -12,9 +12,25 @@ class SimulationChannel(object):
     Simulation channels are the principal abstraction of this framework.
     Subclasses must implement scheduleEvent() and fireEvent().
 
+    A channel may declare the names of the state variables (of the world or
+    of the agents) that its scheduleEvent() reads and that its fireEvent()
+    writes. A dependent channel is only rescheduled after a firing if its
+    read-set intersects the variables written. None (the default) means any
+    variable, so undeclared channels are always rescheduled.
+
+    Attributes:
+        reads  (collection of string or None)
+        writes (collection of string or None)
+
     """
+    reads = None
+    writes = None
+    _vectorized = False
+    _observer = False
+    _refs = 1  # number of agent schedulers sharing this instance (see CowAgentScheduler)
+
     def __new__(type_, *args, **kwargs):
-        self = object.__new__(type_, *args, **kwargs)
+        self = object.__new__(type_)
         self._id = self.__class__.__name__
         self._new_agents = []
         return self
@@ -33,6 +49,9 @@ class SimulationChannel(object):
         Perform the event. This may modify the entity.
         Return True if the entity was modified in order to invoke
         rescheduling of dependent channels, else return False.
+        To narrow down the rescheduling, a set (or frozenset) of the names of
+        the state variables that were actually written may be returned
+        instead of True.
 
         """
         # return boolean specifying if entity was modified
@@ -52,7 +71,7 @@ class SimulationChannel(object):
             External ones are not.
 
         """
-        channel = entity._scheduler.channel_dict[channel_name]
+        channel = entity._scheduler.getChannel(channel_name)
         return entity._fireNested(channel, self._event_time, reschedule=False, **kwargs)
 
     def reschedule(self, entity, channel_name, source=None):
@@ -63,7 +82,7 @@ class SimulationChannel(object):
         Raises key error if the entity does not possess the channel.
 
         """
-        channel = entity._scheduler.channel_dict[channel_name]
+        channel = entity._scheduler.getChannel(channel_name)
         return entity._resched(channel, self._event_time, source)
 
     def cloneAgent(self, agent):
@@ -72,6 +91,10 @@ class SimulationChannel(object):
 
         """
         new_agent = agent.__copy__()
+        if isinstance(self, AgentChannel):
+            # the offspring takes its own copy of this channel before it
+            # resumes firing (copy-on-write schedulers share channels)
+            new_agent._scheduler.getChannel(self._id)
         new_agent._parent = agent
         self._new_agents.append(new_agent)
         return new_agent
@@ -99,6 +122,32 @@ class AgentChannel(SimulationChannel):
         # return boolean specifying if entity was modified
         return False
 
+class VectorAgentChannel(AgentChannel):
+    """
+    Base class for agent channels that can be fired for many agents at once.
+
+    The scheduleEvent() and fireEvent() methods should be written with NumPy
+    array operations. When the asynchronous simulator finds several agents whose
+    next event belongs to the same vectorized channel, it calls these methods
+    once for the whole group: the agent argument is then a cps.state.AgentBatch
+    whose state variables read and assign as arrays, and time and event_time
+    are arrays. Elsewhere (e.g. in the FM simulator, nested firing or sync) they
+    are called for one agent at a time with scalar arguments, so the same code
+    must work in both cases.
+
+    fireEvent() may return a single boolean, an array of booleans (one per
+    agent) or a set of the names of the state variables written (for all the
+    agents). scheduleEvent() may return a scalar or an array of event times.
+
+    The channel instance belonging to the first agent of a batch fires for the
+    whole batch, so any per-agent information must be kept in agent state
+    variables rather than on the channel. Vectorized channels cannot clone or
+    kill agents.
+
+    """
+    _vectorized = True
+
+
 class WorldChannel(SimulationChannel):
     """
     Base class for world simulation channels.
@@ -113,16 +162,66 @@ class WorldChannel(SimulationChannel):
         return False
 
 
+class ObserverChannel(WorldChannel):
+    """
+    Base class for read-only world channels, e.g. to record or monitor the
+    population.
+
+    fireEvent() must not modify the world or the agents (it should return
+    False). The asynchronous simulator then does not stop the agents at the
+    observation times: it advances them straight to the next world event that
+    is not an observer, taking a snapshot of each agent (a
+    cps.state.AgentSnapshot) at each observation time it passes, and fires the
+    observers afterwards on the snapshots of their observation time. The
+    observer's scheduleEvent() is called for all its observation times up to
+    that world event before the agents are advanced, so its schedule must not
+    depend on the agents. (In constant-number mode, or if agent channels
+    reschedule world channels, the agents are stopped at the observation
+    times after all, see cps.simulator.AMSimulator.)
+
+    The sync channels are not fired for the snapshots, so the variables they
+    maintain hold their values as of each agent's last event, not the
+    observation time. To observe them at the observation time, define a method
+    advance(agent, world, time, event_time) that returns a dict of their
+    values advanced from the time of the agent's last event to the
+    observation time, as the sync channels would have done (or None to
+    observe the agent as it is). The values it returns are set on the
+    snapshots in place of the agent's own.
+
+    """
+    reads = ()
+    writes = ()
+    advance = None
+    _observer = True
+
+    def fireEvent(self, world, agents, time, event_time, **kwargs):
+        return False
+
+
 class RecordingChannel(WorldChannel):
     """
     World channel that records population snapshots at fixed
-    time intervals.
+    time intervals. With observer=True, the channel is an observer (see
+    ObserverChannel), and the asynchronous simulator records snapshots of the
+    agents taken on their way to the next world event instead of stopping
+    them. The variables that the sync channels maintain are then recorded as
+    of each agent's last event, unless an advance function is given:
+    advance(agent, world, time, event_time) returns the values to record
+    instead (see ObserverChannel).
 
     """
-    def __init__(self, tstep, recorder):
+    reads = ()
+    writes = ()
+    advance = None
+
+    def __init__(self, tstep, recorder, observer=False, advance=None):
         self.tstep = tstep
         self.recorder = recorder
         self.count = 0
+        if observer:
+            self._observer = True
+        if advance is not None:
+            self.advance = advance
 
     def scheduleEvent(self, world, agents, time, source):
         return time + self.tstep
@@ -0,0 +1,395 @@
+"""
+Name:        checkpoint
+
+Author:      Nezar Abdennur <nabdennur@gmail.com>
+Created:     17/10/2026
+Copyright:   (c) Nezar Abdennur 2012
+
+"""
+from cps.channel import WorldChannel
+from cps.logging import default_loggingfcn
+from cps.misc import SizeTrajectory
+import cps.simulator
+
+import numpy as np
+import pickle
+import random
+import io
+
+#-------------------------------------------------------------------------------
+# Save the state of a simulator to disk and restore it to continue the run.
+#
+# A checkpoint is a NumPy .npz archive. The numerical state of the simulation
+# (clocks, channel event times, agent state variables, timetables, population
+# counts and random generator states) is kept in typed arrays with one row per
+# agent. Only the parts that have no fixed layout (world state, channel
+# attributes, logger trees, recorder logs, non-numeric state variables) are
+# pickled, into a single blob.
+
+CHECKPOINT_VERSION = 1
+
+_SIMULATOR_TYPES = ('FMSimulator', 'AMSimulator', 'ParallelAMSimulator', 'OpenLoopAMSimulator')
+
+# channel attributes managed by the simulator
+_CHANNEL_INTERNALS = ('_id', '_event_time', '_new_agents', '_refs')
+
+
+class _CheckpointPickler(pickle.Pickler):
+    # World channels, recorders and logging functions belong to the model and
+    # are pickled by reference.
+    def __init__(self, file, simulator):
+        pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+        self.model_refs = {}
+        for i, recorder in enumerate(simulator.recorders):
+            self.model_refs[id(recorder)] = ('recorder', i)
+        for i, logger in enumerate(simulator.loggers):
+            if logger._logging_fcn is not default_loggingfcn:
+                self.model_refs[id(logger._logging_fcn)] = ('logging_fcn', i)
+            if logger._pruner is not None:
+                self.model_refs[id(logger._pruner)] = ('lineage_pruner', i)
+
+    def persistent_id(self, obj):
+        if isinstance(obj, WorldChannel):
+            return ('world_channel', obj._id)
+        return self.model_refs.get(id(obj))
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    def __init__(self, file, model):
+        pickle.Unpickler.__init__(self, file)
+        self.model = model
+
+    def persistent_load(self, pid):
+        kind, key = pid
+        if kind == 'world_channel':
+            return self.model.world_channel_table[key].channel
+        elif kind == 'recorder':
+            return self.model.recorders[key]
+        elif kind == 'logging_fcn':
+            return self.model.logged[sorted(self.model.logged)[key]][1]
+        elif kind == 'lineage_pruner':
+            return self.model.logged[sorted(self.model.logged)[key]][2]
+        raise pickle.UnpicklingError("Unknown reference in checkpoint.")
+
+
+def _pack_values(arrays, blob, key, values):
+    """
+    Store a list of values in a typed array if they are all Python scalars of
+    the same numeric type (or a mix of ints and floats), else in the blob.
+
+    """
+    types = set([type(v) for v in values])
+    if not types <= set([bool, int, float]) or (bool in types and len(types) > 1):
+        blob[key] = values
+        return
+    type_ = float if len(types) > 1 else (types.pop() if types else float)
+    try:
+        arrays[key] = np.array(values, dtype=type_)
+    except OverflowError:
+        blob[key] = values
+        return
+    if type_ is float and int in types:
+        # keep note of the ints
+        arrays[key + '/int'] = np.array([type(v) is int for v in values])
+
+def _unpack_values(data, blob, key):
+    if key not in data:
+        return blob[key]
+    values = data[key].tolist()
+    if key + '/int' in data:
+        for i in np.flatnonzero(data[key + '/int']).tolist():
+            values[i] = int(values[i])
+    return values
+
+def _flatten_loggers(roots):
+    """
+    Return the nodes of a forest of logger trees in depth-first order as
+    (parent position, side, node type, node attributes) records, so that deep
+    trees can be pickled without recursion.
+
+    """
+    nodes = []
+    records = []
+    position = {}
+    for root in roots:
+        stack = [(root, -1, None)]
+        while stack:
+            node, parent, side = stack.pop()
+            position[node] = len(nodes)
+            nodes.append(node)
+            attrs = dict([(name, value) for name, value in node.__dict__.items()
+                          if name not in ('parent', 'lchild', 'rchild')])
+            records.append((parent, side, node.__class__, attrs))
+            for child, side in ((node.rchild, 'rchild'), (node.lchild, 'lchild')):
+                if child is not None:
+                    stack.append((child, position[node], side))
+    return records, position
+
+def _build_loggers(records):
+    nodes = []
+    for parent, side, type_, attrs in records:
+        node = type_.__new__(type_)
+        node.__dict__.update(attrs)
+        node.lchild = node.rchild = None
+        if parent >= 0:
+            node.parent = nodes[parent]
+            setattr(nodes[parent], side, node)
+        else:
+            node.parent = None
+        nodes.append(node)
+    return nodes
+
+def _public_attrs(obj, exclude=()):
+    return dict([(name, value) for name, value in obj.__dict__.items()
+                 if not name.startswith('_') and name not in exclude])
+
+def _channel_attrs(channel):
+    return dict([(name, value) for name, value in channel.__dict__.items()
+                 if name not in _CHANNEL_INTERNALS])
+
+
+def save_checkpoint(filename, simulator, compressed=True):
+    """
+    Save the full state of a simulator to a checkpoint file, so that the run
+    can be resumed later with load_checkpoint(). Should be called between
+    calls to runSimulation().
+
+    Arguments:
+        filename (string or file)
+        simulator (cps.simulator.BaseSimulator)
+    Optional:
+        compressed (default=True): compress the archive
+
+    """
+    sim = simulator
+    world = sim.world
+
+    # agents in the population followed by agents waiting in the agent queue
+    agents = list(sim.agents)
+    rows = dict([(agent, i) for i, agent in enumerate(agents)])
+    queue = sorted(sim.agent_queue.heap)
+    for entry in queue:
+        if entry.item not in rows:
+            rows[entry.item] = len(agents)
+            agents.append(entry.item)
+    n = len(agents)
+    agent_vars = sim.model.agent_vars
+    wc_names = sorted(sim.model.world_channel_table)
+    ac_names = sorted(sim.model.agent_channel_table)
+    wc_index = dict([(name, i) for i, name in enumerate(wc_names)])
+    ac_index = dict([(name, i) for i, name in enumerate(ac_names)])
+
+    arrays = {}
+    blob = {}
+    arrays['version'] = np.array(CHECKPOINT_VERSION)
+    arrays['simulator'] = np.array(sim.__class__.__name__)
+    arrays['counters'] = np.array([len(sim.agents), sim.num_agents, sim.num_agents_max,
+                                   sim.nbirths, sim.ndeaths, sim._mode,
+                                   sim.sizethresh_hi, sim.sizethresh_lo], dtype=np.int64)
+
+    # world
+    scheduler = world._scheduler
+    _pack_values(arrays, blob, 'world_clock', [scheduler.clock])
+    _pack_values(arrays, blob, 'world_event_times', [scheduler[scheduler.channel_dict[name]] for name in wc_names])
+    arrays['world_flags'] = np.array([world._enabled, bool(world._is_modified)], dtype=bool)
+    arrays['world_curr_channel'] = np.array(wc_index[world._curr_channel._id] if world._curr_channel is not None else -1)
+    arrays['world_curr_event_time'] = np.array(getattr(world, '_curr_event_time', np.nan), dtype=float)
+    _pack_values(arrays, blob, 'world_ts', sim.trajectory.times)
+    _pack_values(arrays, blob, 'world_size', sim.trajectory.sizes)
+    arrays['trajectory_interval'] = np.array(sim.trajectory.min_interval, dtype=float)
+    if hasattr(sim, 'open_loop'):
+        arrays['open_loop'] = np.array(sorted(sim.open_loop), dtype=str)
+    blob['world_state'] = _public_attrs(world)
+    blob['world_channels'] = dict([(name, _channel_attrs(scheduler.channel_dict[name])) for name in wc_names])
+
+    # agent clocks and schedules
+    _pack_values(arrays, blob, 'agent_clock', [agent._scheduler.clock for agent in agents])
+    times = np.empty((n, len(ac_names)))
+    channels = []
+    for i, agent in enumerate(agents):
+        scheduler = agent._scheduler
+        channel_dict = scheduler.channel_dict
+        channels.append([channel_dict[name] for name in ac_names])
+        times[i] = [scheduler[channel] for channel in channels[i]]
+    arrays['agent_event_times'] = times
+    arrays['agent_flags'] = np.array([[agent._enabled, bool(agent._is_modified)] for agent in agents], dtype=bool)
+    arrays['agent_curr_channel'] = np.array([ac_index[agent._curr_channel._id] if agent._curr_channel is not None else -1
+                                             for agent in agents], dtype=np.int64)
+    arrays['agent_curr_event_time'] = np.array([getattr(agent, '_curr_event_time', np.nan) for agent in agents], dtype=float)
+    arrays['agent_parent'] = np.array([rows.get(agent._parent, -1) for agent in agents], dtype=np.int64)
+    blob['agent_channels'] = [[_channel_attrs(channel) for channel in row] for row in channels]
+    blob['agent_extra'] = [_public_attrs(agent, agent_vars) for agent in agents]
+
+    # agent state variables
+    store = sim.state_store
+    for name in agent_vars:
+        key = 'agent_var/' + name
+        if store is not None and name in store.columns:
+            arrays[key] = store.gather(name, store.rows(agents))
+        else:
+            _pack_values(arrays, blob, key, [getattr(agent, name) for agent in agents])
+
+    # loggers
+    records, position = _flatten_loggers(sim.loggers)
+    blob['loggers'] = records
+    arrays['logger_roots'] = np.array([position[logger] for logger in sim.loggers], dtype=np.int64)
+    arrays['agent_logger'] = np.array([position[agent._logger] if hasattr(agent, '_logger') else -1
+                                       for agent in agents], dtype=np.int64)
+
+    # recorders
+    blob['recorder_logs'] = [recorder.log for recorder in sim.recorders]
+
+    # timetables
+    if hasattr(sim, 'timetable'):
+        heap = sim.timetable.heapitems()
+        arrays['timetable_type'] = np.array(sim.timetable.__class__.__name__)
+        arrays['timetable_agents'] = np.array([rows[item] for item, key in heap], dtype=np.int64)
+        arrays['timetable_keys'] = np.array([key for item, key in heap], dtype=float)
+    arrays['queue_actions'] = np.array([entry.action for entry in queue], dtype=np.int64)
+    arrays['queue_agents'] = np.array([rows[entry.item] for entry in queue], dtype=np.int64)
+    arrays['queue_keys'] = np.array([entry.priority_key for entry in queue], dtype=float)
+
+    # random number generators
+    version, internal, gauss_next = random.getstate()
+    arrays['random_state'] = np.array(internal, dtype=np.uint32)
+    arrays['random_gauss'] = np.array([np.nan if gauss_next is None else gauss_next])
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    arrays['numpy_random_keys'] = keys
+    arrays['numpy_random_state'] = np.array([pos, has_gauss, cached_gaussian], dtype=float)
+
+    f = io.BytesIO()
+    _CheckpointPickler(f, sim).dump(blob)
+    arrays['blob'] = np.frombuffer(f.getvalue(), dtype=np.uint8)
+
+    if compressed:
+        np.savez_compressed(filename, **arrays)
+    else:
+        np.savez(filename, **arrays)
+
+
+def load_checkpoint(filename, model, SimulatorType=None, restore_rng=True):
+    """
+    Create a simulator from a checkpoint file written by save_checkpoint().
+    The model must be the one the checkpointed simulator was created from (or
+    an identically built one). The recorded data is restored to the model's
+    recorders.
+
+    Arguments:
+        filename (string or file)
+        model (cps.model.Model)
+    Optional:
+        SimulatorType (default=type of the checkpointed simulator)
+        restore_rng (default=True): restore the states of the random number
+            generators. Pass False (and reseed) to branch several independent
+            runs off the same checkpoint.
+
+    """
+    from cps.model import create_world, create_agent, create_channel_network
+    data = np.load(filename)
+    if int(data['version']) != CHECKPOINT_VERSION:
+        raise ValueError("Unsupported checkpoint version.")
+    blob = _CheckpointUnpickler(io.BytesIO(data['blob'].tobytes()), model).load()
+    if SimulatorType is None:
+        name = str(data['simulator'])
+        if name not in _SIMULATOR_TYPES:
+            raise ValueError("Unknown simulator type: " + name)
+        SimulatorType = getattr(cps.simulator, name)
+
+    sim = SimulatorType.__new__(SimulatorType)
+    sim._setup(model)
+    (num_listed, sim.num_agents, sim.num_agents_max, sim.nbirths, sim.ndeaths,
+        sim._mode, sim.sizethresh_hi, sim.sizethresh_lo) = data['counters'].tolist()
+    wc_names = sorted(model.world_channel_table)
+    ac_names = sorted(model.agent_channel_table)
+
+    # world
+    world = sim.world = create_world(model, sim, _unpack_values(data, blob, 'world_clock')[0])
+    scheduler = world._scheduler
+    for name, t in zip(wc_names, _unpack_values(data, blob, 'world_event_times')):
+        channel = scheduler.channel_dict[name]
+        channel.__dict__.update(blob['world_channels'][name])
+        scheduler[channel] = t
+    world._enabled, world._is_modified = data['world_flags'].tolist()
+    curr = int(data['world_curr_channel'])
+    world._curr_channel = scheduler.channel_dict[wc_names[curr]] if curr >= 0 else None
+    if not np.isnan(data['world_curr_event_time']):
+        world._curr_event_time = float(data['world_curr_event_time'])
+    sim._bindTrajectory(SizeTrajectory(_unpack_values(data, blob, 'world_ts'),
+                                       _unpack_values(data, blob, 'world_size'),
+                                       float(data.get('trajectory_interval', sim.trajectory_interval))))
+    for name, value in blob['world_state'].items():
+        setattr(world, name, value)
+
+    # loggers
+    nodes = _build_loggers(blob['loggers'])
+    sim.loggers = [nodes[i] for i in data['logger_roots'].tolist()]
+
+    # agents
+    agents = []
+    network = create_channel_network(model)
+    clocks = _unpack_values(data, blob, 'agent_clock')
+    for i, j in enumerate(data['agent_logger'].tolist()):
+        agent = create_agent(model, sim, clocks[i], nodes[j] if j >= 0 else None, network)
+        scheduler = agent._scheduler
+        for name, attrs in zip(ac_names, blob['agent_channels'][i]):
+            scheduler.getChannel(name).__dict__.update(attrs)
+        agents.append(agent)
+    event_times = data['agent_event_times'].tolist()
+    flags = data['agent_flags'].tolist()
+    curr_channels = data['agent_curr_channel'].tolist()
+    curr_event_times = data['agent_curr_event_time'].tolist()
+    parents = data['agent_parent'].tolist()
+    for i, agent in enumerate(agents):
+        scheduler = agent._scheduler
+        channel_dict = scheduler.channel_dict
+        for name, t in zip(ac_names, event_times[i]):
+            scheduler[channel_dict[name]] = t
+        agent._enabled, agent._is_modified = flags[i]
+        if curr_channels[i] >= 0:
+            agent._curr_channel = channel_dict[ac_names[curr_channels[i]]]
+        if not np.isnan(curr_event_times[i]):
+            agent._curr_event_time = curr_event_times[i]
+        if parents[i] >= 0:
+            agent._parent = agents[parents[i]]
+        for name, value in blob['agent_extra'][i].items():
+            setattr(agent, name, value)
+    store = sim.state_store
+    for name in model.agent_vars:
+        key = 'agent_var/' + name
+        if store is not None and name in store.columns:
+            store.scatter(name, store.rows(agents), data[key])
+        else:
+            for agent, value in zip(agents, _unpack_values(data, blob, key)):
+                setattr(agent, name, value)
+    sim.agents = model.AgentCollectionType(agents[:num_listed])
+    sim._bindAggregates()
+
+    # recorders
+    for recorder, log in zip(sim.recorders, blob['recorder_logs']):
+        recorder.log = log
+
+    # timetables
+    if 'timetable_agents' in data:
+        heap = [(agents[i], key) for i, key in zip(data['timetable_agents'].tolist(), data['timetable_keys'].tolist())]
+        TimetableType = sim._timetable_type
+        if str(data.get('timetable_type', 'IndexedPriorityQueue')) == TimetableType.__name__:
+            # same layout, so that ties are broken as in the original run
+            sim.timetable = TimetableType.fromheapitems(heap)
+        else:
+            sim.timetable = TimetableType(heap)
+    q = sim.agent_queue
+    for action, i, key in zip(data['queue_actions'].tolist(), data['queue_agents'].tolist(), data['queue_keys'].tolist()):
+        q.enqueue(action, agents[i], key)
+
+    # random number generators
+    if restore_rng:
+        gauss_next = float(data['random_gauss'][0])
+        random.setstate((3, tuple(data['random_state'].tolist()), None if np.isnan(gauss_next) else gauss_next))
+        pos, has_gauss, cached_gaussian = data['numpy_random_state'].tolist()
+        np.random.set_state(('MT19937', data['numpy_random_keys'], int(pos), int(has_gauss), cached_gaussian))
+
+    if 'open_loop' in data and isinstance(sim, cps.simulator.OpenLoopAMSimulator):
+        sim.open_loop = frozenset(data['open_loop'].tolist())
+
+    sim._resume()
+    return sim
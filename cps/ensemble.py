@@ -0,0 +1,166 @@
+"""
+Name:        ensemble
+
+Author:      Nezar Abdennur <nabdennur@gmail.com>
+Created:     17/10/2026
+Copyright:   (c) Nezar Abdennur 2012
+
+"""
+from cps.simulator import AMSimulator
+from cps.logging import HDFRecorder
+
+import collections
+import copy
+import os
+import random
+
+#-------------------------------------------------------------------------------
+# Run many independent replicates of a model concurrently
+
+Replicate = collections.namedtuple('Replicate', 'index seed logs ts size nbirths ndeaths num_agents')
+
+_ensemble_model = None
+
+def _init_worker(model):
+    global _ensemble_model
+    _ensemble_model = model
+
+def _run_replicate(args):
+    """
+    Run one replicate of the ensemble model. Every replicate gets a fresh copy
+    of the model, so channels and recorders do not carry over between runs.
+    Recorders that write to a file (cps.logging.HDFRecorder) write to their
+    own file per replicate, named after the model's file with the replicate
+    index appended, e.g. run.h5 -> run_3.h5.
+
+    """
+    index, seed, tstart, tstop, SimulatorType = args
+    model = copy.deepcopy(_ensemble_model)
+    for recorder in model.recorders:
+        if isinstance(recorder, HDFRecorder):
+            root, ext = os.path.splitext(recorder.filename)
+            recorder.filename = '%s_%d%s' % (root, index, ext)
+    random.seed(seed)
+    try:
+        import numpy
+        numpy.random.seed(seed % 2**32)
+    except ImportError:
+        pass
+    sim = SimulatorType(model, tstart)
+    sim.runSimulation(tstop)
+    for recorder in sim.recorders:
+        if hasattr(recorder, 'close'):
+            recorder.close()
+    logs = [recorder.log for recorder in sim.recorders]
+    return Replicate(index, seed, logs, list(sim.world._ts), list(sim.world._size),
+                     sim.nbirths, sim.ndeaths, sim.num_agents)
+
+def iter_ensemble(model, seeds, tstop, tstart=0, SimulatorType=AMSimulator, processes=None):
+    """
+    Run one replicate simulation of the model per seed in a pool of worker
+    processes. Returns a generator that yields each Replicate as soon as its
+    run finishes (not necessarily in seed order).
+
+    Arguments:
+        model  (cps.model.Model)
+        seeds  (list-of-int): one random seed per replicate
+        tstop  (float): terminal time of every run
+    Optional:
+        tstart (default=0): initial time of every run
+        SimulatorType (default=AMSimulator)
+        processes (default=number of CPUs): number of worker processes.
+            If 1, the replicates are run in this process.
+
+    Each HDFRecorder of the model writes its replicate to a file of its own
+    (see _run_replicate) and its log in the Replicate is empty.
+
+    """
+    tasks = [(i, seed, tstart, tstop, SimulatorType) for i, seed in enumerate(seeds)]
+    if processes == 1:
+        _init_worker(model)
+        for task in tasks:
+            yield _run_replicate(task)
+        return
+
+    import multiprocessing
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        context = multiprocessing
+    pool = context.Pool(processes, initializer=_init_worker, initargs=(model,))
+    try:
+        for replicate in pool.imap_unordered(_run_replicate, tasks):
+            yield replicate
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def run_ensemble(model, seeds, tstop, tstart=0, SimulatorType=AMSimulator, processes=None, callback=None):
+    """
+    Run one replicate simulation of the model per seed and collect the results
+    into an EnsembleResult. See iter_ensemble() for the arguments.
+
+    Optional:
+        callback (callable): called with each Replicate as soon as it finishes
+
+    """
+    replicates = []
+    for replicate in iter_ensemble(model, seeds, tstop, tstart, SimulatorType, processes):
+        if callback is not None:
+            callback(replicate)
+        replicates.append(replicate)
+    return EnsembleResult(replicates)
+
+
+class EnsembleResult(object):
+    """
+    Results of an ensemble of replicate simulations, ordered by seed.
+
+    Recorder logs are stacked along a new leading axis (one row per replicate)
+    where the shapes agree, e.g. a recorder taking T snapshots of N agents gives
+    an array of shape (R, T, N) for each agent variable. Logs with ragged
+    shapes are kept as lists of per-replicate logs.
+
+    Attributes:
+        replicates (list-of-Replicate)
+        seeds      (list-of-int)
+        logs       (list-of-dict: one dict of name -> stacked data per recorder)
+        ts         (list): population size time stamps of each replicate
+        size       (list): population size trajectory of each replicate
+
+    """
+    def __init__(self, replicates):
+        self.replicates = sorted(replicates, key=lambda r: r.index)
+        self.seeds = [r.seed for r in self.replicates]
+        self.ts = [r.ts for r in self.replicates]
+        self.size = [r.size for r in self.replicates]
+        self.logs = []
+        if self.replicates:
+            for i, log in enumerate(self.replicates[0].logs):
+                self.logs.append(dict([(name, self._stack([r.logs[i][name] for r in self.replicates]))
+                                       for name in log]))
+
+    def __len__(self):
+        return len(self.replicates)
+
+    @staticmethod
+    def _stack(data):
+        try:
+            import numpy as np
+            return np.array(data)
+        except (ImportError, ValueError):
+            return data
+
+    def sizeAt(self, times):
+        """
+        Return the population size of every replicate sampled at the given
+        times as a list of rows (an array of shape (R, len(times)) if NumPy is
+        available). The size trajectories are treated as step functions.
+
+        """
+        from bisect import bisect_right
+        rows = []
+        for ts, size in zip(self.ts, self.size):
+            rows.append([size[max(bisect_right(ts, t)-1, 0)] for t in times])
+        return self._stack(rows)
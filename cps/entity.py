@@ -11,10 +11,44 @@ from cps.channel import *
 from cps.logging import LoggerNode
 from cps.exception import SchedulingError, SimulationError
 from cps.simulator import FMSimulator, AMSimulator
+from cps.misc import IndexedPriorityQueue
 
 from copy import copy
+from operator import itemgetter
 import math
 
+_IMMUTABLE_TYPES = frozenset([type(None), bool, int, float, complex, str, bytes, tuple, frozenset])
+
+# types of the value returned by fireEvent() that name the state variables written
+_NAME_SETS = (set, frozenset)
+
+
+def _may_affect(source, dependent):
+    """
+    Whether firing the source channel can change what the dependent channel
+    reads, judging from their declared write-set and read-set.
+
+    """
+    if source.writes is None or dependent.reads is None:
+        return True
+    return not frozenset(source.writes).isdisjoint(dependent.reads)
+
+def _affected(dependents, written):
+    """
+    Select the dependent channels whose read-set intersects the set of names
+    of the state variables written.
+
+    """
+    return [channel for channel in dependents
+            if channel.reads is None or not written.isdisjoint(channel.reads)]
+
+def _dependents(scheduler, channel, is_modified):
+    # internal dependents to reschedule after a firing of the channel modified the entity
+    dependents = scheduler.dependents(channel)
+    if type(is_modified) in _NAME_SETS:
+        return _affected(dependents, is_modified)
+    return dependents
+
 
 #-------------------------------------------------------------------------------
 # Manage a network of simulation channels
@@ -26,11 +60,8 @@ class ChannelSchedule(dict):
     queue is updated to improve lookup efficiency.
 
     """
-    #NOTE: we can make a subclass where __setitem__ stores the timetable values
-    #as pairs [time, rank] to implement a ranked priority queue for tie-breaking
-    #between channels with the same event time...
-    #
-    #NOTE: we could also switch to an indexed heap-based priority queue...
+    #NOTE: see IndexedChannelSchedule for a heap-based schedule that ranks
+    #channels for tie-breaking between channels with the same event time.
 
     def __init__(self, *args):
         self.update(dict(*args))
@@ -46,9 +77,9 @@ class ChannelSchedule(dict):
         self.__updated = True
 
     def earliestItem(self):
-        #NOTE: min() is run on a dict_items whose order of elements is arbitrary
-        #      therefore the element chosen when two channels have the same
-        #      event time is arbitrary as well
+        #NOTE: min() returns the first minimal element of the dict_items, so
+        #      the channel chosen when two channels have the same event time is
+        #      the one that was inserted first
         if self.__updated:
             cmin, tmin = min(self.items(), key=lambda x: x[1])
             self.__earliest_channel = cmin
@@ -56,6 +87,62 @@ class ChannelSchedule(dict):
             self.__updated = False
         return self.__earliest_channel, self.__earliest_time
 
+    def replaceitem(self, old_channel, new_channel):
+        """
+        Put a channel in the place of another, with the same event time and
+        the same position in the order of insertion.
+
+        """
+        items = [(new_channel if channel is old_channel else channel, t) for channel, t in self.items()]
+        dict.clear(self)
+        dict.update(self, items)
+        if self.__earliest_channel is old_channel:
+            self.__earliest_channel = new_channel
+
+
+class IndexedChannelSchedule(dict):
+    """
+    A prioritized collection backed by an indexed binary heap. Updating the
+    event time of a channel costs O(log k) and the earliest item is found in
+    constant time, which pays off for entities with many channels.
+
+    Ties between channels with the same event time are broken by rank: the
+    channel that was added to the schedule first wins. Ranks are assigned in
+    insertion order, so they follow the order in which channels were added to
+    the model and are preserved when a scheduler is copied.
+
+    """
+    def __init__(self, *args):
+        timetable = dict(*args)
+        if not timetable:
+            raise ValueError('Schedule requires at least one channel')
+        self._ranks = {}
+        self._queue = IndexedPriorityQueue()
+        for channel, event_time in timetable.items():
+            self[channel] = event_time
+
+    def __setitem__(self, channel, event_time):
+        super(IndexedChannelSchedule, self).__setitem__(channel, event_time)
+        channel._event_time = event_time
+        rank = self._ranks.setdefault(channel, len(self._ranks))
+        self._queue[channel] = (event_time, rank)
+
+    def earliestItem(self):
+        cmin, (tmin, rank) = self._queue.peek()
+        return cmin, tmin
+
+    def replaceitem(self, old_channel, new_channel):
+        """
+        Put a channel in the place of another, with the same event time and
+        rank.
+
+        """
+        items = [(new_channel if channel is old_channel else channel, t) for channel, t in self.items()]
+        dict.clear(self)
+        dict.update(self, items)
+        self._ranks[new_channel] = self._ranks.pop(old_channel)
+        self._queue.replaceitem(old_channel, new_channel)
+
 
 class Scheduler(object):
     """
@@ -74,15 +161,19 @@ class Scheduler(object):
         *g2l_graph      (dict: channel -> tuple of channels)
         *sync_channels  (tuple of channels)
 
-    *applies only to agent schedulers
+    *applies only to agent schedulers (agents normally use an AgentScheduler,
+     which shares these graphs between agents)
+
+    The type of channel schedule (e.g. ChannelSchedule or
+    IndexedChannelSchedule) can be chosen with the schedule_type argument.
 
     """
-    def __init__(self, time, timetable, dep_graph, l2g_graph=None, g2l_graph=None, sync_channels=()):
+    def __init__(self, time, timetable, dep_graph, l2g_graph=None, g2l_graph=None, sync_channels=(), schedule_type=ChannelSchedule):
         if any([t < time for t in timetable.values()]):
            raise SchedulingError("Cannot create scheduler: some channel's event time precedes the current clock time.")
         elif math.isnan(time):
             raise ValueError("Clock time cannot be NaN")
-        self._timetable = ChannelSchedule(timetable)
+        self._timetable = schedule_type(timetable)
         self.clock = time
         self.enabled = True
         self.channel_dict = {channel._id:channel for channel in timetable}
@@ -97,32 +188,19 @@ class Scheduler(object):
                     raise ValueError("Sync channels should not sync channel dependents.")
 
     @staticmethod
-    def agentSchedulerFromModel(t_init, ac_table, wc_table):
+    def agentSchedulerFromModel(t_init, ac_table, wc_table, schedule_type=ChannelSchedule, network=None):
         """
+        Agent channels are copied from the model's channel network, which is
+        compiled from the channel tables if not provided.
         World channels are not copied.
 
         """
-        # make a copy of each channel instance provided
-        copied = {entry.channel:copy(entry.channel) for entry in ac_table.values()}
-        timetable = dict( zip(copied.values(), [t_init]*len(copied)) )
-
-        # build channel dependency graphs and local event schedule
-        g2l_graph = {}
-        for entry in wc_table.values():
-            g2l_graph[entry.channel] = tuple([copied[channel] for channel in entry.wc_dependents])
-        dep_graph = {}
-        l2g_graph = {}
-        sync_channels = []
-        for entry in ac_table.values():
-            dep_graph[copied[entry.channel]] = tuple([copied[channel] for channel in entry.ac_dependents])
-            l2g_graph[copied[entry.channel]] = tuple(entry.wc_dependents)
-            if entry.sync:
-                sync_channels.append(copied[entry.channel])
-        sync_channels = tuple(sync_channels)
-        return Scheduler(t_init, timetable, dep_graph, l2g_graph, g2l_graph, sync_channels)
+        if network is None:
+            network = ChannelNetwork(ac_table, wc_table)
+        return AgentScheduler(t_init, network, schedule_type=schedule_type)
 
     @staticmethod
-    def worldSchedulerFromModel(t_init, wc_table):
+    def worldSchedulerFromModel(t_init, wc_table, schedule_type=ChannelSchedule):
         """
         World channels are not copied.
 
@@ -131,8 +209,9 @@ class Scheduler(object):
         timetable = {entry.channel:t_init for entry in wc_table.values()}
         dep_graph = {}
         for entry in wc_table.values():
-            dep_graph[entry.channel] = tuple([channel for channel in entry.wc_dependents])
-        return Scheduler(t_init, timetable, dep_graph)
+            dep_graph[entry.channel] = tuple([channel for channel in entry.wc_dependents
+                                              if _may_affect(entry.channel, channel)])
+        return Scheduler(t_init, timetable, dep_graph, schedule_type=schedule_type)
 
     @property
     def next_event_time(self):
@@ -147,6 +226,22 @@ class Scheduler(object):
     def __getitem__(self, channel):
         return self._timetable[channel]
 
+    def getChannel(self, name):
+        """ Return the channel with the given id """
+        return self.channel_dict[name]
+
+    def dependents(self, channel):
+        """ Return the channels that depend on the channel provided """
+        return self.dep_graph[channel]
+
+    def worldDependents(self, channel):
+        """ Return the world channels that depend on the agent channel provided """
+        return self.l2g_graph[channel]
+
+    def agentDependents(self, wchannel):
+        """ Return the agent channels that depend on the world channel provided """
+        return self.g2l_graph[wchannel]
+
     def __setitem__(self, channel, event_time):
         if event_time < self.clock: #catch NaNs here too?
             raise SchedulingError("Cannot schedule an event in the past!")
@@ -161,7 +256,7 @@ class Scheduler(object):
         # make a copy of each simulation channel, mapped to the original
         orig_copied = {channel:copy(channel) for channel in self}
         # mirror the timetable
-        timetable = ChannelSchedule({orig_copied[channel]:time for channel, time in self._timetable.items()})
+        timetable = self._timetable.__class__({orig_copied[channel]:time for channel, time in self._timetable.items()})
         # mirror the dictionary of channels
         channel_dict = {name:orig_copied[self.channel_dict[name]] for name in self.channel_dict}
         # mirror the dependency graph
@@ -205,6 +300,232 @@ class Scheduler(object):
         return cmin, tmin
 
 
+def _selector(indices):
+    """
+    Return a function that picks the items at the given positions of a
+    sequence, as a tuple.
+
+    """
+    if not indices:
+        return lambda items: ()
+    elif len(indices) == 1:
+        i = indices[0]
+        return lambda items: (items[i],)
+    return itemgetter(*indices)
+
+
+class ChannelNetwork(object):
+    """
+    Integer-indexed template of the agent channel network of a model. It is
+    compiled once per simulation and shared by the schedulers of all the
+    agents, which only hold their own channel instances and event times.
+    Channels are identified by their id and numbered in the order they were
+    added to the model.
+
+    Attributes:
+        names          (tuple of str): id of each channel
+        index          (dict: name -> int)
+        prototypes     (tuple of channels): the model's channel instances
+        dep_graph      (dict: name -> tuple of int)
+        l2g_graph      (dict: name -> tuple of world channels)
+        g2l_graph      (dict: world channel -> tuple of int)
+        sync_channels  (tuple of int)
+
+    """
+    def __init__(self, ac_table, wc_table):
+        prototypes = [entry.channel for entry in ac_table.values()]
+        numbered = {channel:i for i, channel in enumerate(prototypes)}
+        self.names = tuple([channel._id for channel in prototypes])
+        self.index = {name:i for i, name in enumerate(self.names)}
+        self.prototypes = tuple(prototypes)
+        # build channel dependency graphs, leaving out the edges along which
+        # the declared write-set and read-set do not intersect
+        self.g2l_graph = {}
+        for entry in wc_table.values():
+            self.g2l_graph[entry.channel] = tuple([numbered[channel] for channel in entry.ac_dependents
+                                                   if _may_affect(entry.channel, channel)])
+        self.dep_graph = {}
+        self.l2g_graph = {}
+        sync_channels = []
+        for entry in ac_table.values():
+            self.dep_graph[entry.channel._id] = tuple([numbered[channel] for channel in entry.ac_dependents
+                                                       if _may_affect(entry.channel, channel)])
+            self.l2g_graph[entry.channel._id] = tuple([channel for channel in entry.wc_dependents
+                                                       if _may_affect(entry.channel, channel)])
+            if entry.sync:
+                sync_channels.append(numbered[entry.channel])
+        self.sync_channels = tuple(sync_channels)
+        # check that no sync channel has sync channel dependents
+        for i in self.sync_channels:
+            if any([j in self.sync_channels for j in self.dep_graph[self.names[i]]]):
+                raise ValueError("Sync channels should not sync channel dependents.")
+        self._compile()
+
+    def _compile(self):
+        # functions that pick the channels of an agent scheduler
+        self._dep_select = {name:_selector(deps) for name, deps in self.dep_graph.items()}
+        self._g2l_select = {wchannel:_selector(deps) for wchannel, deps in self.g2l_graph.items()}
+        self._sync_select = _selector(self.sync_channels)
+
+    def __getstate__(self):
+        # the selectors cannot be pickled, they are rebuilt on unpickling
+        state = self.__dict__.copy()
+        for name in ('_dep_select', '_g2l_select', '_sync_select'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    def newChannels(self):
+        """ Return a list of fresh copies of the channels, in network order """
+        return [copy(channel) for channel in self.prototypes]
+
+
+class AgentScheduler(Scheduler):
+    """
+    Scheduler of an agent. The dependency structure is held by a ChannelNetwork
+    shared by all the agents: the scheduler only holds the agent's channel
+    instances (in network order) and their event times. Copying copies the
+    channels and the event times and shares the network.
+
+    Additional attributes:
+        network         (ChannelNetwork)
+        channels        (list of channels)
+
+    channel_dict, dep_graph, l2g_graph, g2l_graph and sync_channels are built
+    from the network on each access. The simulator uses getChannel(),
+    dependents(), worldDependents() and agentDependents() instead.
+
+    """
+    def __init__(self, time, network, channels=None, schedule_type=ChannelSchedule):
+        if math.isnan(time):
+            raise ValueError("Clock time cannot be NaN")
+        if channels is None:
+            channels = network.newChannels()
+        self.network = network
+        self.channels = channels
+        self.clock = time
+        self.enabled = True
+        self._timetable = schedule_type(zip(channels, [time]*len(channels)))
+
+    @property
+    def channel_dict(self):
+        return dict(zip(self.network.names, self.channels))
+
+    @property
+    def dep_graph(self):
+        return dict([(channel, self.dependents(channel)) for channel in self.channels])
+
+    @property
+    def l2g_graph(self):
+        return dict([(channel, self.worldDependents(channel)) for channel in self.channels])
+
+    @property
+    def g2l_graph(self):
+        return dict([(wchannel, self.agentDependents(wchannel)) for wchannel in self.network.g2l_graph])
+
+    @property
+    def sync_channels(self):
+        return self.network._sync_select(self.channels)
+
+    def getChannel(self, name):
+        return self.channels[self.network.index[name]]
+
+    def dependents(self, channel):
+        return self.network._dep_select[channel._id](self.channels)
+
+    def worldDependents(self, channel):
+        return self.network.l2g_graph[channel._id]
+
+    def agentDependents(self, wchannel):
+        return self.network._g2l_select[wchannel](self.channels)
+
+    def __copy__(self):
+        """
+        Copying produces copies of the channels and shares the channel network.
+
+        """
+        channels = [copy(channel) for channel in self.channels]
+        index = self.network.index
+        other = self.__class__.__new__(self.__class__)
+        other.network = self.network
+        other.channels = channels
+        other.clock = self.clock
+        other.enabled = self.enabled
+        other._timetable = self._timetable.__class__(
+            [(channels[index[channel._id]], time) for channel, time in self._timetable.items()])
+        return other
+
+
+class CowAgentScheduler(AgentScheduler):
+    """
+    Agent scheduler with copy-on-write cloning. A copy shares the channel
+    instances of the original, and each channel keeps count of the schedulers
+    sharing it (_refs). A scheduler copies a shared channel the first time it
+    hands it out to be fired or rescheduled (through next(), getChannel(),
+    dependents(), agentDependents() or sync_channels), so channels that an
+    agent never uses again after a birth are never copied. The private copy
+    takes the place of the shared channel in the timetable.
+
+    Iteration, channel_dict and next_event_time are read-only views that do
+    not copy anything.
+
+    To use it, set model.AgentSchedulerType = cps.entity.CowAgentScheduler.
+
+    """
+    def _own(self, channel):
+        # replace a shared channel by a private copy
+        channel._refs -= 1
+        other = copy(channel)
+        other._refs = 1
+        self.channels[self.network.index[channel._id]] = other
+        self._timetable.replaceitem(channel, other)
+        return other
+
+    def _ownAll(self, channels):
+        for channel in channels:
+            if channel._refs > 1:
+                return tuple([self._own(c) if c._refs > 1 else c for c in channels])
+        return channels
+
+    @property
+    def sync_channels(self):
+        return self._ownAll(self.network._sync_select(self.channels))
+
+    def getChannel(self, name):
+        channel = self.channels[self.network.index[name]]
+        return self._own(channel) if channel._refs > 1 else channel
+
+    def dependents(self, channel):
+        return self._ownAll(self.network._dep_select[channel._id](self.channels))
+
+    def agentDependents(self, wchannel):
+        return self._ownAll(self.network._g2l_select[wchannel](self.channels))
+
+    def next(self):
+        cmin, tmin = self._timetable.earliestItem()
+        if cmin._refs > 1:
+            cmin = self._own(cmin)
+        return cmin, tmin
+
+    def __copy__(self):
+        """
+        Copying shares the channels and the channel network.
+
+        """
+        for channel in self.channels:
+            channel._refs += 1
+        other = self.__class__.__new__(self.__class__)
+        other.network = self.network
+        other.channels = list(self.channels)
+        other.clock = self.clock
+        other.enabled = self.enabled
+        other._timetable = self._timetable.__class__(self._timetable.items())
+        return other
+
+
 
 #-------------------------------------------------------------------------------
 # Simulation entities: agents & world
@@ -232,9 +553,19 @@ class BaseEntity(object):
         self._enabled = True
         self._is_modified = False
         self._curr_channel = None
+        self._initState(state_names)
+
+    def _initState(self, state_names):
+        """ Create the user-defined state variables """
         for name in state_names:
             setattr(self, name, None)
 
+    def __getstate__(self):
+        # the simulator is not pickled along with the entity
+        state = self.__dict__.copy()
+        state['_simulator'] = None
+        return state
+
     @property
     def _time(self):
         """ Simulation clock time """
@@ -243,7 +574,7 @@ class BaseEntity(object):
     @property
     def _next_event_time(self):
         """ Scheduled event time of earliest channel """
-        return self._scheduler.next()[1]
+        return self._scheduler.next_event_time
 
     def _scheduleAllChannels(self):
         """
@@ -256,7 +587,9 @@ class BaseEntity(object):
         cargo = simulator.agents if isinstance(self, World) else simulator.world
         tmin = float('inf')
         cmin = None
-        for channel in scheduler:
+        for channel in list(scheduler):
+            # take the channel from the scheduler by name, as for firing
+            channel = scheduler.getChannel(channel._id)
             scheduler[channel] = tsched = channel.scheduleEvent(self, cargo, scheduler.clock, None)
             if tsched < tmin:
                 tmin = tsched
@@ -291,7 +624,7 @@ class BaseEntity(object):
         # reschedule
         scheduler[cnext] = cnext.scheduleEvent(self, cargo, scheduler.clock, None)
         if self._is_modified:
-            for dependent in scheduler.dep_graph[cnext]:
+            for dependent in _dependents(scheduler, cnext, self._is_modified):
                 scheduler[dependent] = dependent.scheduleEvent(self, cargo, scheduler.clock, None)
 
     def _fireNested(self, channel, event_time, reschedule=False, source=None, **kwargs):
@@ -321,14 +654,16 @@ class BaseEntity(object):
             scheduler.clock = event_time #Advance clock ONLY if we are rescheduling!!!
             scheduler[channel] = channel.scheduleEvent(self, cargo, scheduler.clock, source)
             if is_modified:
-                for dependent in scheduler.dep_graph[channel]:
+                for dependent in _dependents(scheduler, channel, is_modified):
                     scheduler[dependent] = dependent.scheduleEvent(self, cargo, scheduler.clock, source)
         return is_modified
 
     def _reschedule(self, channel, dependents=False, source=None):
         """
         Reschedule the channel provided.
-        Reschedule internal dependent channels if specified.
+        Reschedule internal dependent channels if specified. The dependents
+        option may also be the set of names of the state variables written,
+        to reschedule only the dependents that read them.
         No effect on simulation clock.
 
         """
@@ -341,7 +676,7 @@ class BaseEntity(object):
         scheduler[channel] = channel.scheduleEvent(self, cargo, scheduler.clock, source)
         # reschedule its internal dependent channels
         if dependents:
-            for dependent in scheduler.dep_graph[channel]:
+            for dependent in _dependents(scheduler, channel, dependents):
                 scheduler[dependent] = dependent.scheduleEvent(self, cargo, scheduler.clock, source)
 
     def _enqueue_new_agents(self, channel):
@@ -367,7 +702,7 @@ class BaseEntity(object):
             world = new_agent._simulator.world
             scheduler[channel] = channel.scheduleEvent(new_agent, world, time, None)
             if self._is_modified:
-                for dependent in scheduler.dep_graph[channel]:
+                for dependent in _dependents(scheduler, channel, self._is_modified):
                     scheduler[dependent] = dependent.scheduleEvent(new_agent, world, time, None)
         if isinstance(self, LoggedAgent):
             new_agent._logger.record(time, new_agent._curr_channel._id, new_agent)
@@ -380,15 +715,20 @@ class World(BaseEntity):
         _size
 
     """
-    def _rescheduleFromAgent(self, source_agent=None, wchannels=()):
+    def _rescheduleFromAgent(self, source_agent=None, wchannels=(), time=None):
         """
         Reschedule the world channels that depend on the last channel fired by an agent.
+        The AM simulator does this once per barrier, with the list of agents
+        whose firings touched the world channels as the source and the barrier
+        as the current time (default: the world clock).
 
         """
         scheduler = self._scheduler
         agents = self._simulator.agents
+        if time is None:
+            time = scheduler.clock
         for wchannel in wchannels:
-            scheduler[wchannel] = wchannel.scheduleEvent(self, agents, scheduler.clock, source_agent)
+            scheduler[wchannel] = wchannel.scheduleEvent(self, agents, time, source_agent)
 
 class Agent(BaseEntity):
     """
@@ -409,7 +749,13 @@ class Agent(BaseEntity):
         Return a sequence of world channels that depend on the last channel this agent fired.
 
         """
-        return self._scheduler.l2g_graph[self._curr_channel] if self._is_modified else ()
+        is_modified = self._is_modified
+        if not is_modified:
+            return ()
+        dependents = self._scheduler.worldDependents(self._curr_channel)
+        if type(is_modified) in _NAME_SETS:
+            return _affected(dependents, is_modified)
+        return dependents
 
     def _rescheduleFromWorld(self, world):
         """
@@ -417,20 +763,47 @@ class Agent(BaseEntity):
 
         """
         scheduler = self._scheduler
-        if world._is_modified:
-            for channel in scheduler.g2l_graph[world._curr_channel]:
+        is_modified = world._is_modified
+        if is_modified:
+            dependents = scheduler.agentDependents(world._curr_channel)
+            if type(is_modified) in _NAME_SETS:
+                dependents = _affected(dependents, is_modified)
+            for channel in dependents:
                 scheduler[channel] = channel.scheduleEvent(self, world, scheduler.clock, world)
 
-    def _synchronize(self, tbarrier):
+    def _finishVectorFiring(self, channel, next_event_time, is_modified):
+        """
+        Complete the firing of a vectorized channel that was fired for a batch
+        of agents. The simulator has already advanced the clock to the event
+        time and computed the next event time for the whole batch.
+        Reschedule the channel.
+        Reschedule internal dependent channels if agent was changed.
+
+        """
+        scheduler = self._scheduler
+        world = self._simulator.world
+        self._curr_channel = channel
+        self._curr_event_time = scheduler.clock
+        self._is_modified = is_modified
+        scheduler[channel] = next_event_time
+        if is_modified:
+            for dependent in _dependents(scheduler, channel, is_modified):
+                scheduler[dependent] = dependent.scheduleEvent(self, world, scheduler.clock, None)
+
+    def _synchronize(self, tbarrier, time=None, vectorized=True):
         """
         This should mimic a channel firing a set of nested channels.
         Sync channels are fired in succession:
             They are fired with the same initial time (t0=clock) and event time (tf=tbarrier).
+            If vectorized is False, the vectorized sync channels are skipped: the
+            simulator has already fired them for a batch of agents, from time
+            (see BaseSimulator._synchronizeAgents).
             Enqueue any cloned agents and process immediately if possible.
         Rescheduling is invoked after each firing:
             Reschedule the sync channel with t=tbarrier.
             If entity was changed, reschedule internal dependent channels
-            In FM method, ALSO reschedule dependent world channels if entity was changed.
+            In FM method, ALSO reschedule dependent world channels if entity was changed
+            (in AM method, they are noted and rescheduled at the barrier).
         The simulation clock is advanced to tbarrier.
 
         """
@@ -439,11 +812,15 @@ class Agent(BaseEntity):
         simulator = self._simulator
         world = simulator.world
         # current time
-        time = scheduler.clock
+        if time is None:
+            time = scheduler.clock
         # advance clock to sync barrier
         scheduler.clock = tbarrier
-        if scheduler.sync_channels:
-            for channel in scheduler.sync_channels:
+        sync_channels = scheduler.sync_channels
+        if sync_channels:
+            for channel in sync_channels:
+                if channel._vectorized and not vectorized:
+                    continue
                 # fire channel with t0=time, tf=tbarrier
                 self._is_modified = channel.fireEvent(self, world, time, tbarrier)
                 self._enqueue_new_agents(channel)
@@ -452,12 +829,17 @@ class Agent(BaseEntity):
                 # reschedule internal
                 scheduler[channel] = channel.scheduleEvent(self, world, scheduler.clock, None)
                 if self._is_modified:
-                    for dependent in scheduler.dep_graph[channel]:
+                    for dependent in _dependents(scheduler, channel, self._is_modified):
                         scheduler[dependent] = dependent.scheduleEvent(self, world, scheduler.clock, None)
-                # reschedule A2W if is modified
-                if isinstance(simulator, FMSimulator) and self._is_modified:
-                    dependents = self._scheduler.l2g_graph[channel] if self._is_modified else ()
-                    world._rescheduleFromAgent(self, dependents)
+                # reschedule A2W if is modified (in AM method, at the barrier)
+                if self._is_modified:
+                    dependents = scheduler.worldDependents(channel)
+                    if type(self._is_modified) in _NAME_SETS:
+                        dependents = _affected(dependents, self._is_modified)
+                    if isinstance(simulator, FMSimulator):
+                        world._rescheduleFromAgent(self, dependents)
+                    elif dependents:
+                        simulator._touchWorld(self, dependents)
 
     def __copy__(self):
         """
@@ -469,13 +851,36 @@ class Agent(BaseEntity):
         scheduler = copy(self._scheduler)
         simulator = self._simulator
         other = self.__class__(names, scheduler, simulator)
-        for name in names:
-            setattr(other, name, copy(getattr(self, name)))
+        self._copyStateTo(other)
         # The following ugly hack preserves the identity of currently firing channel
         if self._curr_channel is not None:
-            other._curr_channel = other._scheduler.channel_dict[self._curr_channel._id]
+            other._curr_channel = other._scheduler.getChannel(self._curr_channel._id)
         return other
 
+    def _copyStateTo(self, other):
+        """ Copy the state variables of this agent to another agent """
+        for name in self._names:
+            value = getattr(self, name)
+            # immutable values are shared, as copy() would do
+            setattr(other, name, value if type(value) in _IMMUTABLE_TYPES else copy(value))
+
+    def _discard(self):
+        """
+        Called by the simulator once this agent has left the population for good
+        (it was removed, replaced or discarded). The agent may still be finishing
+        a firing.
+
+        """
+        pass
+
+    def _release(self):
+        """
+        Called by the simulator after _discard(), once the agent can no longer
+        be firing. Releases any resources it holds.
+
+        """
+        pass
+
     def _kill(self, event_time, remove=True):
         """
         Flag this agent to signal that its scheduler should no longer be used.
@@ -509,11 +914,22 @@ class LoggedAgent(Agent):
         other._logger = r_node
         return other
 
+    def _discard(self):
+        super(LoggedAgent, self)._discard()
+        pruner = self._logger._pruner
+        if pruner is not None and not getattr(self, '_pruned', False):
+            self._pruned = True
+            pruner.prune(self._logger)
+
     def _processNextChannel(self):
         super(LoggedAgent, self)._processNextChannel()
         scheduler = self._scheduler
         self._logger.record(scheduler.clock, self._curr_channel._id, self)
 
+    def _finishVectorFiring(self, channel, next_event_time, is_modified):
+        super(LoggedAgent, self)._finishVectorFiring(channel, next_event_time, is_modified)
+        self._logger.record(self._scheduler.clock, channel._id, self)
+
     def _fireNested(self, channel, event_time, reschedule=False, source=None, **kwargs):
         super(LoggedAgent, self)._fireNested(channel, event_time, reschedule, source, **kwargs)
         scheduler = self._scheduler
@@ -546,7 +962,7 @@ class LoggedAgent(Agent):
     #     channel = self._curr_channel
     #     scheduler[channel] = channel.scheduleEvent(self, cargo, firing_time, source)
     #     if dependents:
-    #         for dependent in scheduler.dep_graph[channel]:
+    #         for dependent in scheduler.dependents(channel):
     #             scheduler[dependent] = dependent.scheduleEvent(self, cargo, scheduler.clock, source)
 
     # def _fire(self, channel_name, **kwargs):
@@ -570,7 +986,7 @@ class LoggedAgent(Agent):
     #   # reschedule channel and dependent channels
     #   scheduler[channel] = channel.scheduleEvent(self, cargo, scheduler.clock, source)
     #   if dependents:
-    #   for dependent in scheduler.dep_graph[channel]:
+    #   for dependent in scheduler.dependents(channel):
     #       scheduler[dependent] = dependent.scheduleEvent(self, cargo, scheduler.clock, source)
 
         # NOTE FOR CLONING EVENTS: the final state of the first new agent
@@ -582,4 +998,39 @@ class LoggedAgent(Agent):
     # def _prepare_new_agent(self, other):
     #     super(LoggedAgent, self)._prepare_new_agent(self, other)
     #     scheduler = other._scheduler
-    #     other.logger.record(scheduler.clock, other._curr_channel.id, other)
\ No newline at end of file
+    #     other.logger.record(scheduler.clock, other._curr_channel.id, other)
+
+
+def _check_network_pickle():
+    """
+    Check that a channel network survives pickling, as it does when agents
+    are sent to worker processes (see ParallelAMSimulator).
+
+    """
+    import pickle
+    from cps.model import Model, create_channel_network
+
+    model = Model(n0=1, nmax=1)
+    wchannel = WorldChannel()
+    a, b, c = AgentChannel(), AgentChannel(), AgentChannel()
+    model.addWorldChannel(wchannel, name='W', ac_dependents=[a, c])
+    model.addAgentChannel(a, name='A', ac_dependents=[b])
+    model.addAgentChannel(b, name='B', ac_dependents=[a, c])
+    model.addAgentChannel(c, name='C', sync=True)
+    network = create_channel_network(model)
+    other = pickle.loads(pickle.dumps(network))
+
+    assert other.names == network.names
+    assert other.dep_graph == network.dep_graph
+    assert other.sync_channels == network.sync_channels
+    channels = other.newChannels()
+    assert [channel._id for channel in channels] == list(network.names)
+    for name in network.names:
+        assert other._dep_select[name](channels) == tuple([channels[i] for i in network.dep_graph[name]])
+    assert other._sync_select(channels) == (channels[2],)
+    (wother,) = other.g2l_graph.keys()
+    assert wother._id == 'W'
+    assert other._g2l_select[wother](channels) == tuple([channels[i] for i in other.g2l_graph[wother]])
+
+if __name__ == '__main__':
+    _check_network_pickle()
@@ -9,6 +9,14 @@ Copyright:   (c) Nezar Abdennur 2012
 
 from copy import copy, deepcopy
 from cps.exception import LoggingError
+from cps.state import AgentSnapshot
+from array import array
+import numpy as np
+import pickle
+try:
+    import h5py
+except ImportError:
+    h5py = None
 
 #-------------------------------------------------------------------------------
 # The following classes are for logging/recording simulation data during a
@@ -111,13 +119,17 @@ class LoggerNode(object):
     """
     Logger keeps a log of events and recorded state over an agent's lifetime
     while linking to the logs of the agent's progeny. Logger nodes are linked
-    together forming a binary tree.
+    together forming a binary tree. The nodes of a tree share the tree's
+    LineagePruner, if any.
 
     """
+    _pruner = None
+
     def __init__(self, names, logging_fcn=None, parent=None):
         self.parent = parent
         self.lchild = None
         self.rchild = None
+        self._pruner = parent._pruner if parent is not None else None
         self._names = names
         if logging_fcn is not None:
             self._logging_fcn = logging_fcn
@@ -173,6 +185,478 @@ class LoggerNode(object):
         return [ (node.parent, node) for node in nodes]
 
 
+#-------------------------------------------------------------------------------
+# Columnar lineage logging
+
+# column types from narrowest to widest; None stands for a list
+_TYPECODES = ('b', 'q', 'd', None)
+
+def _typecode(value):
+    # narrowest column type that holds a value
+    if isinstance(value, (bool, np.bool_)):
+        return 'b'
+    elif isinstance(value, (int, np.integer)):
+        return 'q'
+    elif isinstance(value, (float, np.floating)):
+        return 'd'
+    return None
+
+
+class LineageBuffer(object):
+    """
+    Columnar storage shared by all the nodes of a tree (or forest) of logger
+    nodes. Each logged event is one row: its time, the channel that fired and
+    the values of the logged variables.
+
+    Events are first appended to plain lists, which is cheaper than appending
+    to typed arrays one value at a time, and are moved into the columns in
+    bulk every chunk_size rows and before the columns are read. Columns are
+    typed arrays (array.array) exported to NumPy without copying. The first
+    value logged for a variable decides the type of its column: bools are
+    stored as bytes, integers as 64-bit integers, floats as doubles, and
+    anything else (e.g. sequences) in a list. A column is widened (bytes to
+    integers to doubles to a list) when later values do not fit it. A logging
+    function must append exactly one value per variable per event.
+
+    Nodes are identified by integers assigned in creation order, so a parent
+    always has a smaller id than its children. Each node keeps the numbers of
+    the rows it logged, so that its events are found without scanning the
+    buffer.
+
+    Attributes:
+        names       (list-of-string): names of the logged variables
+        chunk_size  (int): number of rows appended to the lists before they
+                    are moved into the columns
+        time        (array.array): event times
+        channel     (array.array): channel codes
+        channel_ids (list): channel id corresponding to each channel code
+        columns     (dict: name -> array.array or list)
+        parents     (list-of-int): parent id of each node (-1 for roots)
+        writers     (dict: name -> list): lists the logging functions append
+                    the values of the pending rows to
+
+    """
+    def __init__(self, names, chunk_size=1024):
+        self.names = list(names)
+        self.chunk_size = chunk_size
+        self.time = array('d')
+        self.channel = array('i')
+        self.channel_ids = []
+        self._channel_codes = {}
+        self.columns = {}
+        self.parents = []
+        self.writers = dict([(name, []) for name in self.names])
+        self._pending_time = []
+        self._pending_node = []
+        self._pending_channel = []
+        self._rows = []         # row numbers of each node (array.array)
+        self._discarded = set() # nodes whose rows are to be removed
+        self._discarded_rows = 0
+
+    def __len__(self):
+        return len(self.time) + len(self._pending_time)
+
+    def newNode(self, parent_id=-1):
+        """
+        Register a new node and return its id.
+
+        """
+        self.parents.append(parent_id)
+        self._rows.append(array('q'))
+        return len(self.parents) - 1
+
+    def addRow(self, node_id, time, channel_id):
+        """
+        Start a new row for an event logged by a node.
+
+        """
+        pending_time = self._pending_time
+        if len(pending_time) >= self.chunk_size:
+            self.flush()
+        pending_time.append(time)
+        self._pending_node.append(node_id)
+        self._pending_channel.append(channel_id)
+
+    def flush(self):
+        """
+        Move the pending rows into the columns.
+
+        """
+        n = len(self._pending_time)
+        if not n:
+            return
+        start = len(self.time)
+        for name in self.names:
+            values = self.writers[name]
+            if len(values) != n and (values or name in self.columns):
+                raise LoggingError("Variable '%s' was logged %d times in %d events: a logging function must append exactly one value per variable per event." % (name, len(values), n))
+        for name in self.names:
+            values = self.writers[name]
+            if values:
+                self._extend(name, values, start)
+                del values[:]
+        codes = self._channel_codes
+        for channel_id in set(self._pending_channel).difference(codes):
+            codes[channel_id] = len(self.channel_ids)
+            self.channel_ids.append(channel_id)
+        self.time += array('d', self._pending_time)
+        self.channel += array('i', [codes[channel_id] for channel_id in self._pending_channel])
+        # add the rows to the index of each node
+        nodes = np.array(self._pending_node, dtype=np.int64)
+        order = np.argsort(nodes, kind='stable')
+        nodes = nodes[order]
+        rows = order + start
+        bounds = np.flatnonzero(nodes[1:] != nodes[:-1]) + 1
+        for node_id, i, j in zip(nodes[np.concatenate([[0], bounds])].tolist(),
+                                 [0] + bounds.tolist(), bounds.tolist() + [n]):
+            self._rows[node_id].frombytes(rows[i:j].tobytes())
+        del self._pending_time[:]
+        del self._pending_node[:]
+        del self._pending_channel[:]
+
+    def _extend(self, name, values, start):
+        column = self.columns.get(name)
+        if column is None:
+            typecode = _typecode(values[0])
+            column = array(typecode) if typecode is not None else []
+            # rows logged before this variable was first seen are left unset
+            if typecode is None:
+                column.extend([None]*start)
+            elif typecode == 'd':
+                column.extend([float('nan')]*start)
+            else:
+                column.extend([0]*start)
+            self.columns[name] = column
+        converted = False
+        while True:
+            if isinstance(column, list):
+                column.extend(values)
+                return
+            try:
+                # converting the whole list at once is faster than extend()
+                column += array(column.typecode, values)
+                return
+            except (TypeError, OverflowError) as error:
+                overflow = isinstance(error, OverflowError)
+            if not converted:
+                # numpy scalars only fit a column as Python numbers
+                values = [value.item() if isinstance(value, np.generic) else value for value in values]
+                converted = True
+            else:
+                column = self._widen(name, overflow)
+
+    def _widen(self, name, overflow=False):
+        # replace the column of a variable with one of the next wider type
+        column = self.columns[name]
+        if overflow and column.typecode == 'q':
+            # integers out of the range of a 64-bit integer are kept exact
+            typecode = None
+        else:
+            typecode = _TYPECODES[_TYPECODES.index(column.typecode) + 1]
+        if typecode is None:
+            widened = self._view(column).tolist()
+        else:
+            widened = array(typecode, self._view(column).astype(typecode).tobytes())
+        self.columns[name] = widened
+        return widened
+
+    def column(self, name):
+        """
+        Return the logged values of a variable as an array. Numeric columns are
+        returned as views that share memory with the buffer.
+
+        """
+        self.flush()
+        if name == 'time':
+            return np.frombuffer(self.time, dtype=float)
+        elif name == 'channel':
+            return np.asarray(self.channel_ids)[np.frombuffer(self.channel, dtype=np.int32)]
+        column = self.columns.get(name)
+        if column is None:
+            return np.full(len(self), np.nan)
+        elif isinstance(column, list):
+            return np.array(column)
+        return self._view(column)
+
+    def _view(self, column):
+        if column.typecode == 'b':
+            values = np.frombuffer(column, dtype=np.int8)
+            if len(values) and (values.min() < 0 or values.max() > 1):
+                # integers appended to a column of bools
+                return values.astype(np.int64)
+            return values.view(np.bool_)
+        return np.frombuffer(column, dtype=column.typecode)
+
+    def gather(self, name, rows):
+        """
+        Return the logged values of a variable (or of 'time' or 'channel') at
+        the rows provided, as an array.
+
+        """
+        self.flush()
+        if name == 'time':
+            return np.frombuffer(self.time, dtype=float)[rows]
+        elif name == 'channel':
+            return np.asarray(self.channel_ids)[np.frombuffer(self.channel, dtype=np.int32)[rows]]
+        column = self.columns.get(name)
+        if column is None:
+            return np.full(len(rows), np.nan)
+        elif isinstance(column, list):
+            return np.array([column[i] for i in rows.tolist()])
+        return self._view(column)[rows]
+
+    def discard(self, node_ids):
+        """
+        Remove the rows logged by the given nodes. Rows are removed in bulk once
+        those of discarded nodes make up half of the buffer.
+
+        """
+        self.flush()
+        rows = self._rows
+        for node_id in node_ids:
+            if node_id not in self._discarded:
+                self._discarded.add(node_id)
+                self._discarded_rows += len(rows[node_id])
+        if 2*self._discarded_rows >= len(self):
+            self._compact()
+
+    def _compact(self):
+        keep = np.ones(len(self), dtype=bool)
+        for node_id in self._discarded:
+            keep[np.frombuffer(self._rows[node_id], dtype=np.int64)] = False
+        new_row = np.cumsum(keep) - 1
+
+        def select(column):
+            if isinstance(column, list):
+                return [value for value, k in zip(column, keep.tolist()) if k]
+            kept = array(column.typecode)
+            kept.frombytes(np.frombuffer(column, dtype=column.typecode)[keep].tobytes())
+            return kept
+
+        self.time = select(self.time)
+        self.channel = select(self.channel)
+        for name, column in self.columns.items():
+            self.columns[name] = select(column)
+        for node_id in self._discarded:
+            self._rows[node_id] = array('q')
+        for node_id, rows in enumerate(self._rows):
+            if rows:
+                self._rows[node_id] = array('q', new_row[np.frombuffer(rows, dtype=np.int64)].tobytes())
+        self._discarded.clear()
+        self._discarded_rows = 0
+
+    def rows(self, node_id):
+        """
+        Return the rows logged by a node, in event order.
+
+        """
+        self.flush()
+        return np.array(self._rows[node_id], dtype=np.int64)
+
+    def accumulate(self, node_ids):
+        """
+        Restructure the rows logged by the nodes provided (in that order) so
+        that the rows of each node are contiguous. Returns the data in the
+        format of cps.save._accumulate(): node ids are offset by one and a
+        parent id of 0 marks a root.
+
+        """
+        self.flush()
+        # gather the rows from the index, node by node
+        index = array('q')
+        num_events = np.empty(len(node_ids), dtype=np.int64)
+        for i, node_id in enumerate(node_ids):
+            rows = self._rows[node_id]
+            index.extend(rows)
+            num_events[i] = len(rows)
+        order = np.frombuffer(index, dtype=np.int64)
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        start_row = np.concatenate([[0], np.cumsum(num_events)[:-1]])
+        parent_ids = np.asarray(self.parents, dtype=np.int64)[node_ids] + 1
+        adj_data = np.column_stack([parent_ids, node_ids + 1, start_row, num_events])
+        sim_data = {'time':self.gather('time', order),
+                    'event':self.gather('channel', order),
+                    'adj':adj_data,
+                    'adj_info':['parent_id', 'id', 'start_row', 'num_events']}
+        for name in self.names:
+            sim_data[name] = self.gather(name, order)
+        return sim_data, list(self.names)
+
+
+class ColumnarLoggerNode(LoggerNode):
+    """
+    Logger node that writes its events into a LineageBuffer shared with the
+    rest of its tree instead of keeping a dict of lists. Logging functions
+    receive a log whose entries only support append(), one value per variable
+    per event. The log attribute gathers the node's events from the buffer.
+
+    To use it for a model's loggers:
+        model.LoggerNodeType = cps.logging.ColumnarLoggerNode
+
+    """
+    def __init__(self, names, logging_fcn=None, parent=None, buffer=None):
+        self.parent = parent
+        self.lchild = None
+        self.rchild = None
+        self._pruner = parent._pruner if parent is not None else None
+        self._names = names
+        if logging_fcn is not None:
+            self._logging_fcn = logging_fcn
+        else:
+            self._logging_fcn = default_loggingfcn
+        if buffer is None:
+            buffer = LineageBuffer(names)
+        self._buffer = buffer
+        self._node_id = buffer.newNode(parent._node_id if parent is not None else -1)
+
+    @property
+    def log(self):
+        buffer = self._buffer
+        rows = buffer.rows(self._node_id)
+        log = dict([(name, buffer.gather(name, rows)) for name in self._names])
+        log['time'] = buffer.gather('time', rows)
+        log['channel'] = buffer.gather('channel', rows)
+        return log
+
+    def record(self, time, channel_id, entity):
+        buffer = self._buffer
+        buffer.addRow(self._node_id, time, channel_id)
+        self._logging_fcn(buffer.writers, time, entity)
+
+    def branch(self):
+        l_node = self.__class__(self._names, self._logging_fcn, parent=self, buffer=self._buffer)
+        self.lchild = l_node
+        r_node = self.__class__(self._names, self._logging_fcn, parent=self, buffer=self._buffer)
+        self.rchild = r_node
+        return l_node, r_node
+
+    def accumulate(self):
+        """
+        Return the event data of this node and its descendants restructured as
+        by cps.save._accumulate(), using bulk array operations.
+
+        """
+        node_ids = [node._node_id for node in self.traverseDFS()]
+        return self._buffer.accumulate(node_ids)
+
+
+class LineagePruner(object):
+    """
+    Drops the branches of lineage trees that have died out, so that the memory
+    used by loggers follows the living population rather than the length of
+    the run. Pass one to Model.addLogger().
+
+    When a logged agent leaves the population for good, the largest subtree of
+    logger nodes that contains the agent's node and no living agent is
+    detached from its tree (if the whole tree has died out, the root is kept
+    but emptied). If a filename is given, the events of each pruned subtree are
+    first restructured as by cps.save._accumulate() and appended to the file
+    (see load_pruned()), buffer_size subtrees at a time; otherwise they are
+    discarded.
+
+    Attributes:
+        filename    (string or None)
+        buffer_size (int)
+        num_pruned  (int): number of subtrees pruned
+        num_nodes   (int): number of logger nodes in them
+
+    """
+    def __init__(self, filename=None, buffer_size=100, mode='w'):
+        self.filename = filename
+        self.buffer_size = max(int(buffer_size), 1)
+        self.num_pruned = 0
+        self.num_nodes = 0
+        self._pending = []
+        self._dying = []
+        if filename is not None and mode == 'w':
+            open(filename, 'wb').close()
+
+    def prune(self, node):
+        """
+        Called when the agent logging to a (leaf) node has left the population.
+        The node is pruned on the next call (or flush), as the agent may still
+        log the event during which it left.
+
+        """
+        dying, self._dying = self._dying, [node]
+        for node in dying:
+            self._prune(node)
+
+    def _prune(self, node):
+        # climb to the highest ancestor with no other living descendant
+        while node.parent is not None:
+            parent = node.parent
+            if (parent.rchild if parent.lchild is node else parent.lchild) is not None:
+                break
+            node = parent
+        if self.filename is not None:
+            from cps.save import _accumulate
+            self._pending.append(_accumulate(node)[0])
+            if len(self._pending) >= self.buffer_size:
+                self._write()
+        nodes = list(node.traverseDFS())
+        self.num_pruned += 1
+        self.num_nodes += len(nodes)
+
+        parent = node.parent
+        if parent is not None:
+            if parent.lchild is node:
+                parent.lchild = None
+            else:
+                parent.rchild = None
+            node.parent = None
+        else:
+            node.lchild = node.rchild = None
+        if isinstance(node, ColumnarLoggerNode):
+            node._buffer.discard([n._node_id for n in nodes])
+        elif parent is None:
+            for values in node.log.values():
+                del values[:]
+
+    def flush(self):
+        """
+        Finish pruning and append the pruned subtrees held in memory to the
+        file.
+
+        """
+        dying, self._dying = self._dying, []
+        for node in dying:
+            self._prune(node)
+        self._write()
+
+    def _write(self):
+        if not self._pending:
+            return
+        with open(self.filename, 'ab') as f:
+            for sim_data in self._pending:
+                pickle.dump(sim_data, f, pickle.HIGHEST_PROTOCOL)
+        del self._pending[:]
+
+
+def load_pruned(filename):
+    """
+    Return the subtrees written to a file by a LineagePruner, in the order they
+    were pruned, each as a dict in the format of cps.save._accumulate().
+
+    """
+    subtrees = []
+    with open(filename, 'rb') as f:
+        while True:
+            try:
+                subtrees.append(pickle.load(f))
+            except EOFError:
+                return subtrees
+
+
+def _state_store(world, agents):
+    # the columnar store holding the agents' state, unless the agents are
+    # snapshots taken for a deferred observer (see cps.state.AgentSnapshot)
+    store = world._simulator.state_store
+    if store is not None and len(agents) and isinstance(agents[0], AgentSnapshot):
+        return None
+    return store
+
+
 class Recorder(object):
     """
     Records and collects a sequence of population snapshots.
@@ -193,13 +677,206 @@ class Recorder(object):
         #self.log['size'].append(world._size)
         self._recording_fcn(self.log, time, world, agents)
 
+    def flush(self):
+        """
+        Write out any buffered snapshots. Called by the simulator at the end
+        of a simulation run. Snapshots are kept in memory, so this does nothing.
+
+        """
+        pass
+
     def _record(self, log, time, world, agents):
-        for name in self.agent_names:
-            log[name].append( [copy(getattr(agent, name)) for agent in agents] )
+        store = _state_store(world, agents)
+        if store is not None:
+            # take slices of the columnar store
+            rows = store.rows(agents)
+            for name in self.agent_names:
+                if name in store.columns:
+                    log[name].append( store.gather(name, rows) )
+                else:
+                    log[name].append( [copy(getattr(agent, name)) for agent in agents] )
+        else:
+            for name in self.agent_names:
+                log[name].append( [copy(getattr(agent, name)) for agent in agents] )
         for name in self.world_names:
             log[name].append( copy(getattr(world, name)) )
 
 
+class HDFRecorder(Recorder):
+    """
+    Records a sequence of population snapshots by streaming them into an HDF5
+    file, so that memory use does not grow with the length of a run.
+
+    Snapshots are collected in the log (as for a Recorder) until buffer_size
+    of them have been taken and are then appended to chunked, resizable
+    datasets in the file and cleared from memory. The file is opened when the
+    first snapshots are written. Requires h5py.
+
+    The simulator only flushes the recorder at the end of a run, so the file
+    stays open until close() is called. The recorder can be used as a context
+    manager that closes it on exit.
+
+    File layout:
+        time       (T,): time of each snapshot
+        <world>    (T, ...): one row per snapshot for each world variable
+        size       (T,): number of agents in each snapshot
+        <agent>    (sum(size), ...): agent values of all snapshots concatenated,
+                   snapshot i occupies rows sum(size[:i]) to sum(size[:i+1])
+
+    """
+    def __init__(self, filename, world_names, agent_names, recording_fcn=None, buffer_size=100, chunk_size=4096, mode='w'):
+        if h5py is None:
+            raise ImportError("HDFRecorder requires h5py")
+        super(HDFRecorder, self).__init__(world_names, agent_names, recording_fcn)
+        self.filename = filename
+        self.buffer_size = max(int(buffer_size), 1)
+        self.chunk_size = chunk_size
+        self.mode = mode
+        self._file = None
+
+    def __getstate__(self):
+        # the open file is not copied
+        state = self.__dict__.copy()
+        state['_file'] = None
+        return state
+
+    def record(self, time, world, agents):
+        super(HDFRecorder, self).record(time, world, agents)
+        if len(self.log['time']) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Append the buffered snapshots to the file and clear them from memory.
+
+        """
+        log = self.log
+        if not log['time']:
+            return
+        if self._file is None:
+            self._file = h5py.File(self.filename, self.mode)
+        dfile = self._file
+        self._append(dfile, 'time', np.asarray(log['time'], dtype=float))
+        for name in self.world_names:
+            self._append(dfile, name, np.asarray(log[name]))
+        if self.agent_names:
+            sizes = [len(values) for values in log[self.agent_names[0]]]
+            self._append(dfile, 'size', np.array(sizes, dtype=np.int64))
+            for name in self.agent_names:
+                if [len(values) for values in log[name]] != sizes:
+                    raise LoggingError("Agent variables must be recorded for the same agents.")
+                chunks = [np.asarray(values) for values in log[name] if len(values)]
+                if chunks:
+                    self._append(dfile, name, np.concatenate(chunks))
+        for values in log.values():
+            del values[:]
+        dfile.flush()
+
+    def close(self):
+        """
+        Write out any buffered snapshots and close the file.
+
+        """
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _append(self, dfile, name, data):
+        if data.dtype.kind == 'U':
+            data = data.astype(np.bytes_)
+        elif data.dtype.kind == 'O':
+            raise LoggingError("Cannot write variable '%s' to HDF5: values must be numbers or arrays of the same shape." % name)
+        if name not in dfile:
+            dfile.create_dataset(name, data=data, maxshape=(None,) + data.shape[1:],
+                                 chunks=(self.chunk_size,) + data.shape[1:])
+        else:
+            dataset = dfile[name]
+            n = dataset.shape[0]
+            dataset.resize(n + len(data), axis=0)
+            dataset[n:] = data
+
+
+class SummaryRecorder(Recorder):
+    """
+    Records summary statistics of the agent variables at each snapshot
+    instead of the values of every agent. World variables are recorded as by
+    a Recorder.
+
+    The values of each agent variable are gathered into an array (straight
+    from the columnar store if there is one) and reduced with NumPy. For a
+    variable x the log holds one entry per snapshot under:
+        x_count, x_mean, x_var, x_min, x_max
+        x_quantiles (if quantiles): values at the given probabilities
+        x_hist      (if bins are given for x): counts in each bin, values
+                    outside the bin edges are not counted
+    Vector-valued variables are reduced along the agents, giving statistics
+    per component. The statistics of an empty population are nan.
+
+    """
+    STATISTICS = ('count', 'mean', 'var', 'min', 'max')
+
+    def __init__(self, world_names, agent_names, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), bins=None, recording_fcn=None):
+        """
+        Optional:
+            quantiles (sequence of float): probabilities of the quantiles to record
+            bins (sequence of float, or dict of name -> sequence of float): bin
+                edges of the histograms, for all the agent variables or per
+                variable
+
+        """
+        super(SummaryRecorder, self).__init__(world_names, [], recording_fcn)
+        self.agent_names = agent_names
+        self.quantiles = np.asarray(quantiles, dtype=float)
+        if bins is None:
+            bins = {}
+        elif not isinstance(bins, dict):
+            bins = dict([(name, bins) for name in agent_names])
+        self.bins = dict([(name, np.asarray(edges, dtype=float)) for name, edges in bins.items()])
+        for name in agent_names:
+            for stat in self.STATISTICS:
+                self.log[name + '_' + stat] = []
+            if len(self.quantiles):
+                self.log[name + '_quantiles'] = []
+            if name in self.bins:
+                self.log[name + '_hist'] = []
+
+    def _values(self, name, world, agents):
+        store = _state_store(world, agents)
+        if store is not None and name in store.columns:
+            return store.gather(name, store.rows(agents))
+        return np.array([getattr(agent, name) for agent in agents], dtype=float)
+
+    def _record(self, log, time, world, agents):
+        quantiles = self.quantiles
+        for name in self.agent_names:
+            values = self._values(name, world, agents)
+            n = len(values)
+            log[name + '_count'].append(n)
+            if n:
+                log[name + '_mean'].append(values.mean(axis=0))
+                log[name + '_var'].append(values.var(axis=0))
+                log[name + '_min'].append(values.min(axis=0))
+                log[name + '_max'].append(values.max(axis=0))
+                if len(quantiles):
+                    log[name + '_quantiles'].append(np.quantile(values, quantiles, axis=0))
+            else:
+                shape = values.shape[1:]
+                for stat in self.STATISTICS[1:]:
+                    log[name + '_' + stat].append(np.full(shape, np.nan) if shape else np.nan)
+                if len(quantiles):
+                    log[name + '_quantiles'].append(np.full((len(quantiles),) + shape, np.nan))
+            if name in self.bins:
+                log[name + '_hist'].append(np.histogram(values, self.bins[name])[0])
+        for name in self.world_names:
+            log[name].append( copy(getattr(world, name)) )
+
 def make_logger(names, logging_fcn=default_loggingfcn):
     pass
 
@@ -6,8 +6,15 @@ Created:     26/01/2012
 Copyright:   (c) Nezar Abdennur 2012
 
 """
-import collections
+from array import array
+import bisect
 import heapq
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+_INF = float('inf')
 
 class IPQEntry(object):
     def __init__(self, item, pkey):
@@ -34,7 +41,7 @@ class IPQEntry(object):
 # second element when the first compares equal.
 
 
-class IndexedPriorityQueue(collections.MutableMapping):
+class IndexedPriorityQueue(MutableMapping):
     """
     Implements Indexed Priority Queue data structure as described in:
     Gibson and Bruck. J. Phys. Chem. A, Vol. 104, No. 9, 2000.
@@ -159,14 +166,14 @@ class IndexedPriorityQueue(collections.MutableMapping):
         return other
 
     copy = __copy__
-    __eq__ = collections.MutableMapping.__eq__
-    __ne__ = collections.MutableMapping.__ne__
-    get = collections.MutableMapping.get
-    keys = collections.MutableMapping.keys
-    values = collections.MutableMapping.values
-    items = collections.MutableMapping.items
-    clear = collections.MutableMapping.clear
-    setdefault = collections.MutableMapping.setdefault
+    __eq__ = MutableMapping.__eq__
+    __ne__ = MutableMapping.__ne__
+    get = MutableMapping.get
+    keys = MutableMapping.keys
+    values = MutableMapping.values
+    items = MutableMapping.items
+    clear = MutableMapping.clear
+    setdefault = MutableMapping.setdefault
     __marker = object()
 
     def pop(self, dkey, default=__marker):
@@ -244,6 +251,26 @@ class IndexedPriorityQueue(collections.MutableMapping):
             raise KeyError
         self[dkey] = new_pkey
 
+    def updateitems(self, items):
+        """
+        Update the priority keys of many existing items at once, given as
+        (item, key) pairs, then rebuild the heap in O(n). This is cheaper than
+        calling updateitem() for each item when a large fraction of the keys
+        change. Raises KeyError if an item is not in the PQD; the keys updated
+        before it are kept.
+
+        """
+        heap = self.heap
+        finder = self.nodefinder
+        try:
+            for dkey, pkey in items:
+                heap[finder[dkey]].pkey = pkey
+        finally:
+            # heapq orders the entries with a C loop; the index is then rebuilt
+            heapq.heapify(heap)
+            for pos, entry in enumerate(heap):
+                finder[entry.item] = pos
+
     def replaceitem(self, old_item, new_item, new_pkey=None):
         """
         Replace the item of an existing entry. Optionally, change the priority
@@ -271,6 +298,25 @@ class IndexedPriorityQueue(collections.MutableMapping):
             raise KeyError
         return entry.item, entry.pkey
 
+    def heapitems(self):
+        """
+        Return the (item, key) pairs in heap order.
+
+        """
+        return [(entry.item, entry.pkey) for entry in self.heap]
+
+    @classmethod
+    def fromheapitems(cls, pairs):
+        """
+        Rebuild a PQD from the output of heapitems(), with the same layout.
+
+        """
+        other = cls()
+        for pos, (dkey, pkey) in enumerate(pairs):
+            other.heap.append(other.cmp(dkey, pkey))
+            other.nodefinder[dkey] = pos
+        return other
+
     def _heapify(self):
         n = len(self.heap)
         for pos in reversed(range(n//2)):
@@ -333,6 +379,823 @@ class IndexedPriorityQueue(collections.MutableMapping):
 #-------------------------------------------------------------------------------
 # Priority queue for adding/removing agents from the population
 
+class ArrayPriorityQueue(MutableMapping):
+    """
+    Indexed priority queue with the same interface as IndexedPriorityQueue
+    that does not create an object per entry. Each item is given an integer
+    handle: the priority keys are stored in a flat array of floats indexed by
+    handle, the binary MIN-heap is a list of handles and a position list maps
+    each handle to its place in the heap. Heap comparisons are therefore plain
+    float comparisons. Handles of removed items are reused.
+
+    Priority keys must be numbers. Besides the single-item operations, items
+    can be added, updated and extracted in bulk with additems(), updateitems()
+    and popitems().
+
+    """
+    __slots__ = ('_heap', '_pos', '_keys', '_items', '_handles', '_free')
+
+    def __init__(self, *args):
+        self._heap = []          # heap position -> handle
+        self._pos = []           # handle -> heap position
+        self._keys = array('d')  # handle -> priority key
+        self._items = []         # handle -> item
+        self._handles = {}       # item -> handle
+        self._free = []          # unused handles
+        if args:
+            self.additems(dict(*args).items())
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, dkey):
+        return dkey in self._handles
+
+    def __iter__(self):
+        return iter(self._handles)
+
+    def __getitem__(self, dkey):
+        return self._keys[self._handles[dkey]] #raises KeyError
+
+    def __setitem__(self, dkey, pkey):
+        handles = self._handles
+        if dkey in handles:
+            h = handles[dkey]
+            keys = self._keys
+            old = keys[h]
+            keys[h] = pkey
+            if pkey < old:
+                self._swim(self._pos[h])
+            else:
+                self._sink(self._pos[h])
+        else:
+            h = self._newHandle(dkey, pkey)
+            self._pos[h] = len(self._heap)
+            self._heap.append(h)
+            self._swim(self._pos[h])
+
+    def __delitem__(self, dkey):
+        self._remove(self._handles.pop(dkey)) #raises KeyError
+
+    def __copy__(self):
+        other = self.__class__()
+        other._heap = list(self._heap)
+        other._pos = list(self._pos)
+        other._keys = array('d', self._keys)
+        other._items = list(self._items)
+        other._handles = dict(self._handles)
+        other._free = list(self._free)
+        return other
+
+    copy = __copy__
+    __marker = object()
+
+    def pop(self, dkey, default=__marker):
+        """
+        If key is in the PQD, remove it and return its priority key, else return
+        default. If default is not given and dkey is not in the PQD, a KeyError
+        is raised.
+
+        """
+        try:
+            h = self._handles.pop(dkey)
+        except KeyError:
+            if default is self.__marker:
+                raise
+            return default
+        pkey = self._keys[h]
+        self._remove(h)
+        return pkey
+
+    def popitem(self):
+        """
+        Extract top priority item. Raises KeyError if PQD is empty.
+
+        """
+        try:
+            h = self._heap[0]
+        except IndexError:
+            raise KeyError
+        dkey, pkey = self._items[h], self._keys[h]
+        del self._handles[dkey]
+        self._remove(h)
+        return dkey, pkey
+
+    def popitems(self, n):
+        """
+        Extract the n top priority items (fewer if the PQD runs out), in order.
+
+        """
+        popped = []
+        while self._heap and len(popped) < n:
+            popped.append(self.popitem())
+        return popped
+
+    def update(self, *args, **kwargs):
+        self.additems(dict(*args, **kwargs).items())
+
+    def add(self, dkey, pkey):
+        """
+        Add a new item. Raises KeyError if item is already in the PQD.
+
+        """
+        if dkey in self._handles:
+            raise KeyError
+        self[dkey] = pkey
+
+    def additems(self, items):
+        """
+        Add or update many items at once, given as (item, key) pairs, then
+        rebuild the heap in O(n).
+
+        """
+        handles = self._handles
+        heap = self._heap
+        keys = self._keys
+        for dkey, pkey in items:
+            if dkey in handles:
+                keys[handles[dkey]] = pkey
+            else:
+                h = self._newHandle(dkey, pkey)
+                heap.append(h)
+        self._heapify()
+
+    def updateitem(self, dkey, new_pkey):
+        """
+        Update the priority key of an existing item. Raises KeyError if item is
+        not in the PQD.
+
+        """
+        if dkey not in self._handles:
+            raise KeyError
+        self[dkey] = new_pkey
+
+    def updateitems(self, items):
+        """
+        Update the priority keys of many existing items at once, given as
+        (item, key) pairs, then rebuild the heap in O(n). Raises KeyError if an
+        item is not in the PQD; the keys updated before it are kept.
+
+        """
+        handles = self._handles
+        keys = self._keys
+        try:
+            for dkey, pkey in items:
+                keys[handles[dkey]] = pkey
+        finally:
+            self._heapify()
+
+    def replaceitem(self, old_item, new_item, new_pkey=None):
+        """
+        Replace the item of an existing entry. Optionally, change the priority
+        while maintaining the heap invariant and the index structure.
+
+        """
+        h = self._handles.pop(old_item) #raises KeyError
+        self._handles[new_item] = h
+        self._items[h] = new_item
+        if new_pkey is not None:
+            self[new_item] = new_pkey
+
+    def peek(self):
+        """
+        Get top priority item.
+
+        """
+        try:
+            h = self._heap[0]
+        except IndexError:
+            raise KeyError
+        return self._items[h], self._keys[h]
+
+    def heapitems(self):
+        """
+        Return the (item, key) pairs in heap order.
+
+        """
+        items, keys = self._items, self._keys
+        return [(items[h], keys[h]) for h in self._heap]
+
+    @classmethod
+    def fromheapitems(cls, pairs):
+        """
+        Rebuild a PQD from the output of heapitems(), with the same layout.
+
+        """
+        other = cls()
+        for dkey, pkey in pairs:
+            other._heap.append(other._newHandle(dkey, pkey))
+        other._reindex()
+        return other
+
+    def _newHandle(self, dkey, pkey):
+        if self._free:
+            h = self._free.pop()
+            self._items[h] = dkey
+            self._keys[h] = pkey
+        else:
+            h = len(self._items)
+            self._items.append(dkey)
+            self._keys.append(pkey)
+            self._pos.append(-1)
+        self._handles[dkey] = h
+        return h
+
+    def _remove(self, h):
+        # take handle h (already removed from the index) out of the heap
+        heap = self._heap
+        pos = self._pos[h]
+        last = heap.pop()
+        if last != h:
+            heap[pos] = last
+            self._pos[last] = pos
+            self._sink(pos)
+            self._swim(self._pos[last])
+        self._items[h] = None
+        self._free.append(h)
+
+    def _reindex(self):
+        pos = self._pos
+        for i, h in enumerate(self._heap):
+            pos[h] = i
+
+    def _heapify(self):
+        # heapq orders (key, position, handle) triples with a C loop; ties are
+        # broken by position so that the result only depends on the layout
+        keys = self._keys
+        triples = [(keys[h], pos, h) for pos, h in enumerate(self._heap)]
+        heapq.heapify(triples)
+        self._heap = [h for key, pos, h in triples]
+        self._reindex()
+
+    def _sink(self, pos):
+        heap = self._heap
+        where = self._pos
+        keys = self._keys
+        n = len(heap)
+        h = heap[pos]
+        key = keys[h]
+        child_pos = 2*pos + 1
+        while child_pos < n:
+            # choose the smaller child
+            child_key = keys[heap[child_pos]]
+            right_pos = child_pos + 1
+            if right_pos < n:
+                right_key = keys[heap[right_pos]]
+                if right_key < child_key:
+                    child_pos = right_pos
+                    child_key = right_key
+            if not child_key < key:
+                break
+            # move the smaller child up
+            child = heap[child_pos]
+            heap[pos] = child
+            where[child] = pos
+            pos = child_pos
+            child_pos = 2*pos + 1
+        heap[pos] = h
+        where[h] = pos
+
+    def _swim(self, pos):
+        heap = self._heap
+        where = self._pos
+        keys = self._keys
+        h = heap[pos]
+        key = keys[h]
+        while pos > 0:
+            parent_pos = (pos - 1) >> 1
+            parent = heap[parent_pos]
+            if key < keys[parent]:
+                heap[pos] = parent
+                where[parent] = pos
+                pos = parent_pos
+                continue
+            break
+        heap[pos] = h
+        where[h] = pos
+
+
+class CalendarQueue(MutableMapping):
+    """
+    Indexed priority queue implemented as a calendar queue, after:
+    R. Brown. Commun. ACM, Vol. 31, No. 10, 1988.
+
+    Entries are hashed by key into an array of buckets ("days") of a fixed
+    width that wrap around to form a "year". Finding the earliest entry scans
+    forward from the day of the last one found, so when keys are spread
+    evenly and the bucket width matches their spacing, all operations take
+    O(1) amortized time instead of O(log n). It has the same interface as
+    IndexedPriorityQueue and can be used as an FMSimulator timetable.
+
+    The number of buckets follows the number of entries (it is doubled or
+    halved as needed) and the bucket width is re-estimated from the spacing of
+    the earliest keys each time the buckets are resized. Infinite keys are
+    kept aside. Ties between equal keys are broken by order of insertion.
+
+    Each bucket is kept sorted, so that many equal keys (e.g. agents stepping
+    in lockstep) do not have to be scanned.
+
+    Keys are assumed to be mostly non-decreasing between extractions, as event
+    times in a simulation are: adding a key earlier than the last one found
+    is allowed but moves the scan back.
+
+    """
+    __slots__ = ('_buckets', '_nbuckets', '_width', '_entries', '_far', '_day', '_top', '_seq', '_nfinite')
+
+    MIN_BUCKETS = 2
+
+    def __init__(self, *args, **kwargs):
+        width = kwargs.pop('width', 1.0)
+        self._nbuckets = self.MIN_BUCKETS
+        self._width = float(width)
+        self._buckets = [[] for i in range(self._nbuckets)]
+        self._entries = {}  # item -> [key, seq, item, day], ordered by (key, seq)
+        self._far = []      # entries with infinite keys
+        self._day = -_INF  # day of the last entry found
+        self._top = None    # cached earliest entry
+        self._seq = 0
+        self._nfinite = 0
+        if args:
+            self.additems(dict(*args).items())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, dkey):
+        return dkey in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getitem__(self, dkey):
+        return self._entries[dkey][0] #raises KeyError
+
+    def __setitem__(self, dkey, pkey):
+        entry = self._entries.get(dkey)
+        if entry is None:
+            entry = [pkey, self._seq, dkey, 0.0]
+            self._seq += 1
+            self._entries[dkey] = entry
+            self._link(entry)
+            resize = True
+        else:
+            old_pkey = entry[0]
+            if pkey == old_pkey:
+                return
+            self._unlink(entry)
+            entry[0] = pkey
+            self._link(entry)
+            # only the number of finite keys matters
+            resize = pkey == _INF or old_pkey == _INF
+        # keep the cached earliest entry
+        top = self._top
+        if top is entry:
+            self._top = None
+        elif top is not None and entry < top:
+            self._top = entry
+        if resize:
+            self._resize()
+
+    def __delitem__(self, dkey):
+        entry = self._entries.pop(dkey) #raises KeyError
+        self._unlink(entry)
+        if entry is self._top:
+            self._top = None
+        self._resize()
+
+    def __copy__(self):
+        other = self.__class__(width=self._width)
+        other.additems(self.heapitems())
+        return other
+
+    copy = __copy__
+    __marker = object()
+
+    def pop(self, dkey, default=__marker):
+        """
+        If key is in the PQD, remove it and return its priority key, else return
+        default. If default is not given and dkey is not in the PQD, a KeyError
+        is raised.
+
+        """
+        if dkey not in self._entries:
+            if default is self.__marker:
+                raise KeyError(dkey)
+            return default
+        pkey = self._entries[dkey][0]
+        del self[dkey]
+        return pkey
+
+    def popitem(self):
+        """
+        Extract top priority item. Raises KeyError if PQD is empty.
+
+        """
+        dkey, pkey = self.peek()
+        del self[dkey]
+        return dkey, pkey
+
+    def popitems(self, n):
+        """
+        Extract the n top priority items (fewer if the PQD runs out), in order.
+
+        """
+        popped = []
+        while self._entries and len(popped) < n:
+            popped.append(self.popitem())
+        return popped
+
+    def update(self, *args, **kwargs):
+        self.additems(dict(*args, **kwargs).items())
+
+    def add(self, dkey, pkey):
+        """
+        Add a new item. Raises KeyError if item is already in the PQD.
+
+        """
+        if dkey in self._entries:
+            raise KeyError
+        self[dkey] = pkey
+
+    def additems(self, items):
+        """
+        Add or update many items at once, given as (item, key) pairs.
+
+        """
+        for dkey, pkey in items:
+            self[dkey] = pkey
+
+    def updateitem(self, dkey, new_pkey):
+        """
+        Update the priority key of an existing item. Raises KeyError if item is
+        not in the PQD.
+
+        """
+        if dkey not in self._entries:
+            raise KeyError
+        self[dkey] = new_pkey
+
+    def updateitems(self, items):
+        """
+        Update the priority keys of many existing items, given as (item, key)
+        pairs. Raises KeyError if an item is not in the PQD; the keys updated
+        before it are kept.
+
+        """
+        for dkey, pkey in items:
+            self.updateitem(dkey, pkey)
+
+    def replaceitem(self, old_item, new_item, new_pkey=None):
+        """
+        Replace the item of an existing entry. Optionally, change the priority.
+
+        """
+        entry = self._entries.pop(old_item) #raises KeyError
+        entry[2] = new_item
+        self._entries[new_item] = entry
+        if new_pkey is not None:
+            self[new_item] = new_pkey
+
+    def peek(self):
+        """
+        Get top priority item.
+
+        """
+        top = self._top
+        if top is None:
+            top = self._top = self._findTop()
+        return top[2], top[0]
+
+    def heapitems(self):
+        """
+        Return the (item, key) pairs in order of insertion, which decides ties.
+
+        """
+        entries = sorted(self._entries.values(), key=lambda entry: entry[1])
+        return [(entry[2], entry[0]) for entry in entries]
+
+    @classmethod
+    def fromheapitems(cls, pairs):
+        """
+        Rebuild a PQD from the output of heapitems(), with the same order of
+        extraction, including ties.
+
+        """
+        other = cls()
+        other.additems(pairs)
+        return other
+
+    def _link(self, entry):
+        # file an entry in its bucket
+        pkey = entry[0]
+        if pkey == _INF:
+            self._far.append(entry)
+            return
+        day = entry[3] = pkey // self._width
+        bisect.insort(self._buckets[int(day % self._nbuckets)], entry)
+        self._nfinite += 1
+        if day < self._day:
+            # the scan must restart earlier
+            self._day = day
+
+    def _unlink(self, entry):
+        if entry[0] == _INF:
+            self._far.remove(entry)
+        else:
+            bucket = self._buckets[int(entry[3] % self._nbuckets)]
+            del bucket[bisect.bisect_left(bucket, entry)]
+            self._nfinite -= 1
+
+    def _findTop(self):
+        if not self._entries:
+            raise KeyError
+        if self._nfinite:
+            buckets = self._buckets
+            n = self._nbuckets
+            day = self._day
+            if day == -_INF:
+                return self._directSearch()
+            # scan one year of days, starting from the last day an entry was found
+            for j in range(n):
+                bucket = buckets[int(day % n)]
+                if bucket and bucket[0][3] <= day:
+                    self._day = day
+                    return bucket[0]
+                day += 1
+            # nothing within a year: look everywhere
+            return self._directSearch()
+        return min(self._far, key=lambda entry: entry[1])
+
+    def _directSearch(self):
+        best = min([bucket[0] for bucket in self._buckets if bucket])
+        self._day = best[3]
+        return best
+
+    def _resize(self):
+        n = self._nbuckets
+        nfinite = self._nfinite
+        if nfinite > 2*n:
+            self._rebuild(2*n)
+        elif nfinite < n//2 and n > self.MIN_BUCKETS:
+            self._rebuild(max(n//2, self.MIN_BUCKETS))
+
+    def _rebuild(self, nbuckets):
+        entries = [entry for bucket in self._buckets for entry in bucket]
+        self._width = self._estimateWidth(entries)
+        self._nbuckets = nbuckets
+        self._buckets = [[] for i in range(nbuckets)]
+        self._nfinite = 0
+        self._day = _INF
+        for entry in entries:
+            self._link(entry)
+        if not entries:
+            self._day = -_INF
+
+    def _estimateWidth(self, entries, nsample=25):
+        # three times the average spacing of the earliest keys, leaving out
+        # unusually large gaps
+        keys = heapq.nsmallest(nsample, [entry[0] for entry in entries])
+        gaps = [b - a for a, b in zip(keys[:-1], keys[1:])]
+        if not gaps:
+            return self._width
+        mean = sum(gaps)/len(gaps)
+        gaps = [gap for gap in gaps if gap <= 2*mean]
+        mean = sum(gaps)/len(gaps) if gaps else mean
+        if not mean > 0:
+            return self._width
+        return 3*mean
+
+
+class AgentCollection(list):
+    """
+    A list of agents that also maps each agent to its position in the list, so
+    that membership tests, index lookups, replacements and removals take
+    constant time. An agent may appear only once.
+
+    Removing an agent moves the last agent of the list into its slot, so the
+    order of the agents is not preserved by removals. Methods that reorder the
+    list in bulk (insert, sort, reverse) rebuild the map.
+
+    If the aggregates attribute is set to a PopulationAggregates, the agents
+    added to or removed from the collection are added to or removed from it.
+
+    """
+    __slots__ = ('_index', 'aggregates')
+
+    def __init__(self, agents=()):
+        list.__init__(self, agents)
+        self.aggregates = None
+        self._reindex()
+        if len(self._index) != len(self):
+            raise ValueError("An agent can appear only once in the collection.")
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+    def _reindex(self):
+        self._index = dict([(agent, i) for i, agent in enumerate(self)])
+
+    def __contains__(self, agent):
+        return agent in self._index
+
+    def index(self, agent, *args):
+        try:
+            return self._index[agent]
+        except KeyError:
+            raise ValueError("Agent is not in the collection.")
+
+    def count(self, agent):
+        return 1 if agent in self._index else 0
+
+    def append(self, agent):
+        if agent in self._index:
+            raise ValueError("Agent is already in the collection.")
+        self._index[agent] = len(self)
+        list.append(self, agent)
+        if self.aggregates is not None:
+            self.aggregates.add(agent)
+
+    def extend(self, agents):
+        for agent in agents:
+            self.append(agent)
+
+    def __iadd__(self, agents):
+        self.extend(agents)
+        return self
+
+    def __imul__(self, n):
+        raise TypeError("An agent can appear only once in the collection.")
+
+    def remove(self, agent):
+        """
+        Remove an agent, moving the last agent into its slot.
+
+        """
+        try:
+            pos = self._index.pop(agent)
+        except KeyError:
+            raise ValueError("Agent is not in the collection.")
+        last = list.pop(self)
+        if last is not agent:
+            list.__setitem__(self, pos, last)
+            self._index[last] = pos
+        if self.aggregates is not None:
+            self.aggregates.remove(agent)
+
+    def pop(self, pos=-1):
+        """
+        Remove and return the agent at the given position, moving the last
+        agent into its slot.
+
+        """
+        agent = self[pos]
+        self.remove(agent)
+        return agent
+
+    def __setitem__(self, pos, agent):
+        if isinstance(pos, slice):
+            raise TypeError("Slice assignment is not supported.")
+        old = self[pos]
+        if agent is old:
+            return
+        if agent in self._index:
+            raise ValueError("Agent is already in the collection.")
+        if pos < 0:
+            pos += len(self)
+        del self._index[old]
+        list.__setitem__(self, pos, agent)
+        self._index[agent] = pos
+        if self.aggregates is not None:
+            self.aggregates.remove(old)
+            self.aggregates.add(agent)
+
+    def __delitem__(self, pos):
+        if isinstance(pos, slice):
+            raise TypeError("Slice deletion is not supported.")
+        self.remove(self[pos])
+
+    def clear(self):
+        list.clear(self)
+        self._index.clear()
+        if self.aggregates is not None:
+            self.aggregates.clear()
+
+    def insert(self, pos, agent):
+        if agent in self._index:
+            raise ValueError("Agent is already in the collection.")
+        list.insert(self, pos, agent)
+        self._reindex()
+        if self.aggregates is not None:
+            self.aggregates.add(agent)
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._reindex()
+
+    def reverse(self):
+        list.reverse(self)
+        self._reindex()
+
+
+def _aggregate_term(varname, kind, where):
+    # function returning the (value, weight) an agent contributes to an aggregate
+    if kind == 'count':
+        if where is None:
+            return lambda agent: (1, 1)
+        return lambda agent: (1, 1) if where(getattr(agent, varname)) else (0, 0)
+    if where is None:
+        return lambda agent: (getattr(agent, varname), 1)
+    def term(agent):
+        value = getattr(agent, varname)
+        return (value, 1) if where(value) else (0, 0)
+    return term
+
+class PopulationAggregates(object):
+    """
+    Sums, means and counts of agent state variables over a population,
+    maintained incrementally. The contribution of each agent is remembered,
+    so that adding, removing or updating an agent costs O(k) for k aggregates,
+    and reading an aggregate costs O(1).
+
+    The aggregates are specified as a mapping of names to entries with
+    fields (varname, kind, where), see cps.model.Model.addAggregate. An agent
+    whose state has changed must be updated with update(). Since the totals
+    are running sums, refresh() may be used to recompute them from scratch.
+
+    """
+    KINDS = ('sum', 'mean', 'count')
+
+    def __init__(self, specs, agents=()):
+        names = sorted(specs)
+        self._position = dict([(name, i) for i, name in enumerate(names)])
+        self._means = [specs[name][1] == 'mean' for name in names]
+        self._terms = [_aggregate_term(*specs[name]) for name in names]
+        self._contributions = {}
+        self.clear()
+        for agent in agents:
+            self.add(agent)
+
+    def __contains__(self, name):
+        return name in self._position
+
+    def __getitem__(self, name):
+        i = self._position[name]
+        if self._means[i]:
+            weight = self._weights[i]
+            return self._totals[i]/weight if weight else float('nan')
+        return self._totals[i]
+
+    def _contribution(self, agent):
+        return tuple([term(agent) for term in self._terms])
+
+    def add(self, agent):
+        contribution = self._contributions[agent] = self._contribution(agent)
+        totals, weights = self._totals, self._weights
+        for i, (value, weight) in enumerate(contribution):
+            totals[i] += value
+            weights[i] += weight
+
+    def remove(self, agent):
+        contribution = self._contributions.pop(agent)
+        totals, weights = self._totals, self._weights
+        for i, (value, weight) in enumerate(contribution):
+            totals[i] -= value
+            weights[i] -= weight
+
+    def update(self, agent):
+        """
+        Account for a change in the state of an agent. Agents that are not
+        part of the population are ignored.
+
+        """
+        old = self._contributions.get(agent)
+        if old is None:
+            return
+        new = self._contribution(agent)
+        if new != old:
+            self._contributions[agent] = new
+            totals, weights = self._totals, self._weights
+            for i, ((old_value, old_weight), (value, weight)) in enumerate(zip(old, new)):
+                totals[i] += value - old_value
+                weights[i] += weight - old_weight
+
+    def refresh(self):
+        """
+        Recompute the contribution of every agent and the totals.
+
+        """
+        agents = list(self._contributions)
+        self.clear()
+        for agent in agents:
+            self.add(agent)
+
+    def clear(self):
+        k = len(self._terms)
+        self._contributions.clear()
+        self._totals = [0]*k
+        self._weights = [0]*k
+
+
 class AgentQueue(object):
     """
     A queue of agents to be introduced or removed from the population at
@@ -388,6 +1251,69 @@ class AgentQueue(object):
         return entry.action, entry.item
 
 
+class SizeTrajectory(object):
+    """
+    Population size over the course of a simulation. A point is recorded only
+    when the size changes, and the points are kept in two arrays of doubles.
+    The simulators expose the arrays to models as world._ts and world._size.
+
+    If min_interval is positive, the trajectory is decimated in time: a change
+    that comes less than min_interval after the next to last point replaces
+    the last point instead of adding a new one. Every point holds a size the
+    population actually had at that time, so a change is never shown before
+    it happened, and the last point is always exact. There are at most two
+    points per min_interval.
+
+    Attributes:
+        times        (array.array of double)
+        sizes        (array.array of double)
+        min_interval (float)
+
+    """
+    __slots__ = ('times', 'sizes', 'min_interval')
+
+    def __init__(self, times=(), sizes=(), min_interval=0.0):
+        self.times = array('d', times)
+        self.sizes = array('d', sizes)
+        self.min_interval = min_interval
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def size(self):
+        return self.sizes[-1]
+
+    def record(self, t, size):
+        """
+        Record the population size at time t if it has changed.
+
+        """
+        sizes = self.sizes
+        if size == sizes[-1]:
+            return
+        times = self.times
+        if len(times) > 1 and t - times[-2] < self.min_interval:
+            if size == sizes[-2]:
+                # the change was undone
+                del times[-1]
+                del sizes[-1]
+            else:
+                times[-1] = t
+                sizes[-1] = size
+        else:
+            times.append(t)
+            sizes.append(size)
+
+    def toarrays(self):
+        """
+        Return copies of the times and sizes as NumPy arrays.
+
+        """
+        import numpy as np
+        return np.array(self.times, dtype=float), np.array(self.sizes, dtype=float)
+
+
 
 
 
@@ -439,5 +1365,88 @@ def _test_ipq():
 ##        print(elem)
 ##    assert(t == sorted(t))
 
+def _check_pq(QueueType, nops=20000, seed=0, **kwargs):
+    """
+    Apply random operations to a priority queue and to a dict, and check that
+    the queue holds the same mapping and always yields a top priority item.
+
+    """
+    import random
+    from copy import copy
+    rng = random.Random(seed)
+    pool = [object() for i in range(200)]
+    # coarse keys give ties, infinite keys are used for disabled entities
+    draw = lambda: rng.choice([rng.uniform(0, 100), float(rng.randint(0, 20)), _INF])
+    ref = dict([(item, draw()) for item in pool[:50]])
+    pq = QueueType(ref.items(), **kwargs)
+    for i in range(nops):
+        op = rng.randrange(9)
+        absent = [item for item in pool if item not in ref]
+        if op == 0 and absent:
+            item = rng.choice(absent)
+            ref[item] = draw()
+            pq.add(item, ref[item])
+        elif op == 1 and ref:
+            item = rng.choice(list(ref))
+            ref[item] = draw()
+            pq.updateitem(item, ref[item])
+        elif op == 2 and ref:
+            item = rng.choice(list(ref))
+            ref[item] = draw()
+            pq[item] = ref[item]
+        elif op == 3 and ref:
+            item = rng.choice(list(ref))
+            del ref[item]
+            del pq[item]
+        elif op == 4 and ref:
+            items = rng.sample(list(ref), rng.randint(1, len(ref)))
+            changes = [(item, draw()) for item in items]
+            ref.update(changes)
+            pq.updateitems(changes)
+        elif op == 5 and ref and absent:
+            old, new = rng.choice(list(ref)), rng.choice(absent)
+            if rng.random() < 0.5:
+                ref[new] = ref.pop(old)
+                pq.replaceitem(old, new)
+            else:
+                del ref[old]
+                ref[new] = draw()
+                pq.replaceitem(old, new, ref[new])
+        elif op == 6 and ref:
+            item, pkey = pq.popitem()
+            assert pkey == min(ref.values()) and ref.pop(item) == pkey
+        elif op == 7 and ref:
+            item = rng.choice(list(ref))
+            assert pq.pop(item) == ref.pop(item)
+        elif op == 8:
+            # copies and rebuilt queues are independent of the original
+            other = copy(pq) if rng.random() < 0.5 else QueueType.fromheapitems(pq.heapitems())
+            assert other == ref
+            if ref:
+                other.popitem()
+                assert len(pq) == len(ref)
+        assert len(pq) == len(ref)
+        if ref:
+            item, pkey = pq.peek()
+            assert pkey == min(ref.values()) and ref[item] == pkey
+    assert pq == ref and dict(pq.items()) == ref
+    assert all([item in pq for item in ref]) and not any([item in pq for item in pool if item not in ref])
+    # drain in priority order
+    pkeys = [pkey for item, pkey in pq.popitems(len(pq))]
+    assert pkeys == sorted(ref.values()) and not pq
+
+def _test_array_pq():
+    _check_pq(ArrayPriorityQueue)
+    print('ArrayPriorityQueue: ok')
+
+def _test_calendar_queue():
+    _check_pq(CalendarQueue)
+    # a narrow and a wide initial bucket width
+    _check_pq(CalendarQueue, seed=1, width=0.01)
+    _check_pq(CalendarQueue, seed=2, width=1000.0)
+    print('CalendarQueue: ok')
+
 if __name__ == '__main__':
     _test_ipq()
+    _test_array_pq()
+    _test_calendar_queue()
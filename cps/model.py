@@ -13,6 +13,7 @@ from cps.channel import AgentChannel, WorldChannel
 
 import collections
 _ChannelEntry = collections.namedtuple('ChannelEntry', 'channel wc_dependents ac_dependents sync')
+_AggregateEntry = collections.namedtuple('AggregateEntry', 'varname kind where')
 
 class Model(object):
     """
@@ -37,11 +38,28 @@ class Model(object):
     4. Recorders:
         addRecorder() to add a recorder to the simulator
 
+    5. State store:
+        addStateStore() to keep agent state variables in columnar NumPy arrays
+
+    6. Aggregates:
+        addAggregate() to keep a population-wide sum, mean or count up to date
+
+    The entity, queue and schedule types used to build a simulation can be
+    overridden per model by assigning to the class attributes below, e.g.:
+        model.ChannelScheduleType = cps.entity.IndexedChannelSchedule
+        model.AgentSchedulerType = cps.entity.CowAgentScheduler
+        model.TimetableType = cps.misc.ArrayPriorityQueue
+
     """
     WorldType = cps.entity.World
     AgentType = cps.entity.Agent
     LoggedAgentType = cps.entity.LoggedAgent
+    LoggerNodeType = cps.logging.LoggerNode
     AgentQueueType = cps.misc.AgentQueue
+    TimetableType = cps.misc.IndexedPriorityQueue
+    AgentCollectionType = cps.misc.AgentCollection
+    ChannelScheduleType = cps.entity.ChannelSchedule
+    AgentSchedulerType = cps.entity.AgentScheduler
 
     def __init__(self, n0, nmax):
         # Required properties
@@ -51,11 +69,13 @@ class Model(object):
         self.nmax = nmax
         self.world_vars = ()
         self.agent_vars = ()
+        self.state_dtypes = None
         self.initializer = lambda x,y: None
         self.logged = {}
         self.recorders = []
         self.world_channel_table = {}
         self.agent_channel_table = {}
+        self.aggregate_table = {}
 
     def addInitializer(self, world_varnames, agent_varnames, init_fcn, *args):
         """
@@ -74,6 +94,42 @@ class Model(object):
         self.agent_vars = agent_varnames
         self.initializer = lambda x,y: init_fcn(x, y, *args)
 
+    def addStateStore(self, dtypes=None):
+        """
+        Keep the agent state variables in a columnar store (one growable NumPy
+        array per variable) instead of in each agent's instance dictionary.
+        Agents become lightweight views onto a row of the store, so cloning and
+        recording copy rows and slices of arrays. State variables must hold
+        scalar values of a fixed type. Requires NumPy.
+
+        Optional:
+            dtypes (dict: name -> numpy dtype): type of each agent state variable
+                (default=float)
+
+        """
+        self.state_dtypes = dict(dtypes) if dtypes is not None else {}
+
+    def addAggregate(self, name, varname, kind='sum', where=None):
+        """
+        Keep an aggregate of an agent state variable over the population up
+        to date as agents fire, are born, die or are replaced. Channels read its
+        current value in constant time as agents.aggregates[name].
+
+        Arguments:
+            name    (str): a unique key to identify the aggregate
+            varname (str): name of the agent state variable
+        Optional:
+            kind  (str): 'sum', 'mean' or 'count' (default='sum')
+            where (callable): predicate on the value of the variable, only the
+                agents for which it is true are aggregated (default: all agents)
+
+        """
+        if kind not in cps.misc.PopulationAggregates.KINDS:
+            raise ValueError("Aggregate kind must be one of 'sum', 'mean' or 'count'.")
+        if name in self.aggregate_table:
+            raise ValueError("An aggregate with the same name has already been included in the model.")
+        self.aggregate_table[name] = _AggregateEntry(varname, kind, where)
+
     def addWorldChannel(self, channel, name=None, wc_dependents=[], ac_dependents=[]):
         """
         Add a world channel instance to the model.
@@ -121,7 +177,7 @@ class Model(object):
             raise TypeError("An agent channel instance is required.")
         self.agent_channel_table[name] = _ChannelEntry(channel, wc_dependents, ac_dependents, sync)
 
-    def addLogger(self, agent_index, logged_varnames, logging_fcn=None):
+    def addLogger(self, agent_index, logged_varnames, logging_fcn=None, pruner=None):
         """
         Monitor the event history of an agent and its offspring by attaching a logger to it.
         The logging function is called after each channel firing to record custom information about
@@ -131,11 +187,13 @@ class Model(object):
             agent_index (int): index between 0 and n0-1 specifying which initial agent to track
             logged_varnames (list-of-string): names of quantities being logged
             logging_fcn (callable): a user-defined function with signature f(log, event_time, agent)
+            pruner (cps.logging.LineagePruner): drops (or writes to disk) the branches of the
+                lineage that die out (default: keep every branch)
 
         """
         if not 0 <= agent_index < self.nmax:
             raise ValueError("Agent lineage to be tracked must be specified as an index between 0 and n0.")
-        self.logged[agent_index] = (logged_varnames, logging_fcn)
+        self.logged[agent_index] = (logged_varnames, logging_fcn, pruner)
 
     def addRecorder(self, recorder):
         """
@@ -162,22 +220,62 @@ def create_agents(model, simulator, t_init):
     Factory for agent entities.
 
     """
+    network = create_channel_network(model)
     agents = []
-    from cps.logging import LoggerNode
-    from cps.entity import Scheduler
     for i in range(model.n0):
-        # create channel network/event schedule
-        state_names = model.agent_vars
-        scheduler = Scheduler.agentSchedulerFromModel(t_init, model.agent_channel_table, model.world_channel_table)
-        # create agent
         if i in model.logged:
             # make logger here
-            names, loggingfcn = model.logged[i]
-            agents.append( model.LoggedAgentType(state_names, scheduler, simulator, LoggerNode(names, loggingfcn)) )
+            names, loggingfcn, pruner = model.logged[i]
+            logger = model.LoggerNodeType(names, loggingfcn)
+            logger._pruner = pruner
+            agents.append( create_agent(model, simulator, t_init, logger, network) )
         else:
-            agents.append( model.AgentType(state_names, scheduler, simulator) )
+            agents.append( create_agent(model, simulator, t_init, network=network) )
     return agents
 
+def create_channel_network(model):
+    """
+    Factory for the agent channel network shared by all the agents of a
+    simulation.
+
+    """
+    from cps.entity import ChannelNetwork
+    return ChannelNetwork(model.agent_channel_table, model.world_channel_table)
+
+def create_agent(model, simulator, t_init, logger=None, network=None):
+    """
+    Factory for a single agent entity. An agent given a logger is created as a
+    logged agent. Agents created for the same simulation should share a
+    channel network (see create_channel_network).
+
+    """
+    AgentType, LoggedAgentType = model.AgentType, model.LoggedAgentType
+    if model.state_dtypes is not None:
+        from cps.state import stored_agent_type
+        AgentType = stored_agent_type(AgentType, model.agent_vars)
+        LoggedAgentType = stored_agent_type(LoggedAgentType, model.agent_vars)
+    # create channel network/event schedule
+    state_names = model.agent_vars
+    if network is None:
+        network = create_channel_network(model)
+    scheduler = model.AgentSchedulerType(t_init, network, schedule_type=model.ChannelScheduleType)
+    # create agent
+    if logger is not None:
+        return LoggedAgentType(state_names, scheduler, simulator, logger)
+    else:
+        return AgentType(state_names, scheduler, simulator)
+
+def create_state_store(model):
+    """
+    Factory for the agent state store. Returns None if the model keeps agent
+    state in the agents themselves.
+
+    """
+    if model.state_dtypes is None:
+        return None
+    from cps.state import AgentStateStore
+    return AgentStateStore(model.agent_vars, model.state_dtypes, capacity=model.nmax)
+
 def create_world(model, simulator, t_init):
     """
     Factory for world entities.
@@ -186,7 +284,7 @@ def create_world(model, simulator, t_init):
     from cps.entity import Scheduler
     # create channel scheduler
     state_names = model.world_vars
-    scheduler = Scheduler.worldSchedulerFromModel(t_init, model.world_channel_table)
+    scheduler = Scheduler.worldSchedulerFromModel(t_init, model.world_channel_table, model.ChannelScheduleType)
     # create world
     return model.WorldType(state_names, scheduler, simulator)
 
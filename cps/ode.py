@@ -0,0 +1,766 @@
+"""
+Name:        ode
+
+Author:      Nezar Abdennur <nabdennur@gmail.com>
+Created:     17/10/2026
+Copyright:   (c) Nezar Abdennur 2012
+
+"""
+from cps.channel import VectorAgentChannel
+from cps.exception import SimulationError
+from cps.state import AgentBatch
+import numpy as np
+import bisect
+
+#-------------------------------------------------------------------------------
+# Adaptive integration of batches of independent ODE systems
+
+# Dormand-Prince 5(4) coefficients
+_C = (0.0, 1/5, 3/10, 4/5, 8/9, 1.0)
+_A = ((),
+      (1/5,),
+      (3/40, 9/40),
+      (44/45, -56/15, 32/9),
+      (19372/6561, -25360/2187, 64448/6561, -212/729),
+      (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656))
+_B = (35/384, 0.0, 500/1113, 125/192, -2187/6784, 11/84)
+# difference between the 5th and 4th order weights (the last stage is the
+# derivative at the new point, first same as last)
+_E = (71/57600, 0.0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40)
+# continuous extension of order 4 (Shampine): over a step of size h from y0,
+# y(t0 + s*h) = y0 + h*(q0*s + q1*s**2 + q2*s**3 + q3*s**4), where qj is the
+# sum of the stages weighted by column j
+_P = ((1.0, -8048581381/2820520608, 8663915743/2820520608, -12715105075/11282082432),
+      (0.0, 0.0, 0.0, 0.0),
+      (0.0, 131558114200/32700410799, -68118460800/10900136933, 87487479700/32700410799),
+      (0.0, -1754552775/470086768, 14199869525/1410260304, -10690763975/1880347072),
+      (0.0, 127303824393/49829197408, -318862633887/49829197408, 701980252875/199316789632),
+      (0.0, -282668133/205662961, 2019193451/616988883, -1453857185/822651844),
+      (0.0, 40617522/29380423, -110615467/29380423, 69997945/29380423))
+
+# the same, as arrays
+_A_ROWS = [np.array(a) for a in _A]
+_B_ROW = np.array(_B)
+_E_ROW = np.array(_E)
+_P_MATRIX = np.array(_P)
+
+_SAFETY = 0.9
+_MIN_FACTOR = 0.2
+_MAX_FACTOR = 10.0
+_BISECTIONS = 52
+
+
+def _rms_norm(x):
+    return np.sqrt((x*x).sum(axis=1)/x.shape[1])
+
+def _broadcast(x, shape):
+    x = np.asarray(x, dtype=float)
+    return x if x.shape == shape else np.broadcast_to(x, shape)
+
+def _extension(y0, h, q, s):
+    # continuous extension of steps of sizes h (m,) from y0 (m, d), with the
+    # coefficients q (m, 4, d), at the fractions s (m,) of the steps
+    s = s[:, None]
+    return y0 + (h[:, None]*s)*(q[:, 0] + s*(q[:, 1] + s*(q[:, 2] + s*q[:, 3])))
+
+def _crossed(g0, g1):
+    # rows where a component of the event function changed sign (a component
+    # that was zero at the start of the step does not count)
+    return np.any((g0 != 0) & (np.sign(g1) != np.sign(g0)), axis=1)
+
+def _initial_step(fun, t, y, f, index, rtol, atol):
+    # Hairer, Norsett & Wanner's starting step, per system
+    scale = atol + rtol*np.abs(y)
+    d0 = _rms_norm(y/scale)
+    d1 = _rms_norm(f/scale)
+    h0 = np.where((d0 < 1e-5) | (d1 < 1e-5), 1e-6, 0.01*d0/np.where(d1 > 0, d1, 1))
+    y1 = y + h0[:, None]*f
+    f1 = fun(t + h0, y1, index)
+    d2 = _rms_norm((f1 - f)/scale)/h0
+    dmax = np.maximum(d1, d2)
+    h1 = np.where(dmax <= 1e-15, np.maximum(1e-6, h0*1e-3), (0.01/np.where(dmax > 0, dmax, 1))**(1/5))
+    return np.minimum(100*h0, h1)
+
+def dopri5(fun, t0, t1, y0, rtol=1e-6, atol=1e-9, event=None, dense=False, max_steps=100000, first_step=None):
+    """
+    Integrate a batch of independent systems of ODEs, dy/dt = fun(t, y, index),
+    with the explicit Runge-Kutta method of Dormand and Prince (order 5 with an
+    embedded order 4 error estimate). Each system is integrated over its own
+    interval with its own adaptive step size, but the right-hand side is
+    evaluated for all the systems still running at once.
+
+    Arguments:
+        fun (callable): returns dy/dt, an array of shape (m, d), given the times
+            (m,), the states (m, d) and the positions (m,) in the batch of the
+            m systems that are being evaluated
+        t0, t1 (array of n floats): start and end times of each system
+        y0 (array of shape (n, d)): initial states
+    Optional:
+        rtol, atol (float): relative and absolute error tolerances
+        event (callable): event functions g(t, y, index), an array of shape
+            (m, k). A system stops at the first time one of its components
+            changes sign, found on the continuous extension of the step.
+        dense (bool): also return the trajectories of the systems
+        max_steps (int): maximum number of steps per call
+        first_step (array of n floats): initial step sizes, such as the
+            next_step of a previous call. The step is estimated for the
+            systems where it is not positive (or NaN), or if None.
+
+    Returns (t, y, which, next_step): the times reached (t1, or the time of an
+    event), the states at those times, the component of the event function
+    that stopped each system (-1 if none) and the step size each system would
+    have tried next (NaN if it did not move). With dense=True, a DenseOutput
+    of the whole batch is returned as a fifth item.
+
+    """
+    t = np.array(t0, dtype=float)
+    t1 = _broadcast(t1, t.shape)
+    y = np.array(y0, dtype=float)
+    n, d = y.shape
+    which = np.full(n, -1, dtype=int)
+    next_step = np.full(n, np.nan)
+    # the accepted steps as (systems, start times, sizes, start states,
+    # coefficients), after a step of size 0 for every system
+    steps = [(np.arange(n), t.copy(), np.zeros(n), y.copy(), np.zeros((n, 4, d)))] if dense else None
+    index = np.flatnonzero(t1 > t)
+    if not index.size:
+        return _result(t, y, which, next_step, steps)
+    f = fun(t[index], y[index], index)
+
+    if first_step is None:
+        h = np.full(len(index), np.nan)
+    else:
+        h = np.array(_broadcast(first_step, t.shape)[index])
+    if not (h > 0).all():
+        pos = np.flatnonzero(~(h > 0))
+        h[pos] = _initial_step(fun, t[index[pos]], y[index[pos]], f[pos], index[pos], rtol, atol)
+    g = np.array(event(t[index], y[index], index), dtype=float) if event is not None else None
+    for step in range(max_steps):
+        ta, ya, tend = t[index], y[index], t1[index]
+        hh = np.minimum(h, tend - ta)
+        if (ta + hh == ta).any():
+            raise SimulationError("Step size underflow in the ODE solver.")
+        hc = hh[:, None]
+        # stages, combined over the flattened states of the whole batch
+        k = np.empty((7,) + ya.shape)
+        flat = k.reshape(7, -1)
+        k[0] = f
+        for i in range(1, 6):
+            k[i] = fun(ta + _C[i]*hh, ya + hc*np.dot(_A_ROWS[i], flat[:i]).reshape(ya.shape), index)
+        ynew = ya + hc*np.dot(_B_ROW, flat[:6]).reshape(ya.shape)
+        last = hh == tend - ta
+        tnew = np.where(last, tend, ta + hh)
+        fnew = fun(tnew, ynew, index)
+        k[6] = fnew
+        err = hc*np.dot(_E_ROW, flat).reshape(ya.shape)
+        scale = atol + rtol*np.maximum(np.abs(ya), np.abs(ynew))
+        err_norm = _rms_norm(err/scale)
+        accept = err_norm <= 1
+        factor = np.minimum(_MAX_FACTOR, _SAFETY*np.maximum(err_norm, 1e-10)**-0.2)
+        factor = np.maximum(_MIN_FACTOR, np.where(accept, factor, np.minimum(1, factor)))
+        h_tried, h = h, hh*factor
+
+        stopped = np.zeros(len(index), dtype=bool)
+        pos = np.flatnonzero(accept)
+        if pos.size and (dense or event is not None):
+            # coefficients of the continuous extension of the accepted steps
+            q = np.tensordot(_P_MATRIX, k[:, pos], axes=(0, 0)).transpose(1, 0, 2)
+            hq = hh[pos]
+            if event is not None:
+                gnew = np.array(event(tnew[pos], ynew[pos], index[pos]), dtype=float)
+                c = np.flatnonzero(_crossed(g[pos], gnew))
+                if c.size:
+                    # bisect the continuous extension for the first sign change
+                    rows = pos[c]
+                    g0, yc, hq0, qc = g[rows], ya[rows], hq[c], q[c]
+                    lo, hi = np.zeros(c.size), np.ones(c.size)
+                    for i in range(_BISECTIONS):
+                        mid = 0.5*(lo + hi)
+                        past = _crossed(g0, event(ta[rows] + mid*hq0, _extension(yc, hq0, qc, mid), index[rows]))
+                        hi = np.where(past, mid, hi)
+                        lo = np.where(past, lo, mid)
+                    # stop at the crossing, cutting the step short there
+                    tnew[rows] = ta[rows] + hi*hq0
+                    ynew[rows] = _extension(yc, hq0, qc, hi)
+                    hq[c] = hi*hq0
+                    q[c] *= (hi[:, None]**np.arange(4))[:, :, None]
+                    gstop = event(tnew[rows], ynew[rows], index[rows])
+                    crossing = (g0 != 0) & (np.sign(gstop) != np.sign(g0))
+                    which[index[rows]] = np.argmax(crossing, axis=1)
+                    stopped[rows] = True
+                g[pos] = gnew
+            if dense:
+                steps.append((index[pos], ta[pos], hq, ya[pos], q))
+
+        # advance the systems whose step was accepted
+        acc = index[accept]
+        t[acc] = tnew[accept]
+        y[acc] = ynew[accept]
+        f = np.where(accept[:, None], fnew, f)
+        running = ~(stopped | (accept & last))
+        # a step cut short at the end does not limit the next one
+        done = np.flatnonzero(~running)
+        next_step[index[done]] = np.where(last, np.maximum(h, h_tried), h)[done]
+        if not running.any():
+            return _result(t, y, which, next_step, steps)
+        index, f, h = index[running], f[running], h[running]
+        if g is not None:
+            g = g[running]
+    raise SimulationError("Maximum number of steps exceeded in the ODE solver.")
+
+def _result(t, y, which, next_step, steps):
+    if steps is None:
+        return t, y, which, next_step
+    # sort the accepted steps by system, keeping each system's in time order
+    systems = np.concatenate([s[0] for s in steps])
+    order = np.argsort(systems, kind='stable')
+    stop = np.cumsum(np.bincount(systems, minlength=len(t)))
+    start = np.concatenate([[0], stop[:-1]])
+    arrays = [np.concatenate([s[i] for s in steps])[order] for i in range(1, 5)]
+    return t, y, which, next_step, DenseOutput(*arrays, start=start, stop=stop)
+
+
+class DenseOutput(object):
+    """
+    Trajectories of a batch of systems integrated by dopri5(), evaluated with
+    the continuous extension of order 4 of the steps. The steps of all the
+    systems are kept in flat arrays, those of system i at the positions
+    start[i]:stop[i], in time order.
+
+    Attributes:
+        t, h (arrays of floats): start times and sizes of the steps
+        y (array of shape (s, d)): states at the start of the steps
+        q (array of shape (s, 4, d)): coefficients of the continuous extension
+        start, stop (arrays of n ints)
+
+    """
+    def __init__(self, t, h, y, q, start, stop):
+        self.t = t
+        self.h = h
+        self.y = y
+        self.q = q
+        self.start = np.asarray(start, dtype=np.intp)
+        self.stop = np.asarray(stop, dtype=np.intp)
+        self._lists = None
+
+    def __len__(self):
+        return len(self.start)
+
+    def __call__(self, time, index=None):
+        """
+        Evaluate the systems at the given positions in the batch (all of them
+        by default) at the given times, one per system. A time outside of the
+        range of a trajectory gives its first or last state. Returns an array
+        of shape (m, d).
+
+        """
+        index = np.arange(len(self.start)) if index is None else np.asarray(index, dtype=np.intp)
+        time = np.broadcast_to(np.asarray(time, dtype=float), index.shape)
+        t = self.t
+        first = self.start[index]
+        # bisect each trajectory for its last step starting at or before the time
+        lo, hi = first, self.stop[index]
+        while True:
+            active = lo < hi
+            if not active.any():
+                break
+            mid = (lo + hi)//2
+            after = t[np.minimum(mid, len(t) - 1)] > time
+            hi = np.where(active & after, mid, hi)
+            lo = np.where(active & ~after, mid + 1, lo)
+        k = np.maximum(lo - 1, first)
+        h = self.h[k]
+        s = np.clip((time - t[k])/np.where(h > 0, h, 1), 0, 1)
+        return _extension(self.y[k], h, self.q[k], s)
+
+    def at(self, time, i):
+        """
+        Evaluate system i at a single time. This is the cheaper call for one
+        system. Returns a list.
+
+        """
+        if self._lists is None:
+            # the coefficients of each step grouped by component
+            self._lists = (self.t.tolist(), self.h.tolist(), self.y.tolist(),
+                           self.q.transpose(0, 2, 1).tolist(), self.start.tolist(), self.stop.tolist())
+        ts, hs, ys, qs, start, stop = self._lists
+        lo = start[i]
+        k = bisect.bisect_right(ts, time, lo, stop[i]) - 1
+        if k < lo:
+            k = lo
+        h = hs[k]
+        s = (time - ts[k])/h if h > 0 else 0.0
+        s = 0.0 if s < 0 else 1.0 if s > 1 else s
+        hs_k = h*s
+        return [y0 + hs_k*(a + s*(b + s*(c + s*e))) for y0, (a, b, c, e) in zip(ys[k], qs[k])]
+
+
+#-------------------------------------------------------------------------------
+# Continuous dynamics of agent state variables
+
+def _next_horizon(world):
+    """
+    Return the time of the next world event that is not an observer. The
+    observers do not change the world, so the agents' trajectories go on
+    across them.
+
+    """
+    scheduler = getattr(world, '_scheduler', None)
+    if scheduler is None:
+        return np.inf
+    return min([scheduler[channel] for channel in scheduler if not channel._observer] or [np.inf])
+
+
+class _Parameters(object):
+    """
+    Values of the agent state variables read by the right-hand side of an ODE
+    channel, for the systems being evaluated.
+
+    """
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._values[name][self._index]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class _Batch(object):
+    """
+    The trajectories of a batch of agents, integrated together by an ODE
+    channel. Row i starts at time t0[i] in the state y0[i], with the values
+    of the agent variables read by the right-hand side (also kept as the rows
+    of inputs, to tell whether an agent's have changed). The batch is
+    integrated when first needed (see ODEChannel._solve): until then, dense
+    is None. Row i then ends at tend[i] in the state yend[i], at the horizon
+    or at the crossing of threshold which[i] (-1 if none). A batch goes on
+    as its successor, and starts again after a world event as its renewal.
+
+    """
+    def __init__(self, t0, y0, values, inputs, first_step, frozen=None):
+        self.t0 = t0
+        self.y0 = y0
+        self.values = values
+        self.inputs = inputs
+        self.first_step = first_step
+        # the rows that do not move, having stopped at a threshold
+        self.frozen = frozen
+        self.dense = None
+        self.tend = None
+        self.yend = None
+        self.which = None
+        self.next_step = None
+        self.successor = None
+        self.renewal = None
+        self._input_rows = None
+
+    def inputRow(self, row):
+        if self._input_rows is None:
+            self._input_rows = self.inputs.tolist()
+        return self._input_rows[row]
+
+
+class ODEChannel(VectorAgentChannel):
+    """
+    Agent channel that integrates a system of ordinary differential equations
+    for some of the agent state variables with an adaptive Runge-Kutta method
+    (Dormand-Prince 5(4), see dopri5).
+
+    Subclasses implement derivatives(t, y, params, world), which returns dy/dt
+    for a batch of agents: t has shape (m,), y has shape (m, d) with one column
+    per variable in varnames, and the attributes of params are arrays of the
+    agent state variables listed in parameters. The right-hand side may also
+    read world state variables, which are constant between world events: a
+    world channel that changes them should list this channel as a dependent,
+    unless it is a sync channel without thresholds. To couple the agents back
+    to the world, read the agent variables, or an aggregate of them (see
+    Model.addAggregate), from a world channel.
+
+    The agents the channel is fired for together, such as all the agents
+    brought up to a world event by a sync channel, start a batch. The batch
+    is integrated once, when one of its agents first needs it, up to the
+    next world event that is not an observer (or tstep ahead, if there is
+    none). Later firings for its agents up to that time, on their own or
+    together, interpolate its dense output. A sync channel is thus
+    integrated once per world event for all the agents, under both
+    simulators. An agent whose variables or parameters were changed by
+    another channel is integrated on its own from its new state, up to the
+    same horizon. An agent fired back to an earlier time, as AMSimulator
+    does with the agents that passed a barrier, goes back along its
+    trajectory.
+
+    The channel fires every tstep, or only when it is synchronized or fired
+    by other channels if tstep is inf. Threshold events are given as
+    (varname, threshold) pairs, where threshold is a number or the name of
+    an agent state variable. If a variable reaches its threshold before the
+    end of the step, the channel fires at the crossing and sets the variable
+    to the threshold, so that dependent channels (e.g. a division channel)
+    can test for it. A channel that changes the variables or parameters
+    should list this channel as a dependent, so that the crossing is
+    located again.
+
+    The advance() method can be given as the advance function of an
+    observer (see cps.channel.ObserverChannel).
+
+    """
+    def __init__(self, varnames, tstep, parameters=(), thresholds=(), rtol=1e-6, atol=1e-9):
+        self.varnames = tuple(varnames)
+        self.parameters = tuple(parameters)
+        self.thresholds = [(name, threshold) for name, threshold in thresholds]
+        for name, threshold in self.thresholds:
+            if name not in self.varnames:
+                raise ValueError("Threshold on '%s', which is not integrated by the channel." % name)
+        if self.thresholds and not tstep < np.inf:
+            raise ValueError("A channel with thresholds needs a finite tstep.")
+        self.tstep = tstep
+        self.rtol = rtol
+        self.atol = atol
+        self.writes = self.varnames
+        # the agent state variables the trajectory depends on, besides varnames
+        self._inputs = self.parameters + tuple([threshold for name, threshold in self.thresholds
+                                                if isinstance(threshold, str) and threshold not in self.parameters])
+        # (batch, row) of the agent's trajectory, and the (time, state) in
+        # which the channel last left the agent
+        self._trajectory = None
+        self._state = None
+
+    def derivatives(self, t, y, params, world):
+        # return dy/dt, an array of shape (m, d)
+        raise NotImplementedError
+
+    def scheduleEvent(self, agent, world, time, source=None):
+        if isinstance(agent, AgentBatch):
+            # the batch was started when it was fired
+            if not self.thresholds:
+                return time + self.tstep
+            times = self._times(agent, time)
+            return self._until(self._channels(agent), times, times + self.tstep, world)
+        cached = self._lookup(agent, time)
+        if cached is not None and source is world:
+            cached = self._renew(cached, world, time)
+        if not self.thresholds:
+            return time + self.tstep
+        if cached is None:
+            y0, values = self._gatherOne(agent)
+            self._begin([self], np.array([time]), y0, values, np.array([self._nextStep()]))
+        return self._until([self], np.array([time]), np.array([time + self.tstep]), world)[0].item()
+
+    def fireEvent(self, agent, world, time, event_time, **kwargs):
+        if not isinstance(agent, AgentBatch):
+            return self._fireOne(agent, world, time, event_time)
+        batch = agent
+        n = len(batch)
+        t0 = self._times(batch, time)
+        t1 = self._times(batch, event_time)
+        y0, values = self._gather(batch)
+        channels = self._channels(batch)
+        y = np.empty_like(y0)
+        which = np.full(n, -1, dtype=int)
+        # follow the trajectories that go on from the agents' states, a batch
+        # at a time
+        times, states = t0.tolist(), y0.tolist()
+        inputs = self._inputValues(values, n).tolist() if self._inputs else None
+        groups = {}
+        missed = []
+        for pos, channel in enumerate(channels):
+            cached = channel._trajectory
+            if (cached is None or channel._state != (times[pos], states[pos])
+                    or (inputs is not None and cached[0].inputRow(cached[1]) != inputs[pos])):
+                missed.append(pos)
+                continue
+            group = groups.get(id(cached[0]))
+            if group is None:
+                group = groups[id(cached[0])] = (cached[0], [], [])
+            group[1].append(pos)
+            group[2].append(cached[1])
+        # the agents fired before the end of their trajectory carry on along it
+        held = {}
+        for trajectories, pos, rows in groups.values():
+            pos, rows = np.array(pos), np.array(rows)
+            y[pos], which[pos], reached = self._evaluate(trajectories, rows, t1[pos], world)
+            for p, row, holder in zip(pos.tolist(), rows.tolist(), reached):
+                if holder is None:
+                    missed.append(p)
+                elif which[p] < 0 and t1[p] < holder.tend[row]:
+                    held[p] = (holder, row)
+        if missed:
+            # integrate the other agents directly
+            missed = np.array(sorted(missed))
+            rows = dict([(name, v[missed]) for name, v in values.items()])
+            first_step = np.array([channels[p]._nextStep() for p in missed])
+            y[missed] = self._integrate(y0[missed], rows, world, t0[missed], t1[missed], first_step)[1]
+            which[missed] = -1
+
+        # set the variables that reached a threshold onto it
+        for i, (name, threshold) in enumerate(self.thresholds):
+            at = which == i
+            if at.any():
+                y[at, self.varnames.index(name)] = self._thresholdValues(values, threshold, n)[at]
+        for j, name in enumerate(self.varnames):
+            setattr(batch, name, y[:, j])
+        # the others go on together, on a new batch
+        if len(held) < n:
+            new = [p for p in range(n) if p not in held]
+            first_step = np.array([channels[p]._nextStep() for p in new])
+            new = np.array(new)
+            self._begin([channels[p] for p in new], t1[new], y[new],
+                        dict([(name, v[new]) for name, v in values.items()]), first_step)
+        if held:
+            times, states = t1.tolist(), y.tolist()
+            for p, cached in held.items():
+                channel = channels[p]
+                channel._trajectory = cached
+                channel._state = (times[p], states[p])
+        return True
+
+    def advance(self, agent, world, time, event_time):
+        """
+        Return the values of the integrated variables of an agent at
+        event_time, going on from its state at time, as a dict. The agent is
+        not changed.
+
+        """
+        channel = agent._scheduler.getChannel(self._id)
+        cached = channel._lookup(agent, time)
+        trajectories = self._reach(cached[0], cached[1], event_time, world) if cached is not None else None
+        if trajectories is not None:
+            y = trajectories.dense.at(event_time, cached[1])
+        else:
+            y0, values = self._gatherOne(agent)
+            y = self._integrate(y0, values, world, np.array([time]), np.array([event_time]),
+                                np.array([channel._nextStep()]))[1][0].tolist()
+        return dict(zip(self.varnames, y))
+
+    def _fireOne(self, agent, world, time, event_time):
+        # fireEvent() for a single agent, e.g. as a nested or sync channel
+        cached = self._lookup(agent, time)
+        if cached is None:
+            y0, values = self._gatherOne(agent)
+            self._begin([self], np.array([time]), y0, values, np.array([self._nextStep()]))
+            cached = self._trajectory
+        trajectories, row = cached
+        trajectories = self._reach(trajectories, row, event_time, world)
+        which = -1
+        if trajectories is None:
+            # the trajectory stopped at a threshold before the event time, or
+            # the agent is taken back before its start
+            y0, values = self._gatherOne(agent)
+            y = self._integrate(y0, values, world, np.array([time]), np.array([event_time]),
+                                np.array([self._nextStep()]))[1][0].tolist()
+        else:
+            y = trajectories.dense.at(event_time, row)
+            if event_time >= trajectories.tend[row]:
+                which = trajectories.which[row]
+        if which >= 0:
+            name, threshold = self.thresholds[which]
+            y[self.varnames.index(name)] = getattr(agent, threshold) if isinstance(threshold, str) else threshold
+        for name, value in zip(self.varnames, y):
+            setattr(agent, name, value)
+        self._trajectory = (trajectories, row) if trajectories is not None else None
+        self._state = (event_time, y)
+        return True
+
+    def _lookup(self, agent, time):
+        # the agent's (batch, row), if its trajectory goes on from the agent's
+        # state at the time
+        cached = self._trajectory
+        if cached is None or self._state != (time, [getattr(agent, name) for name in self.varnames]):
+            return None
+        if self._inputs and [getattr(agent, name) for name in self._inputs] != cached[0].inputRow(cached[1]):
+            return None
+        return cached
+
+    def _nextStep(self):
+        # the step size to carry on with from the agent's last integration
+        cached = self._trajectory
+        if cached is None:
+            return np.nan
+        trajectories, row = cached
+        if trajectories.next_step is None:
+            return trajectories.first_step[row]
+        return trajectories.next_step[row]
+
+    def _begin(self, channels, t0, y0, values, first_step):
+        # start the agents of the channels on a new batch
+        trajectories = _Batch(t0, y0, values, self._inputValues(values, len(t0)), first_step)
+        for row, (channel, time, state) in enumerate(zip(channels, t0.tolist(), y0.tolist())):
+            channel._trajectory = (trajectories, row)
+            channel._state = (time, state)
+
+    def _renew(self, cached, world, time):
+        # after the world changed, start the agents of a batch again from the
+        # start of the batch, together
+        trajectories, row = cached
+        if trajectories.dense is None:
+            # not integrated yet: it will read the new world state
+            return cached
+        if trajectories.t0[row] != time:
+            self._trajectory = None
+            return None
+        key = (world._curr_channel, world._time)
+        if trajectories.renewal is None or trajectories.renewal[0] != key:
+            renewal = _Batch(trajectories.t0, trajectories.y0, trajectories.values, trajectories.inputs,
+                             trajectories.first_step)
+            trajectories.renewal = (key, renewal)
+        self._trajectory = (trajectories.renewal[1], row)
+        return self._trajectory
+
+    def _solve(self, trajectories, world, time):
+        # integrate a batch up to the horizon, or up to the time if later
+        t0 = trajectories.t0
+        t1 = np.maximum(self._horizon(world, t0), time)
+        if trajectories.frozen is not None:
+            t1 = np.where(trajectories.frozen, t0, t1)
+        tend, yend, which, next_step, dense = self._integrate(
+            trajectories.y0, trajectories.values, world, t0, t1, trajectories.first_step, events=True, dense=True)
+        trajectories.tend = tend
+        trajectories.yend = yend
+        trajectories.which = which
+        trajectories.dense = dense
+        # a system that did not move has no step size to pass on
+        trajectories.next_step = np.where(next_step > 0, next_step, trajectories.first_step)
+
+    def _horizon(self, world, t0):
+        # the next world event that may change the world, after which a sync
+        # channel starts a new batch, or else tstep ahead (no further than
+        # needed if tstep is inf)
+        tnext = _next_horizon(world)
+        tstep = self.tstep if self.tstep < np.inf else 0.0
+        return np.where((t0 < tnext) & (tnext < np.inf), tnext, t0 + tstep)
+
+    def _extend(self, trajectories):
+        # the batch that goes on from the end of a batch
+        if trajectories.successor is None:
+            trajectories.successor = _Batch(trajectories.tend, trajectories.yend, trajectories.values,
+                                            trajectories.inputs, trajectories.next_step, trajectories.which >= 0)
+        return trajectories.successor
+
+    def _reach(self, trajectories, row, time, world):
+        # the batch that holds a row's trajectory at the time, integrating as
+        # needed, or None if the row stopped at a threshold before or starts
+        # after the time
+        if time < trajectories.t0[row]:
+            return None
+        while True:
+            if trajectories.dense is None:
+                self._solve(trajectories, world, time)
+            if time <= trajectories.tend[row]:
+                return trajectories
+            if trajectories.which[row] >= 0:
+                return None
+            trajectories = self._extend(trajectories)
+
+    def _evaluate(self, trajectories, rows, times, world):
+        # _reach() for rows of a batch: their states at the times, the
+        # threshold each one is at (-1 if none), and the batch that holds each
+        # one's trajectory at its time (None if it stopped before or starts
+        # after it)
+        y = np.empty((len(rows), len(self.varnames)))
+        which = np.full(len(rows), -1, dtype=int)
+        reached = [None]*len(rows)
+        left = np.arange(len(rows))
+        while left.size:
+            if trajectories.dense is None:
+                self._solve(trajectories, world, times[left].max())
+            r, t = rows[left], times[left]
+            tend = trajectories.tend[r]
+            inside = (t <= tend) & (t >= trajectories.t0[r])
+            at = left[inside]
+            y[at] = trajectories.dense(t[inside], r[inside])
+            which[at] = np.where(t[inside] >= tend[inside], trajectories.which[r[inside]], -1)
+            for k in at.tolist():
+                reached[k] = trajectories
+            left = left[(t > tend) & (trajectories.which[r] < 0)]
+            if left.size:
+                trajectories = self._extend(trajectories)
+        return y, which, reached
+
+    def _until(self, channels, time, tstop, world):
+        # the times after time at which the agents' trajectories cross a
+        # threshold, or tstop if they do not before
+        result = np.array(tstop, dtype=float)
+        groups = {}
+        for pos, channel in enumerate(channels):
+            trajectories, row = channel._trajectory
+            group = groups.get(id(trajectories))
+            if group is None:
+                group = groups[id(trajectories)] = (trajectories, [], [])
+            group[1].append(pos)
+            group[2].append(row)
+        for trajectories, pos, rows in groups.values():
+            pos, rows = np.array(pos), np.array(rows)
+            while pos.size:
+                if trajectories.dense is None:
+                    self._solve(trajectories, world, tstop[pos].max())
+                tend = trajectories.tend[rows]
+                hit = trajectories.which[rows] >= 0
+                # a threshold the agent was stopped at is not crossed again
+                ahead = hit & (tend > time[pos])
+                result[pos[ahead]] = np.minimum(tend[ahead], tstop[pos[ahead]])
+                more = ~hit & (tend < tstop[pos])
+                pos, rows = pos[more], rows[more]
+                if pos.size:
+                    trajectories = self._extend(trajectories)
+        return result
+
+    def _channels(self, batch):
+        # the instance of this channel belonging to each agent of the batch
+        return [agent._scheduler.getChannel(self._id) for agent in batch]
+
+    def _times(self, batch, time):
+        return np.array(np.broadcast_to(np.asarray(time, dtype=float), (len(batch),)))
+
+    def _gather(self, batch):
+        n = len(batch)
+        y0 = np.column_stack([np.asarray(getattr(batch, name), dtype=float).reshape(n) for name in self.varnames])
+        values = dict([(name, np.asarray(getattr(batch, name)).reshape(n)) for name in self._inputs])
+        return y0, values
+
+    def _gatherOne(self, agent):
+        y0 = np.array([[getattr(agent, name) for name in self.varnames]], dtype=float)
+        values = dict([(name, np.array([getattr(agent, name)])) for name in self._inputs])
+        return y0, values
+
+    def _inputValues(self, values, n):
+        # the inputs of each agent, as a row
+        if not self._inputs:
+            return np.empty((n, 0))
+        return np.column_stack([np.asarray(values[name], dtype=float) for name in self._inputs])
+
+    def _thresholdValues(self, values, threshold, n):
+        if isinstance(threshold, str):
+            return np.asarray(values[threshold], dtype=float)
+        return np.full(n, threshold, dtype=float)
+
+    def _integrate(self, y0, values, world, t0, t1, first_step, events=False, dense=False):
+        derivatives = self.derivatives
+        def fun(t, y, index):
+            return np.asarray(derivatives(t, y, _Parameters(values, index), world), dtype=float).reshape(y.shape)
+        back = t1 < t0
+        if back.any() and not (events or dense):
+            # the asynchronous simulator takes an agent that has passed a
+            # barrier back to it: integrate those systems backwards in time
+            y1 = np.array(y0, dtype=float)
+            ahead, back = np.flatnonzero(~back), np.flatnonzero(back)
+            def forward(t, y, index):
+                return fun(t, y, ahead[index])
+            def reverse(t, y, index):
+                return -fun(-t, y, back[index])
+            if ahead.size:
+                y1[ahead] = dopri5(forward, t0[ahead], t1[ahead], y0[ahead], self.rtol, self.atol,
+                                   first_step=first_step[ahead])[1]
+            y1[back] = dopri5(reverse, -t0[back], -t1[back], y0[back], self.rtol, self.atol)[1]
+            return t1, y1, np.full(len(t1), -1, dtype=int), np.full(len(t1), np.nan)
+        event = None
+        if events and self.thresholds:
+            columns = [self.varnames.index(name) for name, threshold in self.thresholds]
+            thr = np.column_stack([self._thresholdValues(values, threshold, len(y0)) for name, threshold in self.thresholds])
+            def threshold_event(t, y, index):
+                return y[:, columns] - thr[index]
+            event = threshold_event
+        return dopri5(fun, t0, t1, y0, self.rtol, self.atol, event, dense, first_step=first_step)
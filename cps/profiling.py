@@ -0,0 +1,294 @@
+"""
+Name:        profiling
+
+Author:      Nezar Abdennur <nabdennur@gmail.com>
+Created:     17/10/2026
+Copyright:   (c) Nezar Abdennur 2012
+
+"""
+from cps.channel import WorldChannel
+from cps.entity import World
+from cps.state import AgentBatch
+
+from time import perf_counter
+
+#-------------------------------------------------------------------------------
+# Opt-in instrumentation of a running simulation.
+#
+# Profiling works by switching the class of the world, the agents, the channels
+# and the agent queue to instrumented subclasses created on the fly. Clones of
+# agents and channels keep the instrumented class. When profiling is disabled
+# the original classes are restored, so a simulation that is not profiled runs
+# exactly the same code as before.
+
+class ChannelStats(object):
+    """
+    Counters for one channel (summed over all the agents for agent channels).
+
+    Attributes:
+        fires         (int): number of firings (vectorized firings count once
+                             per agent in the batch)
+        nested_fires  (int): number of those firings that were nested
+        modified      (int): number of firings that modified the entity
+        fire_time     (float): seconds spent in fireEvent()
+        schedules     (int): number of calls to scheduleEvent()
+        schedule_time (float): seconds spent in scheduleEvent()
+
+    """
+    __slots__ = ('fires', 'nested_fires', 'modified', 'fire_time', 'schedules', 'schedule_time')
+
+    def __init__(self):
+        self.fires = 0
+        self.nested_fires = 0
+        self.modified = 0
+        self.fire_time = 0.0
+        self.schedules = 0
+        self.schedule_time = 0.0
+
+
+class EntityStats(object):
+    """
+    Counters for the world or for all the agents.
+
+    Attributes:
+        events      (int): number of scheduled channel firings processed
+        event_time  (float): seconds spent processing them (including
+                             rescheduling and processing the agent queue)
+        nested      (int): number of nested firings
+        reschedules (int): number of explicit reschedules (_reschedule)
+        syncs       (int): number of synchronizations
+        sync_time   (float): seconds spent synchronizing
+
+    """
+    __slots__ = ('events', 'event_time', 'nested', 'reschedules', 'syncs', 'sync_time')
+
+    def __init__(self):
+        self.events = 0
+        self.event_time = 0.0
+        self.nested = 0
+        self.reschedules = 0
+        self.syncs = 0
+        self.sync_time = 0.0
+
+
+class QueueStats(object):
+    """
+    Counters for the agent queue.
+
+    Attributes:
+        added      (int): number of agents queued for insertion
+        deleted    (int): number of agents queued for deletion
+        dequeued   (int): number of entries processed
+        max_length (int): longest the queue has been
+
+    """
+    __slots__ = ('added', 'deleted', 'dequeued', 'max_length')
+
+    def __init__(self):
+        self.added = 0
+        self.deleted = 0
+        self.dequeued = 0
+        self.max_length = 0
+
+
+def _slots_dict(obj):
+    return dict([(name, getattr(obj, name)) for name in obj.__slots__])
+
+
+class _ProfiledChannelMixin(object):
+    def scheduleEvent(self, *args, **kwargs):
+        t0 = perf_counter()
+        event_time = super(_ProfiledChannelMixin, self).scheduleEvent(*args, **kwargs)
+        stats = self._profiler._channelStats(self)
+        stats.schedule_time += perf_counter() - t0
+        stats.schedules += 1
+        return event_time
+
+    def fireEvent(self, entity, *args, **kwargs):
+        t0 = perf_counter()
+        is_modified = super(_ProfiledChannelMixin, self).fireEvent(entity, *args, **kwargs)
+        stats = self._profiler._channelStats(self)
+        stats.fire_time += perf_counter() - t0
+        if type(entity) is AgentBatch:
+            stats.fires += len(entity)
+            if hasattr(is_modified, '__len__') and not isinstance(is_modified, (set, frozenset)):
+                stats.modified += int(sum(is_modified))
+            else:
+                stats.modified += len(entity)*bool(is_modified)
+        else:
+            stats.fires += 1
+            stats.modified += bool(is_modified)
+        return is_modified
+
+
+class _ProfiledEntityMixin(object):
+    def _processNextChannel(self):
+        t0 = perf_counter()
+        super(_ProfiledEntityMixin, self)._processNextChannel()
+        stats = self._profiler._entityStats(self)
+        stats.event_time += perf_counter() - t0
+        stats.events += 1
+
+    def _fireNested(self, channel, *args, **kwargs):
+        self._profiler._entityStats(self).nested += 1
+        self._profiler._channelStats(channel).nested_fires += 1
+        return super(_ProfiledEntityMixin, self)._fireNested(channel, *args, **kwargs)
+
+    def _reschedule(self, *args, **kwargs):
+        self._profiler._entityStats(self).reschedules += 1
+        return super(_ProfiledEntityMixin, self)._reschedule(*args, **kwargs)
+
+    def _synchronize(self, tbarrier, *args, **kwargs):
+        t0 = perf_counter()
+        super(_ProfiledEntityMixin, self)._synchronize(tbarrier, *args, **kwargs)
+        stats = self._profiler._entityStats(self)
+        stats.sync_time += perf_counter() - t0
+        stats.syncs += 1
+
+
+class _ProfiledQueueMixin(object):
+    def enqueue(self, action, agent, priority_key):
+        super(_ProfiledQueueMixin, self).enqueue(action, agent, priority_key)
+        stats = self._profiler.queue
+        if action == self.ADD_AGENT:
+            stats.added += 1
+        else:
+            stats.deleted += 1
+        if len(self.heap) > stats.max_length:
+            stats.max_length = len(self.heap)
+
+    def dequeue(self):
+        entry = super(_ProfiledQueueMixin, self).dequeue()
+        self._profiler.queue.dequeued += 1
+        return entry
+
+
+class Profiler(object):
+    """
+    Collects per-channel, per-entity and agent queue statistics of a
+    simulator. Use BaseSimulator.enableProfiling() to create one.
+
+    Attributes:
+        world_channels (dict: channel id -> ChannelStats)
+        agent_channels (dict: channel id -> ChannelStats)
+        world          (EntityStats)
+        agents         (EntityStats)
+        queue          (QueueStats)
+        elapsed        (float): seconds during which profiling was enabled
+
+    """
+    def __init__(self):
+        self.world_channels = {}
+        self.agent_channels = {}
+        self.world = EntityStats()
+        self.agents = EntityStats()
+        self.queue = QueueStats()
+        self.elapsed = 0.0
+        self._t_enabled = None
+        self._types = {}
+
+    def _channelStats(self, channel):
+        table = self.world_channels if isinstance(channel, WorldChannel) else self.agent_channels
+        try:
+            return table[channel._id]
+        except KeyError:
+            stats = table[channel._id] = ChannelStats()
+            return stats
+
+    def _entityStats(self, entity):
+        return self.world if isinstance(entity, World) else self.agents
+
+    def _profiledType(self, base, mixin):
+        try:
+            return self._types[base]
+        except KeyError:
+            type_ = type('Profiled' + base.__name__, (mixin, base),
+                         {'_profiler':self, '_profiled_base':base})
+            self._types[base] = type_
+            return type_
+
+    def _instrument(self, obj, mixin):
+        if '_profiled_base' not in obj.__class__.__dict__:
+            obj.__class__ = self._profiledType(obj.__class__, mixin)
+
+    def _restore(self, obj):
+        base = obj.__class__.__dict__.get('_profiled_base')
+        if base is not None:
+            obj.__class__ = base
+
+    def _objects(self, simulator):
+        # (object, mixin) pairs to instrument
+        yield simulator.agent_queue, _ProfiledQueueMixin
+        for entity in [simulator.world] + list(simulator.agents):
+            yield entity, _ProfiledEntityMixin
+            for channel in entity._scheduler:
+                yield channel, _ProfiledChannelMixin
+
+    def attach(self, simulator):
+        """
+        Start instrumenting a simulator.
+
+        """
+        for obj, mixin in self._objects(simulator):
+            self._instrument(obj, mixin)
+        self._t_enabled = perf_counter()
+
+    def detach(self, simulator):
+        """
+        Stop instrumenting a simulator. The statistics are kept.
+
+        """
+        for obj, mixin in self._objects(simulator):
+            self._restore(obj)
+        if self._t_enabled is not None:
+            self.elapsed += perf_counter() - self._t_enabled
+            self._t_enabled = None
+
+    def report(self):
+        """
+        Return the statistics as a dict of plain values:
+            elapsed        (float)
+            world_channels (dict: channel id -> dict of ChannelStats fields)
+            agent_channels (dict: channel id -> dict of ChannelStats fields)
+            world, agents  (dict of EntityStats fields)
+            agent_queue    (dict of QueueStats fields)
+        Each channel entry also has a fire_rate (firings per second of
+        profiled wall time).
+
+        """
+        elapsed = self.elapsed
+        if self._t_enabled is not None:
+            elapsed += perf_counter() - self._t_enabled
+        report = {'elapsed':elapsed,
+                  'world':_slots_dict(self.world),
+                  'agents':_slots_dict(self.agents),
+                  'agent_queue':_slots_dict(self.queue)}
+        for name in ('world_channels', 'agent_channels'):
+            channels = {}
+            for channel_id, stats in getattr(self, name).items():
+                channels[channel_id] = _slots_dict(stats)
+                channels[channel_id]['fire_rate'] = stats.fires/elapsed if elapsed else 0.0
+            report[name] = channels
+        return report
+
+    def format(self):
+        """
+        Return the channel statistics as a table of text, most costly first.
+
+        """
+        report = self.report()
+        rows = []
+        for kind in ('world', 'agent'):
+            for channel_id, stats in report[kind + '_channels'].items():
+                rows.append((kind, channel_id, stats))
+        rows.sort(key=lambda row: -(row[2]['fire_time'] + row[2]['schedule_time']))
+        lines = ['%-6s %-24s %10s %10s %10s %10s %10s' % ('kind', 'channel', 'fires', 'fire (s)',
+                                                         'schedules', 'sched (s)', 'fires/s')]
+        for kind, channel_id, stats in rows:
+            lines.append('%-6s %-24s %10d %10.3f %10d %10.3f %10.0f' % (kind, channel_id, stats['fires'],
+                         stats['fire_time'], stats['schedules'], stats['schedule_time'], stats['fire_rate']))
+        queue = report['agent_queue']
+        lines.append('agent queue: %d added, %d deleted, %d processed, max length %d' %
+                     (queue['added'], queue['deleted'], queue['dequeued'], queue['max_length']))
+        lines.append('profiled wall time: %.3f s' % report['elapsed'])
+        return '\n'.join(lines)
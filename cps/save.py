@@ -10,6 +10,8 @@ Copyright:   (c) Nezar Abdennur 2012
 # These functions convert recorded data into numpy arrays and save them to disk
 # in hdf5 format.
 
+from cps.logging import ColumnarLoggerNode
+
 def _accumulate(root):
     """
     Traverses logger tree and restructures the simulation data -- for each
@@ -20,6 +22,9 @@ def _accumulate(root):
     Recording scheme originally devised by Andrei Anisenia.
 
     """
+    if isinstance(root, ColumnarLoggerNode):
+        # the data is already in columns
+        return root.accumulate()
     adjacency_list = root.adjacencyList()
     adj_data = []
     time_data = []
@@ -58,6 +63,10 @@ def savemat_lineage(filename, root_node):
 def savemat_snapshot(filename, recorder):
     scipy.io.savemat(filename, recorder.log, oned_as='column')
 
+def savemat_trajectory(filename, trajectory):
+    t, size = trajectory.toarrays()
+    scipy.io.savemat(filename, {'time':t, 'size':size}, oned_as='column')
+
 
 try:
 
@@ -67,7 +76,6 @@ try:
     def savehdf_lineage(filename, root_node):
         sim_data, names = _accumulate(root_node)
         with h5py.File(filename, 'w') as dfile:
-            dfile = h5py.File(filename,'w')
             # Tree adjacency list
             dfile.create_dataset( name='adj_info',
                                   data=np.array(sim_data['adj_info'], dtype=np.bytes_) )
@@ -88,5 +96,11 @@ try:
             for name, data in recorder.log.items():
                 dfile.create_dataset(name=name, data=np.array(data))
 
+    def savehdf_trajectory(filename, trajectory):
+        t, size = trajectory.toarrays()
+        with h5py.File(filename, 'w') as dfile:
+            dfile.create_dataset(name='time', data=t)
+            dfile.create_dataset(name='size', data=size)
+
 except ImportError:
     pass
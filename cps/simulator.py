@@ -6,9 +6,16 @@ Created:     23/04/2012
 Copyright:   (c) Nezar Abdennur 2012
 
 """
-from cps.misc import IndexedPriorityQueue
-from cps.exception import ZeroPopulationError, SimulationError
+from cps.misc import SizeTrajectory, PopulationAggregates
+from cps.channel import WorldChannel
+from cps.exception import ZeroPopulationError, SimulationError, SchedulingError
+from cps.state import AgentSnapshot
+from bisect import bisect_left
+from copy import deepcopy
 import random
+import heapq
+import pickle
+import io
 
 NORMAL = 0
 CONSTANT_NUMBER = 1
@@ -19,15 +26,28 @@ class BaseSimulator(object):
     Base class for simulators.
 
     Attributes:
+        model            (cps.model.Model)
         num_agents       (int)
         num_agents_max   (int)
         world            (cps.entity.World)
-        agents           (list-of-cps.entity.Agent)
+        agents           (cps.misc.AgentCollection of cps.entity.Agent)
         agent_queue      (cps.misc.AgentQueue)
         loggers          (list-of-cps.state.LoggerNode)
         recorders        (list-of-cps.state.Recorder)
+        state_store      (cps.state.AgentStateStore or None)
+        profiler         (cps.profiling.Profiler or None)
+        trajectory       (cps.misc.SizeTrajectory): population size over time
+
+    If the model declares aggregates (see cps.model.Model.addAggregate), they
+    are kept in agents.aggregates (a cps.misc.PopulationAggregates).
+
+    Class attributes:
+        trajectory_interval (float): minimum time between the points of the
+            size trajectory (default 0: record every change)
 
     """
+    trajectory_interval = 0.0
+
     def __init__(self, model, tstart):
         """
         Initialize a simulator according to the specification of the provided
@@ -36,21 +56,38 @@ class BaseSimulator(object):
         """
         from cps.model import create_world, create_agents
 
-        # keep count of agents
-        self.num_agents = model.n0
-        self.num_agents_max = model.nmax
+        self._setup(model)
 
         # create world entity
         self.world = create_world(model, self, tstart)
 
         # create agent entities
-        self.agents = create_agents(model, self, tstart)
+        self.agents = model.AgentCollectionType(create_agents(model, self, tstart))
 
         # loggers
         self.loggers = []
         for i in sorted(model.logged):
             self.loggers.append(self.agents[i]._logger)
 
+        self.initialize()
+
+    def _setup(self, model):
+        """
+        Set up the parts of the simulator that do not depend on the state of
+        the entities.
+
+        """
+        from cps.model import create_state_store
+
+        self.model = model
+
+        # keep count of agents
+        self.num_agents = model.n0
+        self.num_agents_max = model.nmax
+
+        # columnar store for agent state variables (optional)
+        self.state_store = create_state_store(model)
+
         # recorders
         self.recorders = model.recorders
 
@@ -59,14 +96,167 @@ class BaseSimulator(object):
 
         # create queue
         self.agent_queue = model.AgentQueueType()
+        self._timetable_type = model.TimetableType
+
+        # instrumentation (see enableProfiling)
+        self.profiler = None
 
         self._do_sync = any([entry.sync for entry in model.agent_channel_table.values()])
+        self._agent_to_world = any([entry.wc_dependents for entry in model.agent_channel_table.values()])
+        self._vectorized = any([entry.channel._vectorized for entry in model.agent_channel_table.values()])
+        self._vector_sync = [name for name, entry in model.agent_channel_table.items()
+                             if entry.sync and entry.channel._vectorized]
+        self._scalar_sync = any([entry.sync and not entry.channel._vectorized
+                                 for entry in model.agent_channel_table.values()])
 
-        self.initialize()
+        # population aggregates (see _bindAggregates)
+        self._aggregate_table = model.aggregate_table
+        self._aggregates = None
+
+        # agents that left the population, not yet released (see _discardAgent)
+        self._discarded = []
 
     def initialize(self):
         raise NotImplementedError
 
+    def _bindAggregates(self):
+        # track the model's aggregates over the agent collection, once the
+        # agents have been initialized
+        if self._aggregate_table:
+            self._aggregates = PopulationAggregates(self._aggregate_table, self.agents)
+            self.agents.aggregates = self._aggregates
+
+    def _bindTrajectory(self, trajectory):
+        # models read and append to world._ts and world._size directly
+        self.trajectory = trajectory
+        self.world._ts = trajectory.times
+        self.world._size = trajectory.sizes
+
+    def _newTrajectory(self):
+        return SizeTrajectory([self.world._time], [self.num_agents], self.trajectory_interval)
+
+    def _discardAgent(self, agent):
+        # the agent has left the population for good, but it may still be
+        # finishing a firing: what it holds is released by _releaseDiscarded()
+        agent._discard()
+        self._discarded.append(agent)
+
+    def _releaseDiscarded(self):
+        # called when no agent firing is under way
+        discarded, self._discarded = self._discarded, []
+        for agent in discarded:
+            agent._release()
+
+    def _flushRecorders(self):
+        # write out any snapshots buffered by the recorders
+        for recorder in self.recorders:
+            if hasattr(recorder, 'flush'):
+                recorder.flush()
+        # and the lineages pruned by the loggers
+        for logger in self.loggers:
+            if logger._pruner is not None:
+                logger._pruner.flush()
+
+    def _resume(self):
+        """
+        Called in place of initialize() when the state of the simulator has
+        been restored from a checkpoint (see cps.checkpoint).
+
+        """
+        raise NotImplementedError
+
+    def enableProfiling(self):
+        """
+        Start counting channel firings and reschedules and timing the channels,
+        the entities and the agent queue. Returns the cps.profiling.Profiler
+        collecting the statistics. Profiling can be turned on and off several
+        times; the statistics accumulate.
+
+        """
+        from cps.profiling import Profiler
+        if self.profiler is None:
+            self.profiler = Profiler()
+        self.profiler.attach(self)
+        return self.profiler
+
+    def disableProfiling(self):
+        """
+        Stop instrumenting the simulation. The collected statistics remain
+        available in self.profiler.
+
+        """
+        if self.profiler is not None:
+            self.profiler.detach(self)
+
+    def profileReport(self):
+        """
+        Returns the profiler's report (see cps.profiling.Profiler.report) or
+        None if profiling was never enabled.
+
+        """
+        if self.profiler is None:
+            return None
+        return self.profiler.report()
+
+    def _synchronizeAgents(self, agents, tbarrier):
+        """
+        Fire the sync channels of the agents at the barrier. A vectorized sync
+        channel is fired once for all the agents, before the other sync
+        channels are fired agent by agent.
+
+        """
+        if not self._vector_sync:
+            for agent in agents:
+                agent._synchronize(tbarrier)
+            return
+        import numpy as np
+        agents = list(agents)
+        times = [agent._scheduler.clock for agent in agents]
+        for channel_id in self._vector_sync:
+            self._fireVectorChannel(channel_id, agents, np.array(times), tbarrier)
+        if self._scalar_sync:
+            for agent, time in zip(agents, times):
+                agent._synchronize(tbarrier, time, vectorized=False)
+
+    def _fireVectorChannel(self, channel_id, group, times=None, tbarrier=None):
+        """
+        Fire a vectorized channel for a group of agents whose next event
+        belongs to it, then reschedule it for the whole group. If a barrier is
+        given, the channel is fired as a sync channel instead: from the given
+        times up to the barrier.
+
+        """
+        from cps.state import AgentBatch
+        import numpy as np
+        world = self.world
+        n = len(group)
+        channels = [agent._scheduler.getChannel(channel_id) for agent in group]
+        channel = channels[0]
+        batch = AgentBatch(group, self.state_store)
+        if tbarrier is None:
+            times = np.array([agent._scheduler.clock for agent in group])
+            event_times = np.array([c._event_time for c in channels])
+        else:
+            event_times = np.full(n, tbarrier)
+        # fire channel
+        is_modified = channel.fireEvent(batch, world, times, event_times)
+        if channel._new_agents:
+            raise SimulationError("Vectorized channels cannot clone agents.")
+        if isinstance(is_modified, (set, frozenset)):
+            # the names of the state variables written, for every agent
+            is_modified = [is_modified]*n
+        else:
+            is_modified = np.broadcast_to(np.asarray(is_modified, dtype=bool), (n,)).tolist()
+        for agent, event_time in zip(group, event_times.tolist()):
+            agent._scheduler.clock = event_time
+        # reschedule
+        next_times = channel.scheduleEvent(batch, world, event_times, None)
+        next_times = np.broadcast_to(np.asarray(next_times, dtype=float), (n,)).tolist()
+        for agent, c, t, m in zip(group, channels, next_times, is_modified):
+            agent._finishVectorFiring(c, t, m)
+            if m and self._agent_to_world:
+                self._touchWorld(agent, agent._getDependentWCs())
+
     def runSimulation(self, tstop):
         raise NotImplementedError
 
@@ -79,6 +269,18 @@ class BaseSimulator(object):
 # First-Entity (synchronous) Method
 
 class FMSimulator(BaseSimulator):
+    """
+    First-entity method simulator. Entities are kept in a global timetable
+    ordered by their next event time.
+
+    When a world event reschedules at least bulk_update_fraction of the agents
+    in the timetable (and at least bulk_update_min agents), the timetable keys
+    are updated in bulk and the heap is rebuilt in one pass, if the timetable
+    supports it (updateitems).
+
+    """
+    bulk_update_fraction = 0.15
+    bulk_update_min = 64
 
     def initialize(self):
         self._mode = NORMAL if self.num_agents < self.num_agents_max else CONSTANT_NUMBER
@@ -86,13 +288,13 @@ class FMSimulator(BaseSimulator):
                               CONSTANT_NUMBER:self._processAgentConstantNumberMode}
         self.sizethresh_hi = self.num_agents_max
         self.sizethresh_lo = -1
-        self.world._ts = [self.world._time]
-        self.world._size = [self.num_agents]
+        self._bindTrajectory(self._newTrajectory())
         self.nbirths = 0
         self.ndeaths = 0
 
         # initialize state variables with user-defined function
         self.state_initializer(self.world, self.agents)
+        self._bindAggregates()
 
         # schedule simulation channels
         self.world._scheduleAllChannels()
@@ -101,16 +303,21 @@ class FMSimulator(BaseSimulator):
 
         # set up global timetable
         event_times = [agent._next_event_time for agent in self.agents]
-        self.timetable = IndexedPriorityQueue(zip(self.agents, event_times))
+        self.timetable = self._timetable_type(zip(self.agents, event_times))
 
         # TODO: make this better
         for recorder in self.recorders:
             recorder.record(self.world._time, self.world, self.agents)
 
+    def _resume(self):
+        self._processAgent = {NORMAL:self._processAgentNormalMode,
+                              CONSTANT_NUMBER:self._processAgentConstantNumberMode}
+
     def runSimulation(self, tstop):
         world = self.world
         agents = self.agents
         timetable = self.timetable
+        aggregates = self._aggregates
 
         emin, tmin = self._earliestItem()
 
@@ -118,10 +325,18 @@ class FMSimulator(BaseSimulator):
             if emin is world:
                 # fire agent sync channels
                 if self._do_sync:
-                    for agent in agents:
-                        agent._synchronize(tmin)
-                        if agent in timetable:
-                            timetable.updateitem(agent, agent._next_event_time)
+                    bulk = self._bulkUpdate(len(agents))
+                    self._synchronizeAgents(agents, tmin)
+                    if aggregates is not None:
+                        for agent in agents:
+                            aggregates.update(agent)
+                    if bulk:
+                        timetable.updateitems([(agent, agent._next_event_time) for agent in agents
+                                               if agent in timetable])
+                    else:
+                        for agent in agents:
+                            if agent in timetable:
+                                timetable.updateitem(agent, agent._next_event_time)
                     emin, tmin = self._earliestItem()
                     if emin is not world:
                         continue
@@ -131,9 +346,19 @@ class FMSimulator(BaseSimulator):
                 #timetable.updateitem(world, world.next_event_time)
 
                 if world._is_modified:
-                    for agent in agents:
-                        agent._rescheduleFromWorld(world)
-                        timetable.updateitem(agent, agent._next_event_time)
+                    # the world channel may also have written agent variables
+                    if self._bulkUpdate(len(agents)):
+                        for agent in agents:
+                            agent._rescheduleFromWorld(world)
+                            if aggregates is not None:
+                                aggregates.update(agent)
+                        timetable.updateitems([(agent, agent._next_event_time) for agent in agents])
+                    else:
+                        for agent in agents:
+                            agent._rescheduleFromWorld(world)
+                            if aggregates is not None:
+                                aggregates.update(agent)
+                            timetable.updateitem(agent, agent._next_event_time)
 
                 # if world was stopped, terminate simulation
                 if not world._enabled:
@@ -147,21 +372,38 @@ class FMSimulator(BaseSimulator):
             else:
                 # fire next agent channel
                 emin._processNextChannel() #processes queue
+                if aggregates is not None and emin._is_modified:
+                    aggregates.update(emin)
                 if emin in timetable:
                     if not emin._enabled:
                         del timetable[emin]
                     else:
                         timetable.updateitem(emin, emin._next_event_time)
                         if emin._is_modified:
-                            world._rescheduleFromAgent(emin)
+                            world._rescheduleFromAgent(emin, emin._getDependentWCs())
                             #timetable.updateitem(world, world.next_event_time)
 
+            # the firing is over: the agents discarded during it can go
+            if self._discarded:
+                self._releaseDiscarded()
             emin, tmin = self._earliestItem()
 
         self.finalize()
 
     def finalize(self):
-        pass
+        self._releaseDiscarded()
+        self._flushRecorders()
+
+    def _bulkUpdate(self, n):
+        # whether to update n timetable entries in bulk
+        timetable = self.timetable
+        return (n >= self.bulk_update_min
+                and n >= self.bulk_update_fraction*len(timetable)
+                and hasattr(timetable, 'updateitems'))
+
+    def _touchWorld(self, agent, wchannels):
+        # reschedule the world channels that depend on this agent's last firing
+        self.world._rescheduleFromAgent(agent, wchannels)
 
     def _earliestItem(self):
         world, t_world = self.world, self.world._next_event_time
@@ -173,7 +415,9 @@ class FMSimulator(BaseSimulator):
 
     def _processAgentQueue(self):
         q = self.agent_queue
-        size = self.world._size[-1]
+        if not q:
+            return
+        size = self.trajectory.sizes[-1]
         while q:
             action, agent = q.dequeue()
             size += self._processAgent[self._mode](action, agent)
@@ -184,8 +428,7 @@ class FMSimulator(BaseSimulator):
             elif self._mode == CONSTANT_NUMBER and size <= self.sizethresh_lo:
                 size = self.self.sizethresh_lo
                 self._mode = NORMAL
-        self.world._ts.append( self.world._time )
-        self.world._size.append( size )
+        self.trajectory.record(self.world._time, size)
 
     def _processAgentNormalMode(self, action, agent):
         agents = self.agents
@@ -206,6 +449,7 @@ class FMSimulator(BaseSimulator):
             except ValueError:
                 raise SimulationError("Agent not found.")
             timetable.pop(target)
+            self._discardAgent(target)
             self.num_agents -= 1
             # Raise error if sample population crashes
             if self.num_agents == 0:
@@ -230,6 +474,7 @@ class FMSimulator(BaseSimulator):
                 timetable.replaceitem(target, new_agent, new_agent._next_event_time)
             except KeyError:
                 timetable.add(new_agent, new_agent._next_event_time) #target may be inactivated and no longer in the ipq
+            self._discardAgent(target)
             del target
             self.nbirths += 1
             return world._size[-1]/self.num_agents_max
@@ -252,6 +497,7 @@ class FMSimulator(BaseSimulator):
             agents[i_target] = new_agent
             if new_agent._enabled:
                 timetable.replaceitem(target, new_agent, new_agent._next_event_time) #will fail if cell is killed twice!
+            self._discardAgent(target)
             del target
             self.ndeaths += 1
             return -(world._size[-1]/self.num_agents_max)
@@ -263,26 +509,136 @@ class FMSimulator(BaseSimulator):
 #-------------------------------------------------------------------------------
 # Asynchronous Method
 
+class _DeferredObservations(object):
+    """
+    The observer firings that AMSimulator defers until the agents have been
+    advanced past them, and the snapshots of the agents taken for them.
+
+    An agent that does not fire between observation times leaves the same
+    snapshot at each of them, so the snapshots for the observers without an
+    advance function are kept as changes: the snapshots that take effect and
+    the agents that leave at each observation time.
+
+    Attributes:
+        firings  (list of (time, channel, next_time)): in order of firing
+        times    (list of float): the distinct observation times, in order
+        plain    (bool): whether any of the observers has no advance function
+        starts   (list of list of (agent, AgentSnapshot)): the snapshots that
+                 take effect at each observation time
+        ends     (list of list of agent): the agents that are removed from the
+                 population before each observation time
+        advanced (list of list of (advance, dict: agent -> AgentSnapshot)):
+                 the snapshots taken at each observation time for each of the
+                 advance functions of the observers due then
+        cursor   (dict: agent -> int): the index of the next observation time
+                 of each agent, if it is not the first
+
+    """
+    def __init__(self, firings):
+        self.firings = firings
+        self.times = sorted(set([time for time, channel, next_time in firings]))
+        self.plain = False
+        self.starts = [[] for time in self.times]
+        self.ends = [[] for time in self.times]
+        self.advanced = [[] for time in self.times]
+        for time, channel, next_time in firings:
+            advance = getattr(channel, 'advance', None)
+            if advance is None:
+                self.plain = True
+            else:
+                k = bisect_left(self.times, time)
+                if advance not in [a for a, snapshots in self.advanced[k]]:
+                    self.advanced[k].append((advance, {}))
+        self.cursor = {}
+
+    def born(self, agent):
+        # a new agent is only observed at or after the time it was born
+        self.cursor[agent] = bisect_left(self.times, agent._time)
+
+    def removed(self, agent):
+        # an agent removed from the population is no longer observed after
+        # the time it was killed
+        k = bisect_left(self.times, agent._time)
+        if k < len(self.times):
+            self.ends[k].append(agent)
+        for advanced in self.advanced[k:]:
+            for advance, snapshots in advanced:
+                snapshots.pop(agent, None)
+
+    def observed(self):
+        """
+        Yield the firings in order, each with the snapshots it observes.
+
+        """
+        times = self.times
+        current = {}
+        k = 0
+        for time, channel, next_time in self.firings:
+            i = bisect_left(times, time)
+            while k <= i:
+                for agent, snapshot in self.starts[k]:
+                    current[agent] = snapshot
+                for agent in self.ends[k]:
+                    current.pop(agent, None)
+                k += 1
+            advance = getattr(channel, 'advance', None)
+            if advance is None:
+                agents = list(current.values())
+            else:
+                agents = [list(snapshots.values()) for a, snapshots in self.advanced[i] if a == advance][0]
+            yield time, channel, next_time, agents
+
+
 class AMSimulator(BaseSimulator):
+    """
+    Asynchronous method simulator. Agents are advanced independently of each
+    other up to the next world event (a barrier), where births and deaths are
+    processed and the world channel fires.
+
+    If defer_observers is True (the default), observer channels (see
+    cps.channel.ObserverChannel) do not make barriers. The agents are advanced
+    straight to the next world event that is not an observer, and each agent
+    leaves a snapshot of its state (a cps.state.AgentSnapshot) at each
+    observation time it passes. The observers are then fired in turn, each
+    on the snapshots taken at its observation time. The snapshots hold the
+    values that the observer's advance() gives instead of the agent's own.
+
+    Observers make light barriers instead in constant-number mode, where the
+    barriers bring the population back to num_agents_max, and in models whose
+    agent channels reschedule world channels, since the agents could bring the
+    next world event before the observation times. The agents are then
+    advanced to the observation time and observed there, but they are not
+    synchronized and are not rescheduled after the observation. If
+    defer_observers is False, observers make full barriers.
+
+    """
+    defer_observers = True
 
     def initialize(self):
         self._mode = NORMAL if self.num_agents < self.num_agents_max else CONSTANT_NUMBER
         self.sizethresh_hi = self.num_agents_max
         self.sizethresh_lo = -1
-        self.world._ts = [self.world._time]
-        self.world._size = [self.num_agents]
+        self._bindTrajectory(self._newTrajectory())
         self.nbirths = 0
         self.ndeaths = 0
         self._replaced = set()
+        self._touched = {}
+        self._deferred = None
 
         # Apply user-defined initialization function.
         self.state_initializer(self.world, self.agents)
+        self._bindAggregates()
 
         # Schedule all simulation channels.
         self.world._scheduleAllChannels()
         for agent in self.agents:
             agent._scheduleAllChannels()
 
+    def _resume(self):
+        self._replaced = set()
+        self._touched = {}
+        self._deferred = None
+
     def runSimulation(self, tstop):
         world = self.world
         agents = self.agents
@@ -291,21 +647,30 @@ class AMSimulator(BaseSimulator):
         tsync = world._next_event_time
 
         while (tsync <= tstop):
-            not_done = agents
-            while not_done:
-                for agent in not_done:
-                    while agent._enabled and agent._time <= tsync:
-                        agent._processNextChannel() #does not process queue
-                    if self._do_sync:
-                        agent._synchronize(tsync)   #does not process queue
-                # process queue late
-                not_done = self._processAgentQueue()
-
-            # TODO: cross-schedule A2W from a collected batch of dependents
-            # NOTE: agent-to-world scheduling could be a BAD idea
+            observing = self.defer_observers and world._scheduler.next()[0]._observer
+            if observing and self._mode == NORMAL and not self._agent_to_world and self._advancePastObservers(tstop):
+                if not world._enabled:
+                    self.finalize()
+                    return
+                tsync = world._next_event_time
+                continue
+
+            # an observer only needs the agents to reach its event time
+            self._advanceToBarrier(tsync, sync=not observing)
+
+            # cross-schedule A2W from the batch of dependents collected since the last barrier
+            if self._touched:
+                self._rescheduleWorldFromAgents(tsync)
+                if world._next_event_time > tsync:
+                    # the next world event was put off: move the barrier
+                    tsync = world._next_event_time
+                    continue
 
             # fire next world channel
-            world._processNextChannel() #processes queue
+            if observing:
+                self._observe(tsync)
+            else:
+                world._processNextChannel() #processes queue
 
             # if world was stopped, terminate simulation
             if not world._enabled:
@@ -319,27 +684,238 @@ class AMSimulator(BaseSimulator):
             tsync = world._next_event_time
 
         if tsync > tstop:
-            not_done = agents
-            while not_done:
-                for agent in not_done:
-                    while agent._enabled and agent._time <= tstop:
-                        agent._processNextChannel() #does not process queue
-                    if self._do_sync:
-                        agent._synchronize(tstop)   #does not process queue
-                # process queue late
-                not_done = self._processAgentQueue()
+            self._advanceToBarrier(tstop)
+            if self._touched:
+                self._rescheduleWorldFromAgents(tstop)
 
         self.finalize()
 
     def finalize(self):
-        pass
+        self._releaseDiscarded()
+        self._flushRecorders()
+
+    def _advanceToBarrier(self, tbarrier, sync=True):
+        """
+        Advance the agents, and their newborns, to the barrier and process the
+        agent queue.
+
+        """
+        not_done = self.agents
+        while not_done:
+            self._advanceAgents(not_done, tbarrier, sync) #does not process queue
+            # process queue late
+            not_done = self._processAgentQueue()
+        # no agent is firing at the barrier
+        self._releaseDiscarded()
+
+    def _advancePastObservers(self, tstop):
+        """
+        Advance the agents straight to the next world event that is not an
+        observer (or to tstop), taking snapshots of them at the observation
+        times on the way. Then fire the observers that were due on the way, in
+        order, on the snapshots. Returns False, doing nothing, if no observer
+        is due before the next world event.
+
+        """
+        world = self.world
+        scheduler = world._scheduler
+        observers = [channel for channel in scheduler if channel._observer]
+        tnext = min([scheduler[channel] for channel in scheduler if not channel._observer] or [float('inf')])
+        tbarrier = min(tnext, tstop)
+        # the observers' schedules up to the barrier
+        firings = []
+        pending = [(scheduler[channel], i) for i, channel in enumerate(observers)]
+        heapq.heapify(pending)
+        while pending and pending[0][0] < tnext and pending[0][0] <= tstop:
+            time, i = pending[0]
+            channel = observers[i]
+            next_time = channel.scheduleEvent(world, self.agents, time, None)
+            firings.append((time, channel, next_time))
+            heapq.heapreplace(pending, (next_time, i))
+        if not firings:
+            return False
+
+        self._deferred = deferred = _DeferredObservations(firings)
+        try:
+            self._advanceToBarrier(tbarrier, sync=False)
+        finally:
+            self._deferred = None
+
+        for time, channel, next_time, observed in deferred.observed():
+            world._curr_channel = channel
+            world._curr_event_time = time
+            world._is_modified = channel.fireEvent(world, observed, scheduler.clock, time)
+            scheduler.clock = time
+            scheduler[channel] = next_time
+            if not world._enabled:
+                break
+        return True
+
+    def _takeSnapshots(self, agent, vectorized=False):
+        """
+        Advance the agent through the observation times deferred to the
+        barrier (see _advancePastObservers) and take its snapshots at each of
+        them. If vectorized is True, stop at a vectorized channel and return
+        it, so that the agent can be parked.
+
+        """
+        deferred = self._deferred
+        times = deferred.times
+        advanced = deferred.advanced
+        world = self.world
+        n = len(times)
+        k = deferred.cursor.get(agent, 0)
+        scheduler = agent._scheduler
+        channel, time = scheduler.next()
+        while k < n:
+            if agent._enabled and time <= times[k]:
+                if vectorized and channel._vectorized:
+                    deferred.cursor[agent] = k
+                    return channel
+                agent._processNextChannel()
+                if agent._enabled:
+                    channel, time = scheduler.next()
+                continue
+            # the agent does not change up to its next event, and a killed
+            # agent is observed until the agent queue removes it
+            j = bisect_left(times, time, k) if agent._enabled else n
+            if deferred.plain:
+                deferred.starts[k].append((agent, AgentSnapshot(agent)))
+            for i in range(k, j):
+                for advance, snapshots in advanced[i]:
+                    snapshots[agent] = AgentSnapshot(agent, advance(agent, world, agent._time, times[i]))
+            k = j
+        deferred.cursor[agent] = k
+        return None
+
+    def _observe(self, tobs):
+        """
+        Fire the observer channel that is next in the world's schedule at a
+        light barrier. The values given by its advance() for each agent are
+        set on the agent while the channel fires, then the old values are
+        restored.
+
+        """
+        world = self.world
+        advance = getattr(world._scheduler.next()[0], 'advance', None)
+        saved = []
+        if advance is not None:
+            for agent in self.agents:
+                values = advance(agent, world, agent._scheduler.clock, tobs)
+                if values:
+                    for name, value in values.items():
+                        saved.append((agent, name, getattr(agent, name)))
+                        setattr(agent, name, value)
+        try:
+            world._processNextChannel() #processes queue
+        finally:
+            for agent, name, value in reversed(saved):
+                setattr(agent, name, value)
+
+    def _touchWorld(self, agent, wchannels):
+        # note the world channels to reschedule at the barrier because of this
+        # agent, keyed by agent so that each agent is noted once per channel
+        touched = self._touched
+        for wchannel in wchannels:
+            try:
+                touched[wchannel][agent] = None
+            except KeyError:
+                touched[wchannel] = {agent:None}
+
+    def _rescheduleWorldFromAgents(self, tbarrier):
+        """
+        Reschedule each world channel that depends on a channel fired by the
+        agents since the last barrier, once. The source passed to its
+        scheduleEvent() is the list of the agents whose firings touched it,
+        each listed once, and the time passed is the barrier. Raises
+        SchedulingError if a world event is moved before the barrier, which
+        the agents have already been advanced to.
+
+        """
+        world = self.world
+        touched, self._touched = self._touched, {}
+        for wchannel, sources in touched.items():
+            world._rescheduleFromAgent(list(sources), (wchannel,), tbarrier)
+        if world._next_event_time < tbarrier:
+            raise SchedulingError("The agents rescheduled a world event before the barrier they were advanced to.")
+
+    def _advanceAgents(self, agents, tbarrier, sync=True):
+        """
+        Fire the channels of each agent until its clock passes the barrier, then
+        fire its sync channels (if sync is True). Does not process the agent queue.
+
+        """
+        if self._vectorized:
+            self._advanceAgentsVectorized(agents, tbarrier, sync)
+            return
+        sync = sync and self._do_sync
+        a2w = self._agent_to_world
+        aggregates = self._aggregates
+        deferred = self._deferred
+        for agent in agents:
+            if deferred is not None:
+                self._takeSnapshots(agent)
+            while agent._enabled and agent._time <= tbarrier:
+                agent._processNextChannel()
+                if a2w and agent._is_modified:
+                    self._touchWorld(agent, agent._getDependentWCs())
+            if sync:
+                agent._synchronize(tbarrier)
+            # the aggregates are only read at the barrier
+            if aggregates is not None:
+                aggregates.update(agent)
+
+    def _advanceAgentsVectorized(self, agents, tbarrier, sync=True):
+        """
+        Same as _advanceAgents, but an agent whose next event belongs to a
+        vectorized channel is parked instead of fired. Once every agent is either
+        parked or past the barrier, each vectorized channel is fired once for all
+        the agents parked on it, and those agents resume. The agents are then
+        synchronized together (see _synchronizeAgents).
+
+        """
+        sync = sync and self._do_sync
+        a2w = self._agent_to_world
+        aggregates = self._aggregates
+        deferred = self._deferred
+        pending = agents
+        reached = []
+        while pending:
+            parked = {}
+            for agent in pending:
+                scheduler = agent._scheduler
+                if deferred is not None:
+                    channel = self._takeSnapshots(agent, vectorized=True)
+                    if channel is not None:
+                        parked.setdefault(channel._id, []).append(agent)
+                        continue
+                while agent._enabled and scheduler.clock <= tbarrier:
+                    channel = scheduler.next()[0]
+                    if channel._vectorized:
+                        parked.setdefault(channel._id, []).append(agent)
+                        break
+                    agent._processNextChannel()
+                    if a2w and agent._is_modified:
+                        self._touchWorld(agent, agent._getDependentWCs())
+                else:
+                    reached.append(agent)
+            pending = []
+            for channel_id, group in parked.items():
+                self._fireVectorChannel(channel_id, group)
+                pending.extend(group)
+        # the agents that reached the barrier are synchronized together
+        if sync:
+            self._synchronizeAgents(reached, tbarrier)
+        if aggregates is not None:
+            for agent in reached:
+                aggregates.update(agent)
 
     def _processAgentQueue(self):
         q = self.agent_queue
         not_done = set()
         replaced = self._replaced
         # Process agents one by one
-        size = self.world._size[-1]
+        size = self.trajectory.sizes[-1]
         while q:
             action, agent = q.dequeue()
             if self._mode == NORMAL:
@@ -354,8 +930,7 @@ class AMSimulator(BaseSimulator):
                     size = self.sizethresh_lo
                     self._mode = NORMAL
         # Update population counter
-        self.world._ts.append( self.world._time )
-        self.world._size.append( size )
+        self.trajectory.record(self.world._time, size)
         # Clear memo of replaced agents
         if replaced:
             replaced.clear()
@@ -371,6 +946,8 @@ class AMSimulator(BaseSimulator):
             self.num_agents += 1
             self.nbirths += 1
             not_done.add(agent)
+            if self._deferred is not None:
+                self._deferred.born(agent)
             return 1
         elif action == q.DELETE_AGENT:
             target = agent
@@ -378,6 +955,9 @@ class AMSimulator(BaseSimulator):
                 agents.remove(target)
             except ValueError:
                 raise SimulationError("Agent not found.")
+            self._discardAgent(target)
+            if self._deferred is not None:
+                self._deferred.removed(target)
             self.num_agents -= 1
             if self.num_agents == 0:
                 raise ZeroPopulationError("The sample population crashed!")
@@ -395,6 +975,10 @@ class AMSimulator(BaseSimulator):
                 # Choose a random agent to replace, keep note of its replacement
                 index = random.randint(0, len(self.agents)-1)
                 replaced.add(agents[index])
+                not_done.discard(agents[index])
+                self._discardAgent(agents[index])
+                if self._deferred is not None:
+                    self._deferred.born(agent)
                 # Substitute new agent into the list
                 agents[index] = agent
                 self.nbirths += 1
@@ -402,10 +986,14 @@ class AMSimulator(BaseSimulator):
                 return world._size[-1]/self.num_agents_max
             else:
                 # This agent's parent has been replaced by another agent at an earlier time.
-                # Discard this agent!
+                # Discard this agent, and its own offspring with it!
+                replaced.add(agent)
+                self._discardAgent(agent)
                 return 0
         elif action == q.DELETE_AGENT:
             target = agent; del agent
+            if self._deferred is not None:
+                self._deferred.removed(target)
             if target not in replaced:
                 # NOTE: This should not be allowed in CN mode.
                 if self.num_agents == 1:
@@ -421,6 +1009,7 @@ class AMSimulator(BaseSimulator):
                     i_source = random.randint(0, self.num_agents-1)
                 # Replace target agent
                 agents[i_target] = agents[i_source].__copy__()
+                self._discardAgent(target)
                 del target
                 self.ndeaths += 1
                 return -(world._size[-1]/self.num_agents_max)
@@ -431,3 +1020,459 @@ class AMSimulator(BaseSimulator):
 
 
 
+#-------------------------------------------------------------------------------
+# Asynchronous Method, parallelized over partitions of the agents
+
+class _WorldView(object):
+    """
+    Copy of the world's state variables shipped to worker processes. Agent
+    channels may read it but modifications are not sent back.
+
+    """
+    def __init__(self, state):
+        self.__dict__.update(state)
+
+
+class _WorldChannelRef(object):
+    """
+    Stand-in for a world channel referenced by an agent's channel network
+    while the agent is in a worker process.
+
+    """
+    def __init__(self, name):
+        self._id = name
+
+    # references to the same world channel are equal
+    def __eq__(self, other):
+        return isinstance(other, _WorldChannelRef) and other._id == self._id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._id)
+
+
+class _AgentPickler(pickle.Pickler):
+    # World channels are pickled by name and resolved by the receiving process.
+    def persistent_id(self, obj):
+        if isinstance(obj, (WorldChannel, _WorldChannelRef)):
+            return obj._id
+        return None
+
+
+class _AgentUnpickler(pickle.Unpickler):
+    def __init__(self, file, world_channels=None):
+        pickle.Unpickler.__init__(self, file)
+        self.world_channels = world_channels
+
+    def persistent_load(self, name):
+        if self.world_channels is None:
+            return _WorldChannelRef(name)
+        return self.world_channels[name]
+
+
+def _dump_agents(obj):
+    f = io.BytesIO()
+    _AgentPickler(f, pickle.HIGHEST_PROTOCOL).dump(obj)
+    return f.getvalue()
+
+def _load_agents(data, world_channels=None):
+    return _AgentUnpickler(io.BytesIO(data), world_channels).load()
+
+def _advance_partition(args):
+    """
+    Worker process task: advance a partition of the agents to the barrier and
+    return them together with the entries they pushed into the agent queue.
+
+    """
+    data, world_state, tbarrier, seed, do_sync, vectorized, AgentQueueType = args
+    _seed_worker(seed)
+    agents = _load_agents(data)
+    sim = _bare_simulator(agents, world_state, do_sync, vectorized, AgentQueueType)
+    sim._advanceAgents(agents, tbarrier)
+    return _dump_agents((agents, _queued_entries(sim.agent_queue), _touched_ids(sim)))
+
+def _advance_partition_open_loop(args):
+    """
+    Worker process task: advance a partition of the agents through a timeline
+    of world events up to the barrier (see _replay_timeline) and return them
+    together with the entries pushed into the agent queue.
+
+    """
+    data, world_state, events, tbarrier, seed, do_sync, vectorized, AgentQueueType = args
+    _seed_worker(seed)
+    agents = _load_agents(data)
+    sim = _bare_simulator(agents, world_state, do_sync, vectorized, AgentQueueType)
+    parents = _replay_timeline(sim, agents, events, tbarrier)
+    return _dump_agents((agents, _queued_entries(sim.agent_queue, parents), _touched_ids(sim)))
+
+def _touched_ids(sim):
+    # world channels touched by the agents, by id
+    return [(wchannel._id, list(sources)) for wchannel, sources in sim._touched.items()]
+
+def _queued_entries(q, parents=None):
+    """
+    Return (action, agent, priority key, parent of a newborn) for each entry
+    of the agent queue, in heap order. Given the parents of the newborns that
+    were advanced (see _replay_timeline), the deletions come first instead:
+    an agent born and killed in the same stretch can only be queued for
+    deletion before it is marked with its parent again.
+
+    """
+    if parents is None:
+        return [(entry.action, entry.item, entry.priority_key, entry.item._parent)
+                for entry in q.heap]
+    entries = [(entry.action, entry.item, entry.priority_key, parents.get(entry.item, entry.item._parent))
+               for entry in q.heap]
+    entries.sort(key=lambda entry: entry[0] != q.DELETE_AGENT)
+    return entries
+
+def _queue_entries(q, entries, simulator, network=None):
+    """
+    Push entries returned by _queued_entries() into the agent queue of the
+    simulator, in order.
+
+    """
+    for action, agent, priority_key, parent in entries:
+        agent._simulator = simulator
+        if network is not None:
+            agent._scheduler.network = network
+        if action == q.ADD_AGENT:
+            agent._parent = parent
+        q.enqueue(action, agent, priority_key)
+
+def _seed_worker(seed):
+    random.seed(seed)
+    try:
+        import numpy
+        numpy.random.seed(seed)
+    except ImportError:
+        pass
+
+def _bare_simulator(agents, world_state, do_sync, vectorized, AgentQueueType):
+    # bare simulator providing the context the agents expect
+    sim = AMSimulator.__new__(AMSimulator)
+    sim.world = _WorldView(world_state)
+    sim.agents = agents
+    sim.agent_queue = AgentQueueType()
+    sim.state_store = None
+    sim._do_sync = do_sync
+    sim._vectorized = vectorized
+    network = agents[0]._scheduler.network if agents else None
+    sim._vector_sync = [network.names[i] for i in network.sync_channels
+                        if network.prototypes[i]._vectorized] if vectorized and agents else []
+    sim._scalar_sync = do_sync and (not sim._vector_sync or
+                                    len(sim._vector_sync) < len(network.sync_channels))
+    sim._agent_to_world = bool(agents) and any(agents[0]._scheduler.network.l2g_graph.values())
+    sim._touched = {}
+    sim._deferred = None
+    sim._aggregates = None
+    sim._discarded = []
+    for agent in agents:
+        agent._simulator = sim
+    return sim
+
+def _replay_timeline(sim, agents, events, tbarrier, world_channels=None):
+    """
+    Advance agents through a timeline of world events as AMSimulator would,
+    with a barrier at each event: the world view takes the state recorded
+    after the event and the agents are rescheduled if it modified the world.
+    The agents cloned along the way are advanced too, but births and deaths
+    are left in the agent queue. Returns the parent of each newborn, which is
+    only marked on it again when its entries are queued (see _queue_entries).
+
+        events (list of (event time, world channel id, world state, is_modified))
+        world_channels (dict: id -> world channel): the channels the agents'
+            networks refer to (default: references by id, as in the workers)
+
+    """
+    world = sim.world
+    q = sim.agent_queue
+    population = list(agents)
+    seen = set(population)
+    # newborns lose their parent marker while they are advanced, so that
+    # they can be queued for deletion
+    parents = {}
+    for event_time, channel_id, state, is_modified in list(events) + [(tbarrier, None, None, False)]:
+        not_done = population
+        while not_done:
+            sim._advanceAgents(not_done, event_time)
+            not_done = [entry.item for entry in q.heap
+                        if entry.action == q.ADD_AGENT and entry.item not in seen]
+            for agent in not_done:
+                parents[agent] = agent._parent
+                agent._parent = None
+            seen.update(not_done)
+            population.extend(not_done)
+        # agents queued for removal have left the population
+        removed = set([entry.item for entry in q.heap if entry.action == q.DELETE_AGENT])
+        if removed:
+            population = [agent for agent in population if agent not in removed]
+        if channel_id is None:
+            break
+        world.__dict__.update(state)
+        if world_channels is None:
+            world._curr_channel = _WorldChannelRef(channel_id)
+        else:
+            world._curr_channel = world_channels[channel_id]
+        world._is_modified = is_modified
+        if is_modified:
+            for agent in population:
+                agent._rescheduleFromWorld(world)
+    return parents
+
+
+class ParallelAMSimulator(AMSimulator):
+    """
+    Asynchronous method simulator that advances agents in a pool of worker
+    processes between world events.
+
+    Agents only interact through the world at the synchronization barriers, so
+    between barriers the agents are split into partitions that are advanced
+    concurrently. Each worker returns its agents along with the births and
+    deaths they queued; these are merged into the agent queue and processed by
+    the parent process as in AMSimulator.
+
+    Agents are pickled to and from the workers at every barrier, so this pays
+    off when agents fire many (costly) events between world events. Agents
+    with loggers are always advanced in the parent process. Workers see a copy
+    of the world's state variables; agent channels must not modify the world.
+    A state store is not supported. Call close() to shut down the workers.
+
+    Additional attributes:
+        processes     (int): number of worker processes
+        min_partition (int): minimum number of agents sent to each worker
+
+    Observer channels make full barriers, like other world channels.
+
+    """
+    defer_observers = False
+
+    def __init__(self, model, tstart, processes=None, min_partition=64):
+        self._configure(processes, min_partition)
+        super(ParallelAMSimulator, self).__init__(model, tstart)
+
+    def _configure(self, processes=None, min_partition=64):
+        import multiprocessing
+        self.processes = processes or multiprocessing.cpu_count()
+        self.min_partition = min_partition
+        self._pool = None
+
+    def initialize(self):
+        if self.state_store is not None:
+            raise ValueError("ParallelAMSimulator does not support a state store.")
+        super(ParallelAMSimulator, self).initialize()
+        self._startPool()
+
+    def _resume(self):
+        if self.state_store is not None:
+            raise ValueError("ParallelAMSimulator does not support a state store.")
+        super(ParallelAMSimulator, self)._resume()
+        if not hasattr(self, 'processes'):
+            self._configure()
+        self._startPool()
+
+    def _startPool(self):
+        import multiprocessing
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            context = multiprocessing
+        self._pool = context.Pool(self.processes)
+
+    def enableProfiling(self):
+        # the instrumented classes cannot be sent to the workers
+        raise ValueError("ParallelAMSimulator does not support profiling.")
+
+    def close(self):
+        """
+        Shut down the worker processes.
+
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _advanceAgents(self, agents, tbarrier, sync=True):
+        from cps.entity import LoggedAgent
+        local, remote = [], []
+        for agent in agents:
+            (local if isinstance(agent, LoggedAgent) else remote).append(agent)
+        nparts = min(self.processes, len(remote)//self.min_partition)
+        if nparts < 2:
+            super(ParallelAMSimulator, self)._advanceAgents(agents, tbarrier, sync)
+            return
+
+        # ship partitions to the workers
+        world_state = self._worldState()
+        partitions = [remote[i::nparts] for i in range(nparts)]
+        tasks = [(_dump_agents(part), world_state, tbarrier, random.getrandbits(32),
+                  sync and self._do_sync, self._vectorized, self.agent_queue.__class__)
+                 for part in partitions]
+        results = self._pool.map_async(_advance_partition, tasks)
+
+        # advance logged agents here in the meantime
+        super(ParallelAMSimulator, self)._advanceAgents(local, tbarrier, sync)
+
+        self._mergePartitions(partitions, results.get())
+
+    def _worldState(self):
+        # the world's state variables, as seen by the workers
+        world = self.world
+        world_state = dict([(name, value) for name, value in world.__dict__.items() if not name.startswith('_')])
+        world_state['_ts'] = [world._ts[-1]]
+        world_state['_size'] = [world._size[-1]]
+        return world_state
+
+    def _mergePartitions(self, partitions, results):
+        """
+        Put the agents advanced by the workers in place of the originals and
+        push the entries they queued into the agent queue.
+
+        """
+        world_channels = self.world._scheduler.channel_dict
+        agents = self.agents
+        q = self.agent_queue
+        for part, data in zip(partitions, results):
+            advanced, entries, touched = _load_agents(data, world_channels)
+            # the agents share this process's channel network again
+            network = part[0]._scheduler.network
+            for old, new in zip(part, advanced):
+                new._simulator = self
+                new._scheduler.network = network
+                agents[agents.index(old)] = new
+            _queue_entries(q, entries, self, network)
+            for wchannel_id, sources in touched:
+                self._touched.setdefault(world_channels[wchannel_id], {}).update(dict.fromkeys(sources))
+
+
+class OpenLoopAMSimulator(ParallelAMSimulator):
+    """
+    Parallel asynchronous method simulator for models in which part of the
+    world evolves independently of the agents (e.g. a stressor switched on
+    and off at given times).
+
+    The world channels named as open-loop are fired ahead of the agents, up to
+    the next event of another world channel (e.g. a recording channel) or the
+    end of the run, and the state of the world after each of them is recorded
+    in a timeline. Each partition of the agents is then advanced through the
+    whole timeline in a single task, as if there were a barrier at each
+    timeline event, and the births and deaths of all the partitions are
+    processed at the end of the timeline. The timeline of the last stretch is
+    kept in the timeline attribute.
+
+    Open-loop world channels must not read the agents, and agent channels
+    must not list them as world dependents. Between two world events that are
+    not open-loop, the agents of a partition see neither the agents of other
+    partitions nor the population size (world._size) change: in constant-
+    number mode, replacements are made at the end of the timeline.
+
+    Additional attributes:
+        open_loop (frozenset of string): ids of the open-loop world channels
+        timeline  (list of (event time, world channel id, world state, is_modified))
+
+    """
+    def __init__(self, model, tstart, open_loop, processes=None, min_partition=64):
+        open_loop = frozenset(open_loop)
+        for name in open_loop:
+            if name not in model.world_channel_table:
+                raise ValueError("Unknown world channel: %s" % name)
+        for entry in model.agent_channel_table.values():
+            if any([channel._id in open_loop for channel in entry.wc_dependents]):
+                raise ValueError("Open-loop world channels cannot depend on agent channels.")
+        self.open_loop = open_loop
+        self.timeline = []
+        super(OpenLoopAMSimulator, self).__init__(model, tstart, processes, min_partition)
+
+    def _resume(self):
+        super(OpenLoopAMSimulator, self)._resume()
+        if not hasattr(self, 'open_loop'):
+            self.open_loop = frozenset()
+        self.timeline = []
+
+    def enableProfiling(self):
+        raise ValueError("OpenLoopAMSimulator does not support profiling.")
+
+    def runSimulation(self, tstop):
+        world = self.world
+        scheduler = world._scheduler
+        while True:
+            # fire the open-loop world channels ahead of the agents
+            world_state = deepcopy(self._worldState())
+            timeline = self.timeline = []
+            channel, tsync = scheduler.next()
+            while tsync <= tstop and channel._id in self.open_loop:
+                world._processNextChannel()
+                if not world._enabled:
+                    break
+                state = deepcopy(dict([(name, value) for name, value in world.__dict__.items()
+                                       if not name.startswith('_')]))
+                timeline.append((tsync, channel._id, state, world._is_modified))
+                channel, tsync = scheduler.next()
+
+            # advance the agents through the timeline
+            tbarrier = min(tsync, tstop)
+            self._replayTimeline(world_state, timeline, tbarrier)
+            self._processAgentQueue()
+            self._releaseDiscarded()
+            if self._touched:
+                self._rescheduleWorldFromAgents(tbarrier)
+                if world._enabled and tsync <= tstop and world._next_event_time > tsync:
+                    continue
+            if not world._enabled or tsync > tstop:
+                break
+
+            # fire the next world channel
+            world._processNextChannel()
+            if not world._enabled:
+                break
+            if world._is_modified:
+                for agent in self.agents:
+                    agent._rescheduleFromWorld(world)
+        self.finalize()
+
+    def _replayTimeline(self, world_state, timeline, tbarrier):
+        """
+        Advance all the agents through the timeline up to the barrier, in the
+        workers or in this process, and queue their births and deaths.
+
+        """
+        from cps.entity import LoggedAgent
+        local, remote = [], []
+        for agent in self.agents:
+            (local if isinstance(agent, LoggedAgent) else remote).append(agent)
+        nparts = min(self.processes, len(remote)//self.min_partition)
+        if nparts < 2:
+            local, remote, nparts = list(self.agents), [], 0
+
+        # ship partitions to the workers
+        partitions = [remote[i::nparts] for i in range(nparts)]
+        tasks = [(_dump_agents(part), world_state, timeline, tbarrier, random.getrandbits(32),
+                  self._do_sync, self._vectorized, self.agent_queue.__class__)
+                 for part in partitions]
+        results = self._pool.map_async(_advance_partition_open_loop, tasks) if tasks else None
+
+        # advance the other agents here in the meantime
+        if local:
+            sim = _bare_simulator(local, deepcopy(world_state), self._do_sync, self._vectorized,
+                                  self.agent_queue.__class__)
+            parents = _replay_timeline(sim, local, timeline, tbarrier, self.world._scheduler.channel_dict)
+            for agent in local:
+                agent._simulator = self
+                if self._aggregates is not None:
+                    self._aggregates.update(agent)
+            _queue_entries(self.agent_queue, _queued_entries(sim.agent_queue, parents), self)
+            for wchannel, sources in sim._touched.items():
+                self._touched.setdefault(wchannel, {}).update(sources)
+
+        if results is not None:
+            self._mergePartitions(partitions, results.get())
+
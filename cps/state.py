@@ -0,0 +1,249 @@
+"""
+Name:        state
+
+Author:      Nezar Abdennur <nabdennur@gmail.com>
+Created:     17/10/2026
+Copyright:   (c) Nezar Abdennur 2012
+
+"""
+from copy import copy
+import numpy as np
+
+def _fill_value(dtype):
+    # value of an unset state variable
+    if dtype.kind in 'fc':
+        return np.nan
+    elif dtype.kind == 'O':
+        return None
+    else:
+        return dtype.type(0)
+
+#-------------------------------------------------------------------------------
+# Columnar (struct-of-arrays) storage of agent state variables
+
+class AgentStateStore(object):
+    """
+    Keeps the state variables of a collection of agents as columns of growable
+    NumPy arrays. Each agent owns one row of the store and its state variables
+    are views onto that row.
+
+    Rows are recycled: rows released by agents that leave the population are
+    handed out again to new agents. The row values are reset when a row is
+    allocated. The simulator has a discarded agent release its row only once
+    the firing in progress is over, since that agent may still be copied.
+
+    Attributes:
+        names    (tuple-of-string)
+        dtypes   (dict: name -> numpy.dtype)
+        columns  (dict: name -> numpy.ndarray)
+        capacity (int)
+
+    """
+    def __init__(self, names, dtypes=None, capacity=16):
+        if dtypes is None:
+            dtypes = {}
+        self.names = tuple(names)
+        self.dtypes = dict([(name, np.dtype(dtypes.get(name, float))) for name in self.names])
+        self.fill = dict([(name, _fill_value(dtype)) for name, dtype in self.dtypes.items()])
+        self.capacity = max(int(capacity), 1)
+        self.columns = dict([(name, self._emptyColumn(name, self.capacity)) for name in self.names])
+        self._free = list(reversed(range(self.capacity)))
+
+    def __len__(self):
+        """
+        Return the number of rows in use.
+
+        """
+        return self.capacity - len(self._free)
+
+    def _emptyColumn(self, name, n):
+        return np.full(n, self.fill[name], dtype=self.dtypes[name])
+
+    def _grow(self):
+        # double the capacity of every column
+        n = self.capacity
+        for name, column in self.columns.items():
+            self.columns[name] = np.concatenate([column, self._emptyColumn(name, n)])
+        self._free.extend(reversed(range(n, 2*n)))
+        self.capacity = 2*n
+
+    def allocate(self):
+        """
+        Reserve a row for a new agent and return its index.
+
+        """
+        if not self._free:
+            self._grow()
+        row = self._free.pop()
+        fill = self.fill
+        for name, column in self.columns.items():
+            column[row] = fill[name]
+        return row
+
+    def release(self, row):
+        """
+        Return a row to the pool of free rows.
+
+        """
+        self._free.append(row)
+
+    def copyrow(self, src, dst):
+        """
+        Copy all state variables in row src to row dst.
+
+        """
+        for column in self.columns.values():
+            column[dst] = column[src]
+
+    def rows(self, agents):
+        """
+        Return an index array of the rows owned by a sequence of agents.
+
+        """
+        return np.fromiter((agent._row for agent in agents), dtype=np.intp, count=len(agents))
+
+    def gather(self, name, rows):
+        """
+        Return a copy of the values of a state variable for the given rows.
+
+        """
+        return self.columns[name][rows]
+
+    def scatter(self, name, rows, values):
+        """
+        Assign values of a state variable to the given rows.
+
+        """
+        self.columns[name][rows] = values
+
+
+class StoredVariable(object):
+    """
+    Descriptor that exposes one column of an agent state store as an attribute
+    of the agent owning the row.
+
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, agent, owner):
+        if agent is None:
+            return self
+        return agent._store.columns[self.name].item(agent._row)
+
+    def __set__(self, agent, value):
+        agent._store.columns[self.name][agent._row] = value
+
+
+class StoredAgentMixin(object):
+    """
+    Mixin for agent entities whose state variables live in the simulator's
+    state store rather than in the agent's instance dictionary.
+
+    Additional attributes:
+        _store  (cps.state.AgentStateStore)
+        _row    (int)
+
+    """
+    def _initState(self, state_names):
+        self._store = self._simulator.state_store
+        self._row = self._store.allocate()
+
+    def _copyStateTo(self, other):
+        self._store.copyrow(self._row, other._row)
+
+    def _release(self):
+        super(StoredAgentMixin, self)._release()
+        if not getattr(self, '_released', False):
+            self._released = True
+            self._store.release(self._row)
+
+
+_stored_types = {}
+def stored_agent_type(base, names):
+    """
+    Return a subclass of the agent type provided whose state variables (names)
+    are stored in an AgentStateStore.
+
+    """
+    key = (base, tuple(names))
+    try:
+        return _stored_types[key]
+    except KeyError:
+        namespace = dict([(name, StoredVariable(name)) for name in names])
+        AgentType = type('Stored' + base.__name__, (StoredAgentMixin, base), namespace)
+        _stored_types[key] = AgentType
+        return AgentType
+
+
+#-------------------------------------------------------------------------------
+# Array views of groups of agents
+
+class AgentBatch(object):
+    """
+    A view of a group of agents that exposes each state variable as an array,
+    used to fire vectorized channels for many agents at once. Reading a state
+    variable returns a new array of the agents' values. Assigning to a state
+    variable writes an array (or a scalar broadcast to all agents) back to the
+    agents.
+
+    Agents backed by an AgentStateStore are read and written by indexing the
+    store's columns. Otherwise values are gathered from and scattered to the
+    individual agents.
+
+    """
+    def __init__(self, agents, store=None):
+        agents = list(agents)
+        object.__setattr__(self, '_agents', agents)
+        object.__setattr__(self, '_store', store)
+        object.__setattr__(self, '_rows', store.rows(agents) if store is not None else None)
+
+    def __len__(self):
+        return len(self._agents)
+
+    def __iter__(self):
+        return iter(self._agents)
+
+    def __getitem__(self, index):
+        return self._agents[index]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        store = self._store
+        if store is not None and name in store.columns:
+            return store.gather(name, self._rows)
+        return np.array([getattr(agent, name) for agent in self._agents])
+
+    def __setattr__(self, name, value):
+        store = self._store
+        if store is not None and name in store.columns:
+            store.scatter(name, self._rows, value)
+        else:
+            n = len(self._agents)
+            values = np.broadcast_to(np.asarray(value), (n,) + np.shape(value)[1:]).tolist()
+            for agent, v in zip(self._agents, values):
+                setattr(agent, name, v)
+
+
+#-------------------------------------------------------------------------------
+# Copies of agents taken for deferred observers
+
+class AgentSnapshot(object):
+    """
+    A copy of the state variables of an agent at an observation time. The
+    asynchronous simulator takes one for each agent at each observation time
+    that the agent passes, and fires the observer channels on the snapshots
+    once the agents have moved on (see cps.channel.ObserverChannel). An
+    observer reads a snapshot as it would read the agent.
+
+    The values given are set on the snapshot in place of the agent's own.
+
+    """
+    def __init__(self, agent, values=None):
+        self._names = agent._names
+        for name in agent._names:
+            setattr(self, name, copy(getattr(agent, name)))
+        if values:
+            for name, value in values.items():
+                setattr(self, name, value)
@@ -0,0 +1,150 @@
+#-------------------------------------------------------------------------------
+# COMPETITION MODEL, WITH THE RESOURCE INTEGRATED AS AN ODE
+#----------------------------------------------------------
+#!/usr/bin/env python
+#
+#
+# The model of model_competition, except that the cells' concentration of
+# resource R is integrated with the adaptive ODE solver (see cps.ode) instead
+# of forward Euler steps between events:
+#
+#   dCcell/dt = (1/Vcell)*kdiff*(Cexternal-Ccell) - kdeg*Ccell
+#
+# Cexternal is held constant by the cells between the exchanges with them,
+# every exchange_step, where it is brought forward by solving
+#
+#   dCexternal/dt = -(1/Vexternal)*kdiff*sum(Cexternal-Ccell)*(Nvirtual/Nmax)
+#                   + kdil*(C0-Cexternal)
+#
+# with the cells' total held at its value at the exchange.
+#
+# The relaxation of Ccell towards Cexternal has rate kdiff/Vcell = 100, so the
+# Euler steps of model_competition, one per recording (0.01), are at the edge
+# of stability. The solver picks its own steps. The recordings are observers
+# (see cps.channel.ObserverChannel): they do not change the world, so the
+# cells are integrated once per exchange or dilution, and only read in
+# between.
+
+
+from cps import *
+from model_competition import (CellDivisionChannel, BarrierStepChannel,
+    CellDeathChannel, CellDilutionChannel, Vexternal, Vcell0, Rreservoir, kdiff,
+    kdeg, kdil)
+import math, random, time
+
+class DiffusionODEChannel(ODEChannel):
+    """
+    Integrates a cell's concentration of resource R due to:
+        - diffusion with the environment
+        - metabolic consumption, degradation
+
+    The world's concentration is read as a constant between exchanges.
+
+    """
+    def __init__(self, tstep):
+        super(DiffusionODEChannel, self).__init__(['R'], tstep, parameters=['V'])
+
+    def derivatives(self, t, R, cells, world):
+        diffusionIn_rate = (1/cells.V[:, None])*kdiff*(world.R - R)
+        consumption_rate = kdeg*R
+        return diffusionIn_rate - consumption_rate
+
+class ExchangeChannel(WorldChannel):
+    """
+    Updates the world's concentration of resource R every tstep, due to:
+        - diffusion with all the agents, from the total resource inside them,
+          which is held constant over the step
+        - exchange with a reservoir and sink
+
+    """
+    def __init__(self, tstep):
+        self.tstep = tstep
+
+    def scheduleEvent(self, world, cells, time, src):
+        return time + self.tstep
+
+    def fireEvent(self, world, cells, time, event_time):
+        Nvirtual = world._size[-1]
+        dt = event_time - world.TExchange
+        # the rates are linear in world.R, which relaxes exponentially towards
+        # their balance: a forward Euler step would be unstable once the
+        # virtual population is large
+        diffusion_coef = (1/Vexternal)*kdiff*(Nvirtual/Nmax)
+        decay_rate = diffusion_coef*len(cells) + kdil
+        Rtotal = sum([cell.R for cell in cells])
+        R_balance = (diffusion_coef*Rtotal + kdil*Rreservoir)/decay_rate
+
+        world.R = R_balance + (world.R - R_balance)*math.exp(-decay_rate*dt)
+        world.TExchange = event_time
+        return True
+
+
+
+# Create the model...
+Nmax = 100
+model = Model(n0=Nmax, nmax=Nmax)
+
+# CONSTANTS
+recorder_step = 0.01
+exchange_step = 0.1
+barrier_size = 0.5
+div_rate = 0.1
+death_rate = 0.02
+
+
+# Initializer
+def my_init(world, cells):
+    world.R = Rreservoir
+    world.TExchange = world._time
+    for cell in cells:
+        cell.V = Vcell0
+        cell.R = 0.5*random.uniform(0,1)
+        cell.TBarrier = cell._time + barrier_size
+        cell.RBarrier = ((1/cell.V)*kdiff*(world.R-cell.R) - kdeg*cell.R)*(cell.TBarrier-cell._time)
+        cell.div_count = 0
+model.addInitializer(['R', 'TExchange'], ['V', 'R', 'TBarrier', 'RBarrier', 'div_count'], my_init)
+
+
+# Recording
+def my_recorder(log, time, world, agents):
+    log['Rext'].append(world.R)
+    log['Rint'].append([agent.R for agent in agents])
+recorder = Recorder(['Rext'], ['Rint'], my_recorder)
+model.addRecorder(recorder)
+
+
+# Add the channels
+Crec = RecordingChannel(tstep=recorder_step, recorder=recorder, observer=True)
+CresW = ExchangeChannel(tstep=exchange_step)
+# only fired as a sync channel or by the other channels
+CresA = DiffusionODEChannel(tstep=float('inf'))
+Cdiv = CellDivisionChannel(div_rate=div_rate)
+Cdeath = CellDeathChannel(death_rate=death_rate)
+Cdil = CellDilutionChannel()
+Cbar = BarrierStepChannel(barrier_size=barrier_size)
+
+model.addWorldChannel(channel=Crec)
+model.addWorldChannel(channel=CresW)
+model.addWorldChannel(channel=Cdil)
+
+# the other channels fire it by this name
+model.addAgentChannel(channel=CresA, name='DiffusionChannel', sync=True)
+model.addAgentChannel(channel=Cdeath)
+model.addAgentChannel(channel=Cdiv, ac_dependents=[Cdeath])
+model.addAgentChannel(channel=Cbar, ac_dependents=[Cdiv])
+
+
+
+from os import path
+DATA_PATH = path.join(path.abspath(path.pardir), 'data')
+# Run the simulation
+if __name__ == '__main__':
+    sim = FMSimulator(model, 0)
+
+    t0 = time.time()
+    sim.runSimulation(50)
+    t = time.time()
+    print(t-t0)
+
+    savemat_snapshot(path.join(DATA_PATH, 'snapshot_ode_test.mat'),
+        sim.recorders[0])
@@ -5,12 +5,16 @@
 
 from cps import *
 import math, random, time
+import numpy as np
 
 class StressChannel(WorldChannel):
     """
     Turn external stressor on or off.
 
     """
+    reads = ()
+    writes = ('stress',)
+
     def __init__(self, switch_times):
         self.switch_times = switch_times
         self.count = 0
@@ -32,6 +36,9 @@ class OUProteinChannel(AgentChannel):
     Protein expression modeled as a geometric Ornstein-Uhlenbeck process.
 
     """
+    reads = ()
+    writes = ('x', 'y', 'fitness', 'capacity')
+
     def __init__(self, tstep, tau, c):
         self.tau = tau
         self.c = c
@@ -59,12 +66,51 @@ class OUProteinChannel(AgentChannel):
         cell.capacity *= math.exp(cell.fitness*self.tstep)
         return True
 
+class VectorOUProteinChannel(VectorAgentChannel):
+    """
+    Vectorized version of OUProteinChannel. The AM simulator fires it once for
+    all the agents that are due.
+
+    """
+    reads = ()
+    writes = ('x', 'y', 'fitness', 'capacity')
+
+    def __init__(self, tstep, tau, c):
+        self.tau = tau
+        self.c = c
+        self.tstep = tstep
+        self.e0 = 1
+
+    def scheduleEvent(self, cells, gdata, time, src):
+        return time + self.tstep
+
+    def fireEvent(self, cells, gdata, time, event_time):
+        # update protein expression
+        mu = math.exp(-self.tstep/self.tau)
+        sig = math.sqrt((self.c*self.tau/2)*(1-mu**2))
+        x = cells.x
+        x = mu*x + sig*np.random.normal(0, 1, np.shape(x) or None)
+        cells.x = x
+        cells.y = y = np.exp(x)/self.e0
+
+        # compute reproductive rate and update reproductive capacity
+        if gdata.stress:
+            fitness = np.where(y < gdata.Kw, gdata.fmin, gdata.fmax)
+        else:
+            fitness = np.full(np.shape(x), gdata.fmax, dtype=float)
+        cells.fitness = fitness
+        cells.capacity = cells.capacity*np.exp(fitness*self.tstep)
+        return True
+
 class DivDeathChannel(AgentChannel):
     """
     Cell divides if reproductive capacity exceeds upper threshold.
     Cell dies if reproductive capacity falls below lower threshold.
 
     """
+    reads = ('capacity',)
+    writes = ('capacity', 'alive')
+
     def __init__(self):
         self.event_flag = None
 
@@ -134,6 +180,7 @@ if __name__=='__main__':
         sc = StressChannel(switch_times=[5])
         #tau = 0.1
         pc = OUProteinChannel(tstep=0.015, tau=tau, c=1/tau)
+        #pc = VectorOUProteinChannel(tstep=0.015, tau=tau, c=1/tau)
         dc = DivDeathChannel()
         model.addWorldChannel(channel=rc)
         model.addWorldChannel(channel=sc, ac_dependents=[pc,dc])
@@ -0,0 +1,78 @@
+#-------------------------------------------------------------------------------
+# STOCHASTICS-VOLUME-DIVISON MODEL, WITH THE VOLUME INTEGRATED AS AN ODE
+#-----------------------------------------------------------------------
+#!/usr/bin/env python
+#
+# The model of model_svd, except that the cell volume is integrated with the
+# adaptive ODE solver (see cps.ode) instead of its closed form, and a cell
+# divides when the solver finds that its volume has reached the threshold.
+# The closed form is cheaper when there is one: this is the pattern for a
+# growth law without one, which only needs derivatives() to change.
+
+from cps import *
+from model_svd import GillespieChannel, DivisionChannel, prop_fcn, s
+import math, random, time
+
+class VolumeODEChannel(ODEChannel):
+    """ Integrates cell volume, stopping at the division threshold """
+    def __init__(self, tstep):
+        super(VolumeODEChannel, self).__init__(['v'], tstep, thresholds=[('v', 'v_thresh')])
+
+    def derivatives(self, t, v, cells, gdata):
+        return gdata.kV*v
+
+class ThresholdDivisionChannel(DivisionChannel):
+    """ Performs cell division once the volume channel reaches the threshold """
+    def scheduleEvent(self, cell, gdata, time, src):
+        return time if cell.v >= cell.v_thresh else float('inf')
+
+
+
+# Create the model...
+
+model = Model(n0=100, nmax=100)
+
+def my_init(gdata, cells):
+    gdata.kR = 0.8 #0.01
+    gdata.kP = 0.05 #1
+    gdata.gR = 0.1
+    gdata.gP = 0.002
+    gdata.kV = math.log(2)/1800
+    for cell in cells:
+        cell.x = [0, 0]
+        cell.v = math.exp(random.uniform(0,math.log(2)))
+        cell.v_thresh = 2
+model.addInitializer(['kP','kR','gP','gR','kV'], ['x','v','v_thresh'], my_init)
+
+def my_recorder(log, time, world, agents):
+    log['x0'].append([agent.x[0] for agent in agents])
+    log['x1'].append([agent.x[1] for agent in agents])
+    log['v'].append([agent.v for agent in agents])
+recorder = Recorder([], ['x0','x1','v'], my_recorder)
+model.addRecorder(recorder)
+
+rc = RecordingChannel(tstep=100, recorder=recorder)
+gc = GillespieChannel(propensity_fcn=prop_fcn, stoich_list=s)
+vc = VolumeODEChannel(tstep=100)
+dc = ThresholdDivisionChannel(prob=0.5)
+model.addWorldChannel(channel=rc)
+model.addAgentChannel(channel=gc)
+# the other channels fire it by this name; it reschedules the division
+model.addAgentChannel(channel=vc, name='VolumeChannel', sync=True, ac_dependents=[dc])
+model.addAgentChannel(channel=dc, ac_dependents=[gc,vc])
+
+
+
+if __name__=='__main__':
+    from os import path
+    DATA_PATH = path.join(path.abspath(path.pardir), 'data')
+
+    sim = AMSimulator(model, 0)
+
+    t0 = time.time()
+    sim.runSimulation(8000)
+    t = time.time()
+    print(t-t0)
+    recorder = sim.recorders[0]
+
+    savemat_snapshot(path.join(DATA_PATH, 'svd_ode_data.mat'), recorder)